@@ -0,0 +1,118 @@
+# agent_checkpoint.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHECKPOINT_PATH = os.path.join(current_dir, "cache", "agent_checkpoints.db")
+
+
+def run_key(music_filepath, model):
+    """
+    Key of an agent run: the music file's content and the agent model, so a resumed run
+    never continues a run made for a different song or model.
+    """
+    from analysis_cache import file_digest
+
+    digest = file_digest(music_filepath)
+    return hashlib.sha256(f"{digest}:{model}".encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        """
+        SQLite store of agent checkpoints.
+
+        - checkpoints: the graph state (messages) and the run context after every node.
+        - tool_calls: the result of every completed tool call and the changes it made to
+          the run context, so a call that is executed again after a resume can replay
+          them instead of repeating the work.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    run_key TEXT NOT NULL,
+                    step INTEGER NOT NULL,
+                    node TEXT NOT NULL,
+                    messages TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_key, step)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tool_calls (
+                    run_key TEXT NOT NULL,
+                    call_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    effects TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_key, call_id)
+                )
+            """)
+
+    def _connect(self):
+        # A connection per operation, tool calls are journaled from ToolNode worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def save(self, key, node, messages, context):
+        """
+        Store the state after a graph node. The step is the number of messages, so saving
+        the same state twice overwrites instead of adding a step.
+        """
+        data = json.dumps([message_to_dict(m) for m in messages])
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                (key, len(messages), node, data, json.dumps(context), time.time()),
+            )
+
+    def latest(self, key):
+        """
+        Return (node, messages, context) of the last checkpoint of a run, or None.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT node, messages, context FROM checkpoints WHERE run_key = ? ORDER BY step DESC LIMIT 1",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], messages_from_dict(json.loads(row[1])), json.loads(row[2])
+
+    def record_call(self, key, call_id, name, result, effects):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tool_calls VALUES (?, ?, ?, ?, ?, ?)",
+                (key, call_id, name, result, json.dumps(effects), time.time()),
+            )
+
+    def recorded_call(self, key, call_id):
+        """
+        Return (result, effects) of a completed tool call, or None.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT result, effects FROM tool_calls WHERE run_key = ? AND call_id = ?", (key, call_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def clear(self, key):
+        """
+        Drop every checkpoint and tool call of a run, before starting it from scratch.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE run_key = ?", (key,))
+            conn.execute("DELETE FROM tool_calls WHERE run_key = ?", (key,))
@@ -0,0 +1,88 @@
+# agent_history.py
+
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+
+KEEP_EXCHANGES = 4  # Tool exchanges kept verbatim in the prompt
+MAX_PAYLOAD_CHARS = 1500  # Larger tool results and arguments are replaced by a reference
+
+
+def estimate_tokens(messages):
+    """
+    Rough token count of a prompt (about four characters per token).
+    """
+    total = 0
+    for message in messages:
+        total += len(str(message.content))
+        for call in getattr(message, "tool_calls", None) or []:
+            total += len(str(call["args"]))
+    return total // 4
+
+
+def split_exchanges(messages):
+    """
+    Split the history into the leading messages (before the first tool call) and the
+    tool exchanges, each an AIMessage followed by the ToolMessages answering it.
+    """
+    head, exchanges = [], []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            exchanges.append([message])
+        elif exchanges and isinstance(message, ToolMessage):
+            exchanges[-1].append(message)
+        elif exchanges:
+            # Plain AI/human messages between tool calls travel with the exchange before them
+            exchanges[-1].append(message)
+        else:
+            head.append(message)
+    return head, exchanges
+
+
+def _reference(payload_store, ref, text, label):
+    payload_store[ref] = text
+    preview = " ".join(text[:160].split())
+    return f"[{label}: {len(text)} characters stored as '{ref}', preview: {preview} ...]"
+
+
+def compact_exchange(exchange, payload_store, max_payload_chars=MAX_PAYLOAD_CHARS):
+    """
+    Return a copy of an exchange with oversized tool results and string arguments
+    replaced by references into 'payload_store'.
+    """
+    compacted = []
+    for message in exchange:
+        if isinstance(message, ToolMessage) and len(str(message.content)) > max_payload_chars:
+            content = _reference(payload_store, message.tool_call_id, str(message.content),
+                                 f"result of {message.name or 'tool'}")
+            message = ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name)
+        elif isinstance(message, AIMessage) and message.tool_calls:
+            calls = []
+            for call in message.tool_calls:
+                args = {}
+                for name, value in call["args"].items():
+                    if isinstance(value, str) and len(value) > max_payload_chars:
+                        value = _reference(payload_store, f"{call['id']}:{name}", value, f"argument {name}")
+                    args[name] = value
+                calls.append({**call, "args": args})
+            message = AIMessage(content=message.content, tool_calls=calls)
+        compacted.append(message)
+    return compacted
+
+
+def build_prompt(system, messages, summary, payload_store,
+                 keep_exchanges=KEEP_EXCHANGES, max_payload_chars=MAX_PAYLOAD_CHARS):
+    """
+    Build the bounded prompt for one agent step.
+
+    The prompt is the system prompt, the messages before the first tool call (the task),
+    a running state summary, and the last 'keep_exchanges' tool exchanges with large
+    payloads replaced by references. Older exchanges are dropped, the summary carries
+    what they established.
+    """
+    head, exchanges = split_exchanges(messages)
+    prompt = [SystemMessage(content=system)] if system else []
+    prompt.extend(head)
+    if summary:
+        prompt.append(SystemMessage(content=f"Progress so far:\n{summary}"))
+    for exchange in exchanges[-keep_exchanges:] if keep_exchanges else []:
+        prompt.extend(compact_exchange(exchange, payload_store, max_payload_chars))
+    return prompt
@@ -0,0 +1,123 @@
+# analysis_cache.py
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(current_dir, "cache", "analysis")
+
+_digest_memo = {}
+# file_digest also runs on background threads (audio_cache.prepare_audio_in_background)
+_digest_lock = threading.Lock()
+
+
+def _digest_entry_path(filepath):
+    # One small file per audio path, so processes analyzing different tracks (see
+    # batch_analysis) never rewrite each other's digests
+    name = hashlib.sha256(filepath.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(CACHE_DIR, f"digest-{name}.json")
+
+
+def file_digest(filepath, chunk_size=1 << 20):
+    """
+    Return the SHA-256 of the file's content.
+
+    Digests are remembered per (path, size, mtime) in small files next to the cache,
+    so an unchanged file is only hashed once.
+    """
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    entry_path = _digest_entry_path(filepath)
+
+    with _digest_lock:
+        entry = _digest_memo.get(filepath)
+    if entry is None and os.path.exists(entry_path):
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+    if entry and entry.get("stamp") == stamp:
+        with _digest_lock:
+            _digest_memo[filepath] = entry
+        return entry["digest"]
+
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    entry = {"path": filepath, "stamp": stamp, "digest": digest}
+    with _digest_lock:
+        _digest_memo[filepath] = entry
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Threads of one process hashing the same file write their own temporary files
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(entry), f)
+        os.replace(tmp_path, entry_path)
+    except OSError:
+        pass
+    return digest
+
+
+def cache_key(filepath, params, version):
+    """
+    Build the cache key from the audio content hash, the analysis parameters and the
+    analysis version.
+    """
+    payload = json.dumps(
+        {"digest": file_digest(filepath), "params": params, "version": version},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.npz")
+
+
+def load(key):
+    """
+    Return the cached dict of arrays for 'key', or None on a miss.
+    """
+    path = _entry_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable analysis cache entry {path}: {e}")
+        return None
+
+
+def store(key, result):
+    """
+    Store a dict of arrays under 'key'. The entry is written to a temporary file first
+    so readers never see a partially written cache entry.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **result)
+    os.replace(tmp_path, path)
+
+
+def clear():
+    """
+    Remove every cached analysis entry.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        os.remove(os.path.join(CACHE_DIR, name))
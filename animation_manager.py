@@ -82,7 +82,6 @@ class AnimationManager:
         """
         Stop the current animation and clear the queue.
         """
-        print("Stopping all animations.")
         self.queue.clear()
         self.current_animation = None
         self.is_animating = False
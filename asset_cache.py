@@ -0,0 +1,295 @@
+# asset_cache.py
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+import pygame
+
+from config import BODY, PARTS
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+ATLAS_PATH = os.path.join(current_dir, "cache", "sprite_atlas.bin")
+ATLAS_VERSION = 1
+ATLAS_MAGIC = b"BUNNYATL"
+ATLAS_MAX_WIDTH = 1024
+PIXEL_ALIGN = 64  # Pixel data starts at a multiple of this offset in the file
+
+# Part name -> image file, relative to the repository
+PART_IMAGES = {
+    "body": "assets/body.png",
+    "head": "assets/head.png",
+    "left_arm": "assets/left_arm.png",
+    "right_arm": "assets/right_arm.png",
+    "left_leg": "assets/left_leg.png",
+    "right_leg": "assets/right_leg.png",
+}
+
+# Byte order of a converted surface's pixels in memory, by its (R, G, B, A) masks
+_BYTE_ORDERS = {
+    (0xFF0000, 0xFF00, 0xFF, 0xFF000000): "BGRA",
+    (0xFF, 0xFF00, 0xFF0000, 0xFF000000): "RGBA",
+}
+
+
+def target_pixel_format():
+    """
+    Masks and bit depth images are converted to, those of the display, or None when
+    there is no display and images keep the format they were decoded in.
+    """
+    if pygame.display.get_surface() is None:
+        return None
+    probe = pygame.Surface((1, 1), pygame.SRCALPHA, 32).convert_alpha()
+    return {"masks": list(probe.get_masks()), "bitsize": probe.get_bitsize()}
+
+
+def pivot_metadata():
+    """
+    Pivot data of every part from config, as stored in the atlas: the part's own pivot,
+    the body pivot it connects to and its rotation range.
+    """
+    parts = {"body": {"pivot": list(BODY["center"]), "pivots": {k: list(v) for k, v in BODY["pivots"].items()}}}
+    for name, data in PARTS.items():
+        parts[name] = {
+            "pivot": list(data["pivot"]),
+            "connect_to_pivot": data["connect_to_pivot"],
+            "rotation_range": list(data["rotation_range"]),
+        }
+    return parts
+
+
+def pack_shelves(sizes, max_width=ATLAS_MAX_WIDTH):
+    """
+    Place rectangles on shelves, tallest first: each shelf is filled left to right and
+    is as tall as its first rectangle.
+
+    Parameters:
+    - sizes: {name: (width, height)}.
+    - max_width: Width of the atlas, wider rectangles get a shelf of their own.
+
+    Returns ({name: (x, y, width, height)}, (atlas_width, atlas_height)).
+    """
+    rects = {}
+    x = y = shelf_height = width = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x and x + w > max_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        rects[name] = (x, y, w, h)
+        x += w
+        shelf_height = max(shelf_height, h)
+        width = max(width, x)
+    return rects, (width, y + shelf_height)
+
+
+class AssetRegistry:
+    def __init__(self, atlas_path=ATLAS_PATH, use_atlas=True):
+        """
+        Process-wide cache of decoded images.
+
+        The sprite's parts are packed into one atlas surface and handed out as subsurfaces
+        of it, so every sprite in the process shares the same pixels. The atlas is kept
+        in 'atlas_path' as raw pixels in the display's pixel format after a small JSON
+        header: a warm start maps the file and wraps it in a surface without decoding a
+        PNG or converting a pixel. The file is rebuilt when a part image or the pivot
+        data in config changes.
+
+        Parameters:
+        - atlas_path: The atlas cache file.
+        - use_atlas: Decode and convert every part separately, without the atlas file.
+        """
+        self.atlas_path = atlas_path
+        self.use_atlas = use_atlas
+        self.stats = {"images_decoded": 0, "atlas": None, "atlas_ms": 0.0}
+        self._images = {}
+        self._parts = None
+        self._atlas = None
+        self._mapping = None  # Keeps the mapped file alive as long as the atlas surface
+        self._metadata = None
+
+    def image(self, path):
+        """
+        Decode and convert an image once, later calls return the same surface.
+        """
+        path = os.path.abspath(os.path.join(current_dir, path))
+        surface = self._images.get(path)
+        if surface is None:
+            surface = pygame.image.load(path)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+            self.stats["images_decoded"] += 1
+            self._images[path] = surface
+        return surface
+
+    def part_images(self):
+        """
+        Return {part name: surface} for the sprite. The surfaces are shared, draw them but
+        do not modify them.
+        """
+        if self._parts is None:
+            if self.use_atlas:
+                self._parts = self._load_atlas()
+            else:
+                self._parts = {name: self.image(path) for name, path in PART_IMAGES.items()}
+        return dict(self._parts)
+
+    def pivots(self):
+        """
+        The pivot metadata stored with the atlas (see pivot_metadata()).
+        """
+        if self._metadata is None:
+            self.part_images()
+        return self._metadata["pivots"] if self._metadata else pivot_metadata()
+
+    def footprint(self):
+        """
+        Bytes of pixel memory held by the registry: the atlas (mapped from the file on a
+        warm start) and the separately loaded images.
+        """
+        surfaces = list(self._images.values()) + ([self._atlas] if self._atlas is not None else [])
+        return sum(s.get_pitch() * s.get_height() for s in surfaces)
+
+    # -------------------------
+    # Atlas file
+    # -------------------------
+
+    def _key(self):
+        # Part images by size and modification time, so a warm start reads no PNG at all.
+        # The display's pixel format is part of the key: an atlas written unconverted, or
+        # for another display, is not mapped as if it matched this one
+        stamps = {}
+        for name, path in PART_IMAGES.items():
+            stat = os.stat(os.path.join(current_dir, path))
+            stamps[name] = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+        payload = json.dumps({"images": stamps, "pivots": pivot_metadata(), "target": target_pixel_format(),
+                              "version": ATLAS_VERSION}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_atlas(self):
+        start = time.perf_counter()
+        key = self._key()
+        parts = self._read_atlas(key)
+        self.stats["atlas"] = "hit"
+        if parts is None:
+            parts = self._build_atlas(key)
+            self.stats["atlas"] = "built"
+        self.stats["atlas_ms"] = (time.perf_counter() - start) * 1000
+        return parts
+
+    def _read_atlas(self, key):
+        if not os.path.exists(self.atlas_path):
+            return None
+        mapping = None
+        try:
+            with open(self.atlas_path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, header_length = struct.unpack_from("<8sI", mapping, 0)
+            if magic != ATLAS_MAGIC:
+                mapping.close()
+                return None
+            header = json.loads(bytes(mapping[12:12 + header_length]))
+        except (OSError, ValueError, struct.error):
+            if mapping is not None:
+                mapping.close()
+            return None
+        if header.get("key") != key:
+            mapping.close()
+            return None
+
+        width, height = header["size"]
+        offset = header["offset"]
+        # frombuffer wraps the mapped pixels without copying them; the mapping is
+        # read-only and nothing draws onto the atlas
+        atlas = pygame.image.frombuffer(memoryview(mapping)[offset:offset + width * height * 4], (width, height),
+                                        header["format"])
+        self._mapping = mapping
+        self._atlas = atlas
+        self._metadata = header
+        return {name: atlas.subsurface(pygame.Rect(rect)) for name, rect in header["rects"].items()}
+
+    def _build_atlas(self, key):
+        images = {}
+        for name, path in PART_IMAGES.items():
+            images[name] = pygame.image.load(os.path.join(current_dir, path))
+            self.stats["images_decoded"] += 1
+        rects, size = pack_shelves({name: image.get_size() for name, image in images.items()})
+
+        atlas = pygame.Surface(size, pygame.SRCALPHA, 32)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        atlas.fill((0, 0, 0, 0))
+        for name, image in images.items():
+            atlas.blit(image, rects[name][:2], special_flags=pygame.BLEND_RGBA_MAX)
+
+        pixel_format = _BYTE_ORDERS.get(tuple(atlas.get_masks()), "RGBA")
+        header = {
+            "key": key,
+            "size": list(size),
+            "format": pixel_format,
+            "rects": {name: list(rect) for name, rect in rects.items()},
+            "pivots": pivot_metadata(),
+        }
+        self._write_atlas(header, pygame.image.tostring(atlas, pixel_format))
+        self._atlas = atlas
+        self._metadata = header
+        return {name: atlas.subsurface(pygame.Rect(rect)) for name, rect in rects.items()}
+
+    def _write_atlas(self, header, pixels):
+        # The offset depends on the header length, which depends on the offset: reserve
+        # room for its digits first
+        header["offset"] = 0
+        header_length = len(json.dumps(header)) + 16
+        header["offset"] = -(-(12 + header_length) // PIXEL_ALIGN) * PIXEL_ALIGN
+        data = json.dumps(header).encode("utf-8").ljust(header_length)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.atlas_path)), exist_ok=True)
+            tmp_path = f"{self.atlas_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack("<8sI", ATLAS_MAGIC, header_length))
+                f.write(data)
+                f.write(b"\0" * (header["offset"] - 12 - header_length))
+                f.write(pixels)
+            # Replaced, not rewritten, so processes that mapped the old file keep valid pixels
+            os.replace(tmp_path, self.atlas_path)
+        except OSError as e:
+            print(f"Could not write the sprite atlas '{self.atlas_path}': {e}")
+
+
+_registry = None
+
+
+def get_registry():
+    """
+    The process-wide AssetRegistry.
+    """
+    global _registry
+    if _registry is None:
+        _registry = AssetRegistry()
+    return _registry
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Build or inspect the sprite atlas cache.")
+        parser.add_argument("--rebuild", action="store_true", help="Delete the atlas file and build it again.")
+        args = parser.parse_args()
+
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        if args.rebuild and os.path.exists(ATLAS_PATH):
+            os.remove(ATLAS_PATH)
+        registry = get_registry()
+        parts = registry.part_images()
+        print(f"Atlas {registry.stats['atlas']} in {registry.stats['atlas_ms']:.2f}ms: "
+              f"{registry._atlas.get_width()}x{registry._atlas.get_height()} "
+              f"{registry._metadata['format']}, {registry.footprint() / 1024:.1f}KB, '{ATLAS_PATH}'")
+        for name, surface in parts.items():
+            x, y = surface.get_offset()
+            print(f"  {name:<10} {surface.get_width():>4}x{surface.get_height():<4} at ({x}, {y})")
+
+    main()
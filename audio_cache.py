@@ -0,0 +1,139 @@
+# audio_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from analysis_cache import file_digest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+AUDIO_CACHE_DIR = os.path.join(current_dir, "cache", "audio")
+AUDIO_CACHE_VERSION = 1
+
+# Audio encoding per output container, by the extension of the rendered video. The
+# encoded track is stored in a container that can be stream-copied into the output.
+AUDIO_FORMATS = {
+    ".webm": {"acodec": "libvorbis", "extension": ".webm"},
+    ".mp4": {"acodec": "aac", "extension": ".m4a"},
+}
+DEFAULT_FORMAT = ".mp4"  # Other containers take the AAC track, like mux_audio always did
+
+# One encode at a time per process: a recording that stops while its audio is still
+# being prepared waits for it instead of encoding it a second time
+_encode_lock = threading.Lock()
+
+
+def audio_format(output_path):
+    extension = os.path.splitext(output_path)[1].lower()
+    return AUDIO_FORMATS.get(extension, AUDIO_FORMATS[DEFAULT_FORMAT])
+
+
+def cached_audio_path(audio_path, output_path):
+    """
+    Where the encoding of 'audio_path' for videos like 'output_path' is cached: keyed by
+    the audio's content hash, the codec and the cache version.
+    """
+    settings = audio_format(output_path)
+    payload = json.dumps({"digest": file_digest(audio_path), "acodec": settings["acodec"],
+                          "version": AUDIO_CACHE_VERSION}, sort_keys=True)
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return os.path.join(AUDIO_CACHE_DIR, f"{key}{settings['extension']}")
+
+
+def prepare_audio(audio_path, output_path):
+    """
+    Encode a song once for the container of 'output_path' and return the cached file.
+    Later calls, from this process or any other, return the cached file right away.
+    """
+    path = cached_audio_path(audio_path, output_path)
+    if os.path.exists(path):
+        return path
+    import ffmpeg
+
+    with _encode_lock:
+        if os.path.exists(path):
+            return path
+        os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        # Written under a temporary name and moved in place, so a render in another
+        # process never copies a half written track
+        tmp_path = f"{path}.{os.getpid()}.tmp{os.path.splitext(path)[1]}"
+        try:
+            (ffmpeg.input(audio_path)
+             .output(tmp_path, vn=None, acodec=audio_format(output_path)["acodec"])
+             .overwrite_output()
+             .run(quiet=True))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+
+def prepare_audio_in_background(audio_path, output_path):
+    """
+    Start prepare_audio in a daemon thread, so the encode happens while something else
+    (a recording, a render) runs. Errors are printed, the mux encodes again if needed.
+    """
+    def prepare():
+        try:
+            prepare_audio(audio_path, output_path)
+        except Exception as e:
+            print(f"Could not prepare the audio of '{audio_path}': {e}")
+
+    thread = threading.Thread(target=prepare, name="prepare-audio", daemon=True)
+    thread.start()
+    return thread
+
+
+def mux_cached_audio(video_path, audio_path, output_path, duration, vcodec="copy"):
+    """
+    Combine a video with the first 'duration' seconds of a song. The song comes from the
+    cache (see prepare_audio) and is stream-copied, so its length is cut at the nearest
+    packet boundary instead of re-encoding it.
+
+    Parameters:
+    - video_path: The rendered video without audio.
+    - audio_path: The song, in any format ffmpeg reads.
+    - output_path: The muxed video, its extension picks the audio codec.
+    - duration: Seconds of audio to keep.
+    - vcodec: Video codec of the output, 'copy' keeps the rendered stream.
+    """
+    import ffmpeg
+
+    video = ffmpeg.input(video_path)
+    audio = ffmpeg.input(prepare_audio(audio_path, output_path), t=duration)
+    ffmpeg.output(video, audio, output_path, vcodec=vcodec, acodec="copy").overwrite_output().run(quiet=True)
+
+
+def clear():
+    """
+    Remove every cached track.
+    """
+    if not os.path.isdir(AUDIO_CACHE_DIR):
+        return
+    for name in os.listdir(AUDIO_CACHE_DIR):
+        os.remove(os.path.join(AUDIO_CACHE_DIR, name))
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Encode a song once per output container.")
+        parser.add_argument("audio", nargs="?", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+        parser.add_argument("--container", action="append", choices=sorted(AUDIO_FORMATS),
+                            help="Output containers to prepare, all of them by default.")
+        parser.add_argument("--clear", action="store_true", help="Remove the cached tracks first.")
+        args = parser.parse_args()
+
+        if args.clear:
+            clear()
+        for extension in args.container or sorted(AUDIO_FORMATS):
+            start = time.perf_counter()
+            path = prepare_audio(args.audio, f"output{extension}")
+            print(f"{extension:<6} {audio_format(f'output{extension}')['acodec']:<10} '{path}' "
+                  f"({time.perf_counter() - start:.2f}s)")
+
+    main()
@@ -0,0 +1,206 @@
+# batch_analysis.py
+
+import io
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from music_analysis import DEFAULT_TIER, PHRASE_LENGTH, analyze_track_cached
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(current_dir, "output", "music_library.db")
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aiff")
+
+
+def collect_tracks(source):
+    """
+    Resolve a directory or a manifest into a sorted list of audio file paths.
+
+    Parameters:
+    - source: A directory (searched recursively for AUDIO_EXTENSIONS), a .json manifest
+      holding a list of paths, or a text manifest with one path per line. Relative
+      paths in a manifest are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        if source.endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [os.path.normpath(os.path.join(base_dir, entry)) for entry in entries]
+
+
+def _analyze_one(filepath, phrase_length, tier):
+    # Runs in a worker process; errors are returned, never raised, so one bad file
+    # cannot take down the batch
+    start = time.perf_counter()
+    try:
+        analysis = analyze_track_cached(filepath, phrase_length=phrase_length, tier=tier)
+        return filepath, analysis, None, time.perf_counter() - start
+    except Exception as e:
+        return filepath, None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def open_store(store_path=DEFAULT_STORE):
+    """
+    Open (and create if needed) the track store, one row per analyzed track.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    conn = sqlite3.connect(store_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tracks (
+            path TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            error TEXT,
+            tier TEXT,
+            tempo REAL,
+            duration REAL,
+            num_beats INTEGER,
+            num_phrases INTEGER,
+            seconds REAL,
+            analyzed_at REAL,
+            arrays BLOB
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS tracks_tempo ON tracks (tempo)")
+    return conn
+
+
+def _write_row(conn, filepath, analysis, error, seconds, tier):
+    if analysis is None:
+        conn.execute(
+            "INSERT OR REPLACE INTO tracks (path, status, error, tier, seconds, analyzed_at) "
+            "VALUES (?, 'failed', ?, ?, ?, ?)",
+            (filepath, error, tier, seconds, time.time()),
+        )
+        return
+
+    # Tempo, beats and phrase table are kept as one npz blob per row
+    arrays = {
+        name: analysis[name]
+        for name in ("tempo", "beat_times", "phrase_start", "phrase_end", "phrase_beats", "phrase_energy")
+    }
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    frame_times = analysis["frame_times"]
+    conn.execute(
+        "INSERT OR REPLACE INTO tracks VALUES (?, 'ok', NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            filepath,
+            tier,
+            float(analysis["tempo"]),
+            float(frame_times[-1]) if len(frame_times) else 0.0,
+            len(analysis["beat_times"]),
+            len(analysis["phrase_start"]),
+            seconds,
+            time.time(),
+            buffer.getvalue(),
+        ),
+    )
+
+
+def load_track(filepath, store_path=DEFAULT_STORE):
+    """
+    Return the stored arrays (tempo, beat_times, phrase table) of a track, or None.
+    """
+    conn = open_store(store_path)
+    try:
+        row = conn.execute(
+            "SELECT arrays FROM tracks WHERE path = ? AND status = 'ok'", (filepath,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    with np.load(io.BytesIO(row[0]), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def analyze_library(paths, store_path=DEFAULT_STORE, workers=None, phrase_length=PHRASE_LENGTH, tier=DEFAULT_TIER):
+    """
+    Analyze many tracks across a process pool and record them in the track store.
+
+    Parameters:
+    - paths: Audio file paths, see collect_tracks.
+    - store_path: SQLite file that receives one row per track.
+    - workers: Number of worker processes (defaults to the CPU count).
+    - phrase_length, tier: Passed to analyze_track_cached.
+
+    Returns a summary dict with the number of tracks, failures, elapsed seconds and
+    throughput in tracks per minute.
+    """
+    conn = open_store(store_path)
+    total = len(paths)
+    failed = 0
+    start = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_analyze_one, path, phrase_length, tier): path for path in paths}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    filepath, analysis, error, seconds = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (crash, out of memory) and the pool fails every file it
+                    # had not finished; they are recorded as failed and the batch goes on
+                    filepath, analysis, error, seconds = futures[future], None, f"BrokenProcessPool: {e}", 0.0
+                _write_row(conn, filepath, analysis, error, seconds, tier)
+                conn.commit()
+
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed * 60 if elapsed > 0 else 0.0
+                if error:
+                    failed += 1
+                    status = f"FAILED ({error})"
+                else:
+                    status = f"ok {float(analysis['tempo']):.1f} BPM"
+                print(f"[{done}/{total}] {os.path.basename(filepath)}: {status} "
+                      f"in {seconds:.2f}s, {rate:.1f} tracks/min")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "tracks": total,
+        "failed": failed,
+        "seconds": elapsed,
+        "tracks_per_minute": total / elapsed * 60 if elapsed > 0 else 0.0,
+    }
+    print(f"Analyzed {total - failed}/{total} tracks in {elapsed:.1f}s "
+          f"({summary['tracks_per_minute']:.1f} tracks/min), results in '{store_path}'.")
+    return summary
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Analyze a directory or manifest of music files.")
+        parser.add_argument("source", help="Directory of audio files or a manifest (.json list or one path per line).")
+        parser.add_argument("--store", default=DEFAULT_STORE)
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--phrase-length", type=int, default=PHRASE_LENGTH)
+        parser.add_argument("--tier", default=DEFAULT_TIER)
+        args = parser.parse_args()
+
+        paths = collect_tracks(args.source)
+        if not paths:
+            print(f"No audio files found in '{args.source}'.")
+            return
+        analyze_library(paths, args.store, args.workers, args.phrase_length, args.tier)
+
+    main()
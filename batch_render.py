@@ -0,0 +1,217 @@
+# batch_render.py
+
+import glob
+import json
+import os
+import signal
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(current_dir, "output", "batch")
+
+# State of a worker process (or of this process for sequential batches): one headless
+# pygame context and one sprite, reset between choreographies
+_worker = {}
+
+
+def expand_inputs(patterns):
+    """
+    Expand files and glob patterns into a sorted list of unique choreography paths.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            path = os.path.abspath(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def output_paths(paths, output_dir, extension=".mp4"):
+    """
+    Output video of every choreography, unique within the batch: files with the same
+    name in different directories (a/m.json, b/m.json) are prefixed with their parent
+    directory, and an index is added if that still collides.
+
+    Returns {movements path: output path}.
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    outputs = {}
+    taken = set()
+    for path, name in zip(paths, names):
+        if names.count(name) > 1:
+            name = f"{os.path.basename(os.path.dirname(path))}_{name}"
+        candidate, index = name, 1
+        while candidate in taken:
+            index += 1
+            candidate = f"{name}_{index}"
+        taken.add(candidate)
+        outputs[path] = os.path.join(output_dir, candidate + extension)
+    return outputs
+
+
+def _init_worker():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.chdir(current_dir)
+
+    from config import WINDOW_HEIGHT, WINDOW_WIDTH
+    from offline_render import init_headless
+    from sprite import BunnySprite
+
+    if "bunny" not in _worker:
+        init_headless()
+        # SDL catches SIGTERM, which would leave Pool.terminate() waiting on the workers forever
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _worker["bunny"] = BunnySprite(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 100)
+
+
+def render_job(job):
+    """
+    Render one choreography with the process' shared sprite, muxing the audio if given.
+
+    'job' is a dict with movements_path, output, audio, fps, max_seconds and debug.
+    Returns a result row: path, output, frames, seconds, fps, error.
+    """
+    from offline_render import load_choreography, mux_audio, render_video
+
+    _init_worker()
+    bunny = _worker["bunny"]
+    result = {"movements": job["movements_path"], "output": job["output"], "frames": 0, "seconds": 0.0,
+              "render_seconds": 0.0, "fps": 0.0, "worker": os.getpid(), "error": None}
+    start = time.perf_counter()
+    video_path = job["output"] if not job["audio"] else f"{job['output']}.video.mp4"
+    try:
+        movements = load_choreography(job["movements_path"])
+        bunny.reset()
+        frames = render_video(movements, video_path, job["fps"], max_seconds=job["max_seconds"],
+                              debug=job["debug"], bunny=bunny)
+        result["render_seconds"] = time.perf_counter() - start
+        if job["audio"]:
+            mux_audio(video_path, job["audio"], job["output"], frames / job["fps"])
+            os.remove(video_path)
+        result["frames"] = frames
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        if video_path != job["output"] and os.path.exists(video_path):
+            os.remove(video_path)
+    result["seconds"] = time.perf_counter() - start
+    if result["frames"]:
+        result["fps"] = result["frames"] / result["render_seconds"]
+    return result
+
+
+def render_batch(paths, output_dir=DEFAULT_OUTPUT_DIR, audio=None, fps=None, max_seconds=None, debug=True,
+                 workers=1, on_result=None):
+    """
+    Render every choreography in 'paths' to '<output_dir>/<name>.mp4' (see output_paths()).
+
+    With workers=1 the jobs run one after another in this process, sharing one pygame
+    context, the sprite atlas and one sprite that is reset between jobs. With more
+    workers each spawned process does the same for its share of the jobs.
+
+    Parameters:
+    - paths: Choreography files (see expand_inputs()).
+    - output_dir: Where the videos go.
+    - audio: Optional song muxed into every video, trimmed to its length. It is encoded
+      once (see audio_cache.py) and copied into every video.
+    - fps, max_seconds, debug: Render settings (see offline_render.render_video).
+    - workers: Number of processes.
+    - on_result: Called with every result row as soon as it is done.
+
+    Returns the result rows in the order of 'paths', which are also written to
+    '<output_dir>/batch_summary.json'.
+    """
+    from config import FPS
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = output_paths(paths, output_dir)
+    jobs = [{
+        "movements_path": path,
+        "output": outputs[path],
+        "audio": os.path.abspath(audio) if audio else None,
+        "fps": fps or FPS,
+        "max_seconds": max_seconds,
+        "debug": debug,
+    } for path in paths]
+
+    if audio and jobs:
+        # Encoded once up front, every job then stream-copies the cached track
+        from audio_cache import prepare_audio
+
+        try:
+            prepare_audio(audio, jobs[0]["output"])
+        except Exception as e:
+            print(f"Could not prepare the audio of '{audio}': {e}")
+
+    results = {}
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            results[job["movements_path"]] = render_job(job)
+            if on_result:
+                on_result(results[job["movements_path"]])
+    else:
+        import multiprocessing
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(workers, len(jobs)), initializer=_init_worker) as pool:
+            for result in pool.imap_unordered(render_job, jobs):
+                results[result["movements"]] = result
+                if on_result:
+                    on_result(result)
+            pool.close()
+            pool.join()
+    results = [results[job["movements_path"]] for job in jobs]
+    with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"seconds": time.perf_counter() - start, "workers": workers, "results": results}, f, indent=2)
+    return results
+
+
+def summary_table(results, elapsed):
+    """
+    Printable table of the render times, with totals over the batch.
+    """
+    lines = [f"{'choreography':<32}{'frames':>8}{'render s':>10}{'total s':>10}{'fps':>8}  status"]
+    for r in results:
+        status = "ok" if not r["error"] else f"FAILED {r['error']}"
+        lines.append(f"{os.path.basename(r['movements']):<32}{r['frames']:>8}{r['render_seconds']:>10.2f}"
+                     f"{r['seconds']:>10.2f}{r['fps']:>8.1f}  {status}")
+    frames = sum(r["frames"] for r in results)
+    failed = sum(bool(r["error"]) for r in results)
+    lines.append(f"{len(results)} choreographies, {failed} failed, {frames} frames in {elapsed:.2f}s "
+                 f"({frames / elapsed if elapsed else 0.0:.1f} fps overall)")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import sys
+
+        parser = argparse.ArgumentParser(description="Render many choreographies in one process (or a few).")
+        parser.add_argument("inputs", nargs="*", default=[os.path.join(current_dir, "output", "movements*.json")],
+                            help="Choreography files or glob patterns.")
+        parser.add_argument("--audio", help="Song muxed into every video.")
+        parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+        parser.add_argument("--fps", type=int)
+        parser.add_argument("--max-seconds", type=float)
+        parser.add_argument("--no-debug", action="store_true", help="Do not draw the pivots and body rectangle.")
+        parser.add_argument("--workers", type=int, default=1, help="Render in this many processes.")
+        args = parser.parse_args()
+
+        paths = expand_inputs(args.inputs)
+        if not paths:
+            print("No choreographies match the inputs.")
+            sys.exit(1)
+        start = time.perf_counter()
+        results = render_batch(paths, args.output_dir, args.audio, args.fps, args.max_seconds, not args.no_debug,
+                               args.workers, on_result=lambda r: print(f"{os.path.basename(r['movements'])}: "
+                                                                       f"{'ok' if not r['error'] else r['error']}"))
+        elapsed = time.perf_counter() - start
+        print(summary_table(results, elapsed))
+        if any(r["error"] for r in results):
+            sys.exit(1)
+
+    main()
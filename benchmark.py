@@ -0,0 +1,434 @@
+# benchmark.py
+
+import contextlib
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Headless and silent: the benchmarks never open a window or an audio device
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(current_dir, "output", "benchmark.json")
+BASELINE_PATH = os.path.join(current_dir, "benchmarks", "baseline.json")  # Tracked, so every checkout compares
+REGRESSION_THRESHOLD = 0.15  # Fractional drop in ops/s that counts as a regression
+
+RESOLUTIONS = ((640, 360), (1200, 800), (1920, 1080))
+ANIMATION_COUNTS = (1, 10, 100, 1000)
+BLIT_ANGLES = (0, 10, 30, 45)
+
+
+# -------------------------
+# Measurement
+# -------------------------
+
+def measure(op, min_time=0.5, min_runs=5, max_runs=100000, warmup=2):
+    """
+    Time repeated calls of 'op' for at least 'min_time' seconds.
+
+    The timed loop runs without tracemalloc, the peak of Python allocations is measured
+    in one extra traced call so it does not slow down the timings.
+
+    Returns ops_per_sec, mean/p50/p99 latency in milliseconds, runs and peak_kb.
+    """
+    for _ in range(warmup):
+        op()
+
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        op()
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times)
+    return {
+        "ops_per_sec": float(len(times) / times.sum()),
+        "mean_ms": float(times.mean() * 1000),
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p99_ms": float(np.percentile(times, 99) * 1000),
+        "runs": len(times),
+        "peak_kb": peak / 1024,
+    }
+
+
+# -------------------------
+# Cases
+# -------------------------
+# Every case is a function returning a list of (name, op) pairs; setup happens in the
+# case function and is not timed.
+
+def _pygame():
+    import pygame
+
+    if not pygame.get_init():
+        pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+    return pygame
+
+
+def _sprite():
+    from config import WINDOW_HEIGHT, WINDOW_WIDTH
+    from sprite import BunnySprite
+
+    _pygame()
+    return BunnySprite(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 100)
+
+
+def case_blit_rotate():
+    from config import BODY
+    from helpers import blit_rotate
+
+    pygame = _pygame()
+    bunny = _sprite()
+    surface = pygame.Surface((1200, 800))
+    parts = {"body": bunny.body, **bunny.parts}
+    ops = []
+    for name, part in parts.items():
+        pivot = part.pivot if name != "body" else BODY["center"]
+        for angle in BLIT_ANGLES:
+            ops.append((f"blit_rotate[{name},{angle}]",
+                        lambda part=part, pivot=pivot, angle=angle: blit_rotate(surface, part.image, (600, 400), pivot, angle)))
+    return ops
+
+
+def case_sprite_create():
+    # A new sprite shares the registry's part images, the first one maps or builds the atlas
+    from asset_cache import PART_IMAGES, AssetRegistry
+    from sprite import BunnySprite
+
+    _pygame()
+
+    def cold():
+        registry = AssetRegistry(use_atlas=False)
+        return {name: registry.image(path) for name, path in PART_IMAGES.items()}
+
+    def warm_atlas():
+        return AssetRegistry().part_images()
+    return [
+        ("sprite_create[shared]", lambda: BunnySprite(600, 500)),
+        ("asset_load[png_decode]", cold),
+        ("asset_load[atlas_mmap]", warm_atlas),
+    ]
+
+
+def case_sprite_update():
+    from animation import BodyPartAnimation
+
+    ops = []
+    for count in ANIMATION_COUNTS:
+        bunny = _sprite()
+        names = list(bunny.parts)
+        # Animations that never complete, so every update sees 'count' active animations
+        bunny.body_part_animations = [
+            BodyPartAnimation(names[i % len(names)], 0.0, 30.0, 1e9) for i in range(count)
+        ]
+        ops.append((f"sprite_update[{count}]", lambda bunny=bunny: bunny.update(1 / 60)))
+    return ops
+
+
+def case_sprite_draw():
+    from config import BACKGROUND_COLOR
+
+    pygame = _pygame()
+    ops = []
+    for width, height in RESOLUTIONS:
+        from sprite import BunnySprite
+
+        bunny = BunnySprite(width // 2, height // 2 + 100)
+        for part, angle in zip(bunny.parts.values(), (8, -30, 30, 20, -20)):
+            part.angle = angle
+        surface = pygame.Surface((width, height))
+
+        def draw(bunny=bunny, surface=surface):
+            surface.fill(BACKGROUND_COLOR)
+            bunny.draw(surface, debug=True)
+        ops.append((f"sprite_draw[{width}x{height}]", draw))
+    return ops
+
+
+def case_quality_levels():
+    # One drawn frame at every level of the adaptive quality controller, in the window's size
+    from config import BACKGROUND_COLOR, WINDOW_HEIGHT, WINDOW_WIDTH
+    from quality_controller import LEVEL_SETTINGS
+
+    pygame = _pygame()
+    bunny = _sprite()
+    for part, angle in zip(bunny.parts.values(), (8, -30, 30, 20, -20)):
+        part.angle = angle
+    screen = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    ops = []
+    for name, settings in LEVEL_SETTINGS.items():
+        scale = settings["scale"]
+        low_res = pygame.Surface((int(WINDOW_WIDTH * scale), int(WINDOW_HEIGHT * scale)))
+
+        def draw(settings=settings, scale=scale, low_res=low_res):
+            target = screen if scale == 1.0 else low_res
+            target.fill(BACKGROUND_COLOR)
+            bunny.draw(target, settings["debug"], settings["rotation_step"], scale)
+            if scale != 1.0:
+                pygame.transform.scale(low_res, (WINDOW_WIDTH, WINDOW_HEIGHT), screen)
+        ops.append((f"quality_draw[{name}]", draw))
+    return ops
+
+
+def _frame(pygame, width, height):
+    from sprite import BunnySprite
+
+    bunny = BunnySprite(width // 2, height // 2 + 100)
+    surface = pygame.Surface((width, height))
+    surface.fill((255, 255, 255))
+    bunny.draw(surface)
+    return surface
+
+
+def case_frame_capture():
+    import cv2
+
+    pygame = _pygame()
+    ops = []
+    for width, height in RESOLUTIONS:
+        surface = _frame(pygame, width, height)
+
+        # The capture path of main.py
+        def capture(surface=surface, width=width, height=height):
+            string_image = pygame.image.tostring(surface, "RGB")
+            frame = np.frombuffer(string_image, dtype=np.uint8).reshape((height, width, 3))
+            return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        ops.append((f"frame_capture[{width}x{height}]", capture))
+    return ops
+
+
+@contextlib.contextmanager
+def case_video_encode():
+    import cv2
+
+    pygame = _pygame()
+    from config import FPS, WINDOW_HEIGHT, WINDOW_WIDTH
+
+    surface = _frame(pygame, WINDOW_WIDTH, WINDOW_HEIGHT)
+    frame = cv2.cvtColor(
+        np.frombuffer(pygame.image.tostring(surface, "RGB"), dtype=np.uint8).reshape((WINDOW_HEIGHT, WINDOW_WIDTH, 3)),
+        cv2.COLOR_RGB2BGR,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (WINDOW_WIDTH, WINDOW_HEIGHT))
+        try:
+            yield [(f"video_encode[{WINDOW_WIDTH}x{WINDOW_HEIGHT},mp4v]", lambda: writer.write(frame))]
+        finally:
+            writer.release()
+
+
+def case_json_load():
+    ops = []
+    for path in sorted(glob.glob(os.path.join(current_dir, "output", "*.json"))):
+        name = os.path.basename(path)
+        if name.startswith("benchmark"):
+            continue
+
+        def load(path=path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        ops.append((f"json_load[{name}]", load))
+    return ops
+
+
+def synthetic_wav(path, seconds=30.0, bpm=90.0, sr=22050):
+    """
+    Write a click track with a bass tone and noise, enough for beat tracking to lock on.
+    """
+    import soundfile as sf
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    y = 0.05 * np.sin(2 * np.pi * 110 * t) + 0.01 * rng.standard_normal(len(t))
+    click = np.exp(-np.arange(int(0.05 * sr)) / (0.01 * sr)) * np.sin(2 * np.pi * 1000 * np.arange(int(0.05 * sr)) / sr)
+    for beat in np.arange(0.5, seconds - 0.1, 60.0 / bpm):
+        i = int(beat * sr)
+        y[i:i + len(click)] += 0.8 * click[:len(y) - i]
+    sf.write(path, y.astype(np.float32), sr)
+    return path
+
+
+@contextlib.contextmanager
+def case_analyze_music():
+    # The analysis behind the agent's analyze_music tool, on a cache miss and a cache hit;
+    # the tool itself also rewrites output/music_analysis_debug.txt
+    from music_analysis import analyze_track, analyze_track_cached
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = synthetic_wav(os.path.join(tmp_dir, "synthetic.wav"))
+        analyze_track_cached(path)
+        yield [
+            ("analyze_music[synthetic 30s]", lambda: analyze_track(path)),
+            ("analyze_music_cached[synthetic 30s]", lambda: analyze_track_cached(path)),
+        ]
+
+
+def case_frame_profiler():
+    # Cost of profiling one frame of the main.py loop, compare with the 1/FPS budget
+    from frame_profiler import FrameProfiler
+
+    profiler = FrameProfiler()
+    stages = ("tick", "events", "update", "draw", "capture", "encode", "flip")
+
+    def frame():
+        profiler.start_frame()
+        for stage in stages:
+            profiler.mark(stage)
+        profiler.end_frame()
+    return [(f"frame_profiler[{len(stages)} stages]", frame)]
+
+
+def case_startup():
+    # Wall time of a fresh interpreter loading each bunny.py subcommand, as the user waits
+    # for it: 'python' alone is the floor every command pays
+    import subprocess
+
+    def command(*args):
+        return lambda: subprocess.run([sys.executable, *args], cwd=current_dir, check=True,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    ops = [("startup[python]", command("-c", "pass"))]
+    for name, args in (("play", ["play"]), ("render", ["render"]), ("analyze", ["analyze", "song.wav"]),
+                       ("generate", ["generate"])):
+        ops.append((f"startup[{name}]", command("bunny.py", "--startup", *args)))
+    return ops
+
+
+CASES = {
+    "blit_rotate": case_blit_rotate,
+    "sprite_create": case_sprite_create,
+    "sprite_update": case_sprite_update,
+    "sprite_draw": case_sprite_draw,
+    "quality_levels": case_quality_levels,
+    "frame_capture": case_frame_capture,
+    "video_encode": case_video_encode,
+    "json_load": case_json_load,
+    "analyze_music": case_analyze_music,
+    "frame_profiler": case_frame_profiler,
+    "startup": case_startup,
+}
+
+# Slow cases get a lower minimum run count
+MIN_RUNS = {"analyze_music": 3, "startup": 3}
+
+
+# -------------------------
+# Runner
+# -------------------------
+
+def run_benchmarks(selected=None, min_time=0.5):
+    """
+    Run the selected case groups (all by default) and return the results document.
+
+    A case returns its list of (name, op), or is a context manager yielding it when
+    the ops need files or writers that are cleaned up after timing.
+    """
+    import cv2
+    import pygame
+
+    os.chdir(current_dir)  # The sprite loads its images from relative paths
+    results = {}
+    for group, case in CASES.items():
+        if selected and group not in selected:
+            continue
+        ops = case()
+        with ops if isinstance(ops, contextlib.AbstractContextManager) else contextlib.nullcontext(ops) as ops:
+            for name, op in ops:
+                stats = measure(op, min_time=min_time, min_runs=MIN_RUNS.get(group, 5))
+                results[name] = stats
+                print(f"{name:<44} {stats['ops_per_sec']:>10.1f} ops/s  p50 {stats['p50_ms']:>8.3f}ms  "
+                      f"p99 {stats['p99_ms']:>8.3f}ms  peak {stats['peak_kb']:>9.1f}KB")
+    return {
+        "created_at": time.time(),
+        "machine": {
+            "platform": platform.platform(),
+            "python": sys.version.split()[0],
+            "pygame": pygame.version.ver,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare ops/s against a baseline document.
+
+    Returns a list of (name, current, baseline, change) for every benchmark in both,
+    and the names of those slower than the baseline by more than 'threshold'.
+    """
+    rows, regressions = [], []
+    for name, stats in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        change = stats["ops_per_sec"] / base["ops_per_sec"] - 1.0
+        rows.append((name, stats["ops_per_sec"], base["ops_per_sec"], change))
+        if change < -threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Run the render and analysis benchmarks headless.")
+        parser.add_argument("groups", nargs="*", help=f"Case groups to run, any of: {', '.join(CASES)}.")
+        parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to time every benchmark for.")
+        parser.add_argument("--output", default=RESULTS_PATH)
+        parser.add_argument("--baseline", default=BASELINE_PATH)
+        parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+        parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+        args = parser.parse_args()
+
+        unknown = set(args.groups) - set(CASES)
+        if unknown:
+            parser.error(f"Unknown case groups: {', '.join(sorted(unknown))}")
+
+        results = run_benchmarks(args.groups, args.min_time)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to '{args.output}'.")
+
+        if args.save_baseline:
+            os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"Baseline saved to '{args.baseline}'.")
+            return
+
+        if not os.path.exists(args.baseline):
+            print("No baseline to compare against, run with --save-baseline first.")
+            return
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared with the baseline (regression threshold {args.threshold:.0%}):")
+        for name, current, base, change in rows:
+            flag = "REGRESSION" if name in regressions else ""
+            print(f"{name:<44} {current:>10.1f} vs {base:>10.1f} ops/s {change:>+8.1%} {flag}")
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed.")
+            sys.exit(1)
+
+    main()
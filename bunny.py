@@ -0,0 +1,219 @@
+# bunny.py
+
+import argparse
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# -------------------------
+# Subcommands
+# -------------------------
+# Every subcommand has a loader, which imports its heavy dependencies, and a runner.
+# Only the chosen subcommand is loaded: play never imports cv2, librosa or langchain,
+# and --startup exits right after loading so the benchmarks can time it.
+
+def load_play():
+    import main as player
+
+    return player
+
+
+def open_play_window(player):
+    # What play shows first: the window, before the movements and the music are loaded
+    import pygame
+
+    pygame.init()
+    pygame.display.set_mode((player.WINDOW_WIDTH, player.WINDOW_HEIGHT))
+
+
+def run_play(args, player):
+    player.main(args.profile, args.overlay, args.profile_out, args.memory, args.movements, args.music,
+                not args.fixed_quality)
+
+
+def load_render():
+    import cv2  # Loaded up front, render_video needs it for every frame
+
+    import offline_render
+
+    return offline_render
+
+
+def run_render(args, offline_render):
+    import time
+
+    profiler = None
+    if args.profile_out:
+        from frame_profiler import FrameProfiler
+
+        profiler = FrameProfiler(budget=1.0 / args.fps, idle_stages=(), export_path=args.profile_out)
+    start = time.perf_counter()
+    frames = offline_render.render_video(offline_render.load_choreography(args.movements), args.output, args.fps,
+                                         max_seconds=args.max_seconds, debug=not args.no_debug, profiler=profiler)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {frames} frames in {elapsed:.2f}s ({frames / elapsed:.1f} fps) to '{args.output}'.")
+    if profiler:
+        print(profiler.report())
+        profiler.export()
+
+
+def load_batch():
+    import cv2  # Loaded up front, render_video needs it for every frame
+
+    import batch_render
+
+    return batch_render
+
+
+def run_batch(args, batch_render):
+    import sys
+    import time
+
+    paths = batch_render.expand_inputs(args.inputs)
+    if not paths:
+        print("No choreographies match the inputs.")
+        sys.exit(1)
+    start = time.perf_counter()
+    results = batch_render.render_batch(paths, args.output_dir, args.audio, args.fps, args.max_seconds,
+                                        not args.no_debug, args.workers)
+    print(batch_render.summary_table(results, time.perf_counter() - start))
+    if any(r["error"] for r in results):
+        sys.exit(1)
+
+
+def load_analyze():
+    import music_analysis
+
+    return music_analysis
+
+
+def run_analyze(args, music_analysis):
+    # Options left out use music_analysis' own defaults
+    options = {"phrase_length": args.phrase_length, "tier": args.tier}
+    analysis = music_analysis.analyze_track_cached(args.filepath, **{k: v for k, v in options.items() if v is not None})
+    print("\n".join(music_analysis.describe_phrases(analysis)))
+
+
+def load_generate():
+    import music_animation_agent_new
+
+    return music_animation_agent_new
+
+
+def run_generate(args, agent_module):
+    agent = agent_module.MusicAnimationAgent()
+    agent.generate_animation_sequence(args.music, resume=args.resume, gate=not args.no_gate)
+
+
+def load_check():
+    import dry_run
+
+    return dry_run
+
+
+def run_check(args, dry_run):
+    import sys
+
+    _, errors = dry_run.check_movements_file(args.movements, args.audio, args.report, args.strict)
+    if errors:
+        sys.exit(1)
+
+
+COMMANDS = {
+    "play": (load_play, run_play),
+    "render": (load_render, run_render),
+    "batch": (load_batch, run_batch),
+    "analyze": (load_analyze, run_analyze),
+    "generate": (load_generate, run_generate),
+    "check": (load_check, run_check),
+}
+
+PATH_ARGUMENTS = ("movements", "music", "output", "profile_out", "filepath", "audio", "output_dir", "inputs",
+                  "report")
+
+# Extra startup work that is part of what a subcommand shows first
+STARTUP_PROBES = {"play": open_play_window}
+
+
+def build_parser():
+    from config import FPS  # config is cheap to import, music_analysis and the agent are not
+
+    parser = argparse.ArgumentParser(prog="bunny",
+                                     description="Dancing bunny: play, render, batch, analyze, generate and check.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Only load the subcommand (and open its window), then exit. Used to time startup.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    play = commands.add_parser("play", help="Play the choreography in a window, press space to record.")
+    play.add_argument("--movements", default=os.path.join(current_dir, "output", "movements.json"))
+    play.add_argument("--music", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+    play.add_argument("--profile", action="store_true", help="Time every stage of the render loop.")
+    play.add_argument("--overlay", action="store_true", help="Show the stage timings on screen.")
+    play.add_argument("--profile-out", help="Export the frame timings to this .csv or .json file.")
+    play.add_argument("--memory", action="store_true", help="Track memory per stage and over time.")
+    play.add_argument("--fixed-quality", action="store_true", help="Never lower the quality under load.")
+
+    render = commands.add_parser("render", help="Render a choreography to a video without a window.")
+    render.add_argument("movements", nargs="?", default=os.path.join(current_dir, "output", "movements.json"))
+    render.add_argument("--output", default=os.path.join(current_dir, "output", "offline.mp4"))
+    render.add_argument("--fps", type=int, default=FPS)
+    render.add_argument("--max-seconds", type=float)
+    render.add_argument("--no-debug", action="store_true", help="Do not draw the pivots and body rectangle.")
+    render.add_argument("--profile-out", help="Export the frame timings to this .csv or .json file.")
+
+    batch = commands.add_parser("batch", help="Render many choreographies in one process (or a few).")
+    batch.add_argument("inputs", nargs="*", default=[os.path.join(current_dir, "output", "movements*.json")],
+                       help="Choreography files or glob patterns.")
+    batch.add_argument("--audio", help="Song muxed into every video.")
+    batch.add_argument("--output-dir", default=os.path.join(current_dir, "output", "batch"))
+    batch.add_argument("--fps", type=int)
+    batch.add_argument("--max-seconds", type=float)
+    batch.add_argument("--no-debug", action="store_true", help="Do not draw the pivots and body rectangle.")
+    batch.add_argument("--workers", type=int, default=1, help="Render in this many processes.")
+
+    analyze = commands.add_parser("analyze", help="Analyze a music file into phrases.")
+    analyze.add_argument("filepath")
+    analyze.add_argument("--tier", help="Analysis tier, see music_analysis.ANALYSIS_TIERS.")
+    analyze.add_argument("--phrase-length", type=int, help="Beats per phrase.")
+
+    generate = commands.add_parser("generate", help="Generate movements.json for a music file with the agent.")
+    generate.add_argument("music", nargs="?", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+    generate.add_argument("--resume", action="store_true", help="Continue the last unfinished run of this music.")
+    generate.add_argument("--debug", action="store_true", help="Turn on langchain's verbose chain logging.")
+    generate.add_argument("--no-gate", action="store_true", help="Keep the choreography even if it fails the dry run.")
+
+    check = commands.add_parser("check", help="Check a choreography by simulating it without rendering.")
+    check.add_argument("movements", nargs="?", default=os.path.join(current_dir, "output", "movements.json"))
+    check.add_argument("--audio", help="Song the timeline should cover.")
+    check.add_argument("--report", default=os.path.join(current_dir, "output", "dry_run.json"),
+                       help="Where the JSON report goes.")
+    check.add_argument("--strict", action="store_true", help="Fail on warnings too.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Paths given on the command line are relative to where it was run, the defaults and
+    # the sprite's assets to the repository
+    for name in PATH_ARGUMENTS:
+        value = getattr(args, name, None)
+        if isinstance(value, list):
+            setattr(args, name, [os.path.abspath(v) for v in value])
+        elif value:
+            setattr(args, name, os.path.abspath(value))
+    os.chdir(current_dir)
+    if args.command == "generate" and args.debug:
+        os.environ["BUNNY_LANGCHAIN_DEBUG"] = "1"  # Read when the agent module is imported
+
+    load, run = COMMANDS[args.command]
+    module = load()
+    if args.startup:
+        probe = STARTUP_PROBES.get(args.command)
+        if probe:
+            probe(module)
+        return
+    run(args, module)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# coverage_planner.py
+
+import json
+import re
+
+from moveset_library import validate_moveset
+from procedural_choreography import MOVEMENT_FILEPATH, write_movements
+
+
+def parse_movesets(text):
+    """
+    Parse a generate_movesets response into a list of moves.
+
+    The prompt asks for comma-separated objects without the surrounding array, so both
+    that form and a proper JSON array (optionally in a ```json fence) are accepted.
+    Raises ValueError if the text is not a list of movesets that pass
+    moveset_library.validate_moveset.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    text = text.strip().rstrip(",")
+    if not text.startswith("["):
+        text = f"[{text}]"
+    try:
+        movesets = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Moveset response is not valid JSON: {e}")
+
+    if isinstance(movesets, dict):
+        movesets = [movesets]
+    if not isinstance(movesets, list):
+        raise ValueError("Moveset response is not a list of movesets.")
+    for moveset in movesets:
+        validate_moveset(moveset)
+    if not movesets:
+        raise ValueError("Moveset response is empty.")
+    return movesets
+
+
+def moveset_duration(moveset):
+    return sum(block.get("duration", 1.0) for block in moveset["sequences"])
+
+
+def solve_counts(lengths, target):
+    """
+    Choose how often to repeat each moveset so their lengths (in beats) sum as close to
+    'target' beats as possible without exceeding it.
+
+    Among the combinations reaching the best total, the DP prefers balanced repeat counts
+    so every chosen moveset is actually used.
+
+    Returns (counts, total_beats).
+    """
+    # best[t] = (sum of squared counts, counts) for the combination reaching t beats
+    best = [None] * (target + 1)
+    best[0] = (0, (0,) * len(lengths))
+    for t in range(1, target + 1):
+        for i, length in enumerate(lengths):
+            if length > t or best[t - length] is None:
+                continue
+            score, counts = best[t - length]
+            candidate = (score + 2 * counts[i] + 1, counts[:i] + (counts[i] + 1,) + counts[i + 1:])
+            if best[t] is None or candidate[0] < best[t][0]:
+                best[t] = candidate
+
+    for total in range(target, -1, -1):
+        if best[total] is not None:
+            return list(best[total][1]), total
+    return [0] * len(lengths), 0
+
+
+def plan_phrase(phrase, candidates):
+    """
+    Plan one phrase from a few candidate movesets.
+
+    Every moveset is first snapped to a whole number of beats, the repeat counts are
+    solved with solve_counts, and whatever is left (less than the shortest moveset) is
+    absorbed by stretching all blocks evenly, so the phrase is filled exactly.
+
+    Returns a list of {"moveset", "repeat", "scale"} entries in play order, where 'scale'
+    multiplies every block duration of the moveset.
+    """
+    duration = phrase["end_time"] - phrase["start_time"]
+    beats = int(phrase["beats"])
+    beat_duration = duration / beats
+
+    lengths = [max(1, round(moveset_duration(m) / beat_duration)) for m in candidates]
+    counts, total = solve_counts(lengths, beats)
+    if total == 0:
+        # Every candidate is longer than the phrase: compress the shortest into it
+        shortest = min(range(len(candidates)), key=lambda i: lengths[i])
+        counts = [1 if i == shortest else 0 for i in range(len(candidates))]
+        total = lengths[shortest]
+
+    stretch = beats / total
+    plan = []
+    for moveset, length, count in zip(candidates, lengths, counts):
+        if count == 0:
+            continue
+        snap = length * beat_duration / moveset_duration(moveset)
+        plan.append({"moveset": moveset, "repeat": count, "scale": snap * stretch})
+    return plan
+
+
+def plan_coverage(phrases, pool, variety=2):
+    """
+    Plan a full timeline: which movesets to play in every phrase and how often.
+
+    Parameters:
+    - phrases: Phrase dicts with start_time, end_time, beats and energy
+      (music_analysis.phrase_table).
+    - pool: Generated movesets as {"moveset": ..., "energy": float or None}. Movesets
+      generated for an energy close to the phrase's are preferred, and the least used
+      ones win ties so consecutive phrases differ.
+    - variety: Number of different movesets per phrase.
+
+    Returns a list with one plan (see plan_phrase) per phrase.
+    """
+    if not pool:
+        raise ValueError("No movesets to plan with.")
+
+    usage = [0] * len(pool)
+    plans = []
+    for phrase in phrases:
+        def rank(i):
+            energy = pool[i].get("energy")
+            distance = abs(energy - phrase["energy"]) if energy is not None else float("inf")
+            return (distance, usage[i])
+
+        chosen = sorted(range(len(pool)), key=rank)[:variety]
+        for i in chosen:
+            usage[i] += 1
+        plans.append(plan_phrase(phrase, [pool[i]["moveset"] for i in chosen]))
+    return plans
+
+
+def _scaled(moveset, scale):
+    return {
+        **moveset,
+        "sequences": [
+            {**block, "duration": round(block.get("duration", 1.0) * scale, 4)}
+            for block in moveset["sequences"]
+        ],
+    }
+
+
+def expand_plan(phrases, plans, duration=None):
+    """
+    Turn planned phrases into the flat list of moves played by the AnimationManager,
+    with a rest before the first phrase and, given the track's 'duration', a rest after
+    the last one, so the timeline lasts as long as the song.
+    """
+    movements = []
+    if phrases and phrases[0]["start_time"] > 0:
+        movements.append({
+            "name": "intro: rest",
+            "sequences": [{"description": "wait for the first beat", "actions": "rest",
+                           "duration": round(phrases[0]["start_time"], 4)}],
+        })
+    for plan in plans:
+        for entry in plan:
+            scaled = _scaled(entry["moveset"], entry["scale"])
+            movements.extend([scaled] * entry["repeat"])
+    if duration is not None and phrases and duration - phrases[-1]["end_time"] > 1e-3:
+        movements.append({
+            "name": "outro: rest",
+            "sequences": [{"description": "rest until the song ends", "actions": "rest",
+                           "duration": round(duration - phrases[-1]["end_time"], 4)}],
+        })
+    return movements
+
+
+def write_timeline(phrases, pool, filepath=MOVEMENT_FILEPATH, variety=2, duration=None):
+    """
+    Plan the timeline and write movements.json in one step. 'duration' is the length
+    of the track, see expand_plan.
+
+    Returns a short per-phrase summary of the plan.
+    """
+    plans = plan_coverage(phrases, pool, variety)
+    write_movements(expand_plan(phrases, plans, duration), filepath)
+
+    summary = []
+    for phrase, plan in zip(phrases, plans):
+        planned = sum(moveset_duration(e["moveset"]) * e["scale"] * e["repeat"] for e in plan)
+        parts = ", ".join(f"{e['moveset'].get('name', 'Unnamed')} x{e['repeat']}" for e in plan)
+        summary.append(
+            f"Phrase {phrase['index'] + 1}: {planned:.2f}s of {phrase['end_time'] - phrase['start_time']:.2f}s ({parts})"
+        )
+    return summary
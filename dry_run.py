@@ -0,0 +1,447 @@
+# dry_run.py
+
+import contextlib
+import inspect
+import io
+import json
+import math
+import os
+import time
+
+from config import BODY, FPS, PARTS, WINDOW_HEIGHT, WINDOW_WIDTH
+from sprite import BunnySprite
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+REPORT_PATH = os.path.join(current_dir, "output", "dry_run.json")
+
+# Seconds between two samples of the bounding box, for the trajectory, the extents and
+# the off-screen check; outlines are the costly part of a step, every step is still simulated
+TRAJECTORY_EVERY = 0.1
+# Pixels the outline may leave the window by before it is an error rather than a
+# warning: jumps of the usual height clip the tips of the ears
+OFF_SCREEN_MARGIN = 64
+MAX_DRIFT = 20.0  # Pixels the bunny may end away from where it started
+NEUTRAL_TOLERANCE = 1.0  # Degrees a limb may end away from 0
+DURATION_TOLERANCE = 1.0  # Seconds the timeline may differ from the audio
+EXTENT_STEP = 0.25  # Degrees between two cached part outlines, under a pixel apart at the tips
+
+
+def audio_duration(path):
+    """
+    Length of an audio file in seconds: .wav files are read with the wave module, other
+    formats through librosa.
+    """
+    if path.lower().endswith(".wav"):
+        import wave
+
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    import librosa
+
+    return float(librosa.get_duration(path=path))
+
+
+def check_structure(movements):
+    """
+    Find what keeps a choreography from being read at all: it has to be a list of
+    movement objects whose 'sequences' are lists of blocks, each block with a positive
+    duration and 'actions' that are "rest", null or {part: {"action": name, "params": {}}}.
+
+    Returns a list of messages, empty for a well formed choreography.
+    """
+    if not isinstance(movements, list):
+        return [f"the choreography is a {type(movements).__name__}, not a list of movements"]
+    problems = []
+    for m, movement in enumerate(movements):
+        if not isinstance(movement, dict):
+            problems.append(f"movement {m} is a {type(movement).__name__}, not an object")
+            continue
+        name = f"'{movement.get('name', 'Unnamed')}'"
+        sequences = movement.get("sequences", [])
+        if not isinstance(sequences, list):
+            problems.append(f"{name}: 'sequences' is not a list")
+            continue
+        for index, block in enumerate(sequences):
+            if not isinstance(block, dict):
+                problems.append(f"{name} block {index} is not an object")
+                continue
+            duration = block.get("duration", 1.0)
+            if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration <= 0:
+                problems.append(f"{name} block {index}: duration {duration!r} is not a positive number")
+            actions = block.get("actions")
+            if actions in (None, "rest"):
+                continue
+            if not isinstance(actions, dict):
+                problems.append(f"{name} block {index}: 'actions' is not an object")
+                continue
+            for part, params in actions.items():
+                if not isinstance(params, dict):
+                    problems.append(f"{name} block {index} {part}: the action is not an object")
+                elif not isinstance(params.get("params", {}), dict):
+                    problems.append(f"{name} block {index} {part}: 'params' is not an object")
+    return problems
+
+
+def check_actions(movements):
+    """
+    Find the actions the player cannot run: names BunnySprite does not have and params
+    its methods do not accept.
+
+    Returns a list of {movement, block, part, action, problem}. 'movements' has to pass
+    check_structure() first.
+    """
+    problems = []
+    signatures = {}  # A few actions repeat throughout a choreography
+    for movement in movements:
+        for index, block in enumerate(movement.get("sequences", [])):
+            actions = block.get("actions")
+            if not isinstance(actions, dict):
+                continue
+            for part, params in actions.items():
+                action = params.get("action")
+                where = {"movement": movement.get("name", "Unnamed"), "block": index, "part": part, "action": action}
+                method = getattr(BunnySprite, action, None) if isinstance(action, str) else None
+                if not callable(method) or action.startswith("_"):
+                    problems.append({**where, "problem": "unknown action"})
+                    continue
+                try:
+                    if action not in signatures:
+                        signatures[action] = inspect.signature(method)
+                    signatures[action].bind(None, duration=block.get("duration", 1.0), **params.get("params", {}))
+                except TypeError as e:
+                    problems.append({**where, "problem": f"bad params: {e}"})
+    return problems
+
+
+def visible_hull(image):
+    """
+    Convex hull of the pixels of 'image' that are not fully transparent, as a list of
+    pixel corners (x, y) in the image's coordinates.
+    """
+    import numpy as np
+    import pygame
+
+    visible = pygame.surfarray.array_alpha(image).T > 0  # (height, width)
+    width = visible.shape[1]
+    points = []
+    for y in np.nonzero(visible.any(axis=1))[0]:
+        row = visible[y]
+        first, last = int(row.argmax()), width - int(row[::-1].argmax())
+        points += [(first, int(y)), (first, int(y) + 1), (last, int(y)), (last, int(y) + 1)]
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+
+    # Monotone chain: lower then upper half, dropping points that do not turn left
+    def half(sequence):
+        chain = []
+        for p in sequence:
+            while len(chain) >= 2 and ((chain[-1][0] - chain[-2][0]) * (p[1] - chain[-2][1]) -
+                                       (chain[-1][1] - chain[-2][1]) * (p[0] - chain[-2][0])) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain[:-1]
+    return half(points) + half(reversed(points))
+
+
+class DryRunSprite(BunnySprite):
+    def __init__(self, center_x, center_y):
+        """
+        BunnySprite that records every part animation aimed outside the part's rotation
+        range, which the sprite silently clamps. It is never drawn: the images are only
+        read once for the outline of their visible pixels, which bounds() rotates.
+        """
+        self.clamped = []
+        super().__init__(center_x, center_y)
+        # Outline of every part relative to its pivot, and where that pivot sits on the body
+        self._hulls = {}
+        for name, part in self.parts.items():
+            px, py = part.pivot
+            self._hulls[name] = ([(x - px, y - py) for x, y in visible_hull(part.image)],
+                                 BODY["pivots"][part.parent_pivot_name])
+        self._body_box = self.body.image.get_bounding_rect()
+        self._extents = {name: {} for name in self.parts}  # Angle step -> extents around the pivot
+
+    def add_body_part_animation(self, part_name, target_angle, duration, on_complete=None):
+        if part_name in PARTS:
+            low, high = PARTS[part_name]["rotation_range"]
+            if not low <= target_angle <= high:
+                manager = self.animation_manager
+                self.clamped.append({
+                    "time": round(self.time, 4),
+                    "movement": (manager.current_animation or {}).get("name", "Unnamed"),
+                    "block": manager.sequence_index,
+                    "part": part_name,
+                    "angle": target_angle,
+                    "range": [low, high],
+                })
+        super().add_body_part_animation(part_name, target_angle, duration, on_complete)
+
+    def _part_extents(self, name, angle):
+        # Parts only take angles within their rotation range, so there are at most a few
+        # hundred steps per part to compute
+        step = round(angle / EXTENT_STEP)
+        extents = self._extents[name].get(step)
+        if extents is None:
+            # blit_rotate puts a point at offset (x, y) from the pivot at (x, y) rotated
+            # by -angle: (x cos + y sin, -x sin + y cos)
+            radians = math.radians(step * EXTENT_STEP)
+            cos, sin = math.cos(radians), math.sin(radians)
+            xs = [x * cos + y * sin for x, y in self._hulls[name][0]]
+            ys = [y * cos - x * sin for x, y in self._hulls[name][0]]
+            extents = self._extents[name][step] = (min(xs), min(ys), max(xs), max(ys))
+        return extents
+
+    def bounds(self):
+        """
+        (left, top, right, bottom) of the visible pixels draw() would cover.
+        """
+        x, y = self.position.x, self.position.y
+        box = self._body_box
+        left, top, right, bottom = x + box.left, y + box.top, x + box.right, y + box.bottom
+        for name, part in self.parts.items():
+            pivot = self._hulls[name][1]
+            wx, wy = x + pivot[0], y + pivot[1]
+            l, t, r, b = self._part_extents(name, part.angle)
+            if wx + l < left:
+                left = wx + l
+            if wy + t < top:
+                top = wy + t
+            if wx + r > right:
+                right = wx + r
+            if wy + b > bottom:
+                bottom = wy + b
+        return left, top, right, bottom
+
+
+def simulate(movements, fps=FPS, size=(WINDOW_WIDTH, WINDOW_HEIGHT), audio_seconds=None, tail_seconds=0.5):
+    """
+    Step the sprite and its AnimationManager through a choreography at a fixed timestep
+    of 1/fps, exactly like offline_render.render_frames, without drawing anything. The
+    bounding box is only computed every TRAJECTORY_EVERY seconds and on the last step.
+
+    Parameters:
+    - movements: The movements.json list.
+    - fps: Steps per second of choreography.
+    - size: (width, height) of the window the bunny has to stay in.
+    - audio_seconds: Length of the song, compared with the length of the timeline.
+    - tail_seconds: Extra time simulated after the last block so the final tweens finish.
+
+    Returns a report dict: the bounding-box trajectory and extents, the stretches off
+    screen, the drift from the start position overall and per movement, the timeline and
+    audio durations, the clamped angles, the actions the player cannot run, the limbs
+    not back at neutral at the end and, if the player would raise, the crash.
+    Raises ValueError for a choreography check_structure() rejects.
+    """
+    from offline_render import choreography_duration, frame_count
+
+    problems = check_structure(movements)
+    if problems:
+        raise ValueError(problems[0])
+
+    width, height = size
+    bunny = DryRunSprite(width // 2, height // 2 + 100)
+    home = bunny.position.copy()
+    manager = bunny.animation_manager
+    frames = frame_count(movements, fps, tail_seconds=tail_seconds)
+    dt = 1.0 / fps
+    sample_every = max(1, int(round(TRAJECTORY_EVERY * fps)))
+
+    trajectory = []
+    extents = list(bunny.bounds())
+    off_screen = []
+    stretch = None
+    drifts = []
+    current, movement_start = None, home.copy()
+    crash = None
+    steps = 0
+
+    start = time.perf_counter()
+    # The sprite and the manager print their warnings, check_actions reports them instead
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(-1, frames):
+            # Step -1 loads the sequences, which already runs the first block
+            try:
+                if index < 0:
+                    manager.load_sequences(list(movements))
+                    continue
+                bunny.update(dt)
+            except Exception as e:
+                crash = {"time": round(bunny.time, 4), "error": f"{type(e).__name__}: {e}"}
+                break
+            steps += 1
+            if manager.current_animation is not current:
+                if current is not None:
+                    delta = bunny.position - movement_start
+                    drifts.append({"movement": current.get("name", "Unnamed"), "dx": round(delta.x, 2),
+                                   "dy": round(delta.y, 2)})
+                current, movement_start = manager.current_animation, bunny.position.copy()
+
+            if index % sample_every and index != frames - 1:
+                continue
+            left, top, right, bottom = bounds = bunny.bounds()
+            extents = [min(extents[0], left), min(extents[1], top), max(extents[2], right), max(extents[3], bottom)]
+            trajectory.append([round(bunny.time, 4)] + [round(v, 1) for v in bounds])
+            overshoot = max(-left, -top, right - width, bottom - height)
+            if overshoot > 0:
+                if stretch is None:
+                    stretch = {"start": round(bunny.time, 4), "end": None, "sides": set(), "max_pixels": 0.0}
+                    off_screen.append(stretch)
+                stretch["end"] = round(bunny.time, 4)
+                stretch["max_pixels"] = round(max(stretch["max_pixels"], overshoot), 1)
+                stretch["sides"].update(side for side, value in
+                                        (("left", -left), ("top", -top), ("right", right - width),
+                                         ("bottom", bottom - height)) if value > 0)
+            else:
+                stretch = None
+    elapsed = time.perf_counter() - start
+    for s in off_screen:
+        s["sides"] = sorted(s["sides"])
+
+    timeline = choreography_duration(movements)
+    drift = bunny.position - home
+    return {
+        "frames": steps,
+        "fps": fps,
+        "sample_seconds": sample_every / fps,
+        "window": [width, height],
+        "simulated_seconds": round(bunny.time, 4),
+        "elapsed_seconds": elapsed,
+        "speedup": bunny.time / elapsed if elapsed else 0.0,
+        "timeline_seconds": round(timeline, 4),
+        "audio_seconds": round(audio_seconds, 4) if audio_seconds is not None else None,
+        "extents": [round(v, 1) for v in extents],
+        "off_screen": off_screen,
+        "drift": [round(drift.x, 2), round(drift.y, 2)],
+        "movement_drift": sorted(drifts, key=lambda d: -math.hypot(d["dx"], d["dy"]))[:5],
+        "final_angles": {name: round(part.angle, 2) for name, part in bunny.parts.items()
+                         if abs(part.angle) > NEUTRAL_TOLERANCE},
+        "clamped": bunny.clamped,
+        "action_problems": check_actions(movements),
+        "crash": crash,
+        "trajectory": trajectory,
+    }
+
+
+def gate(report, strict=False):
+    """
+    Decide whether a choreography can be played, from a simulate() report.
+
+    Leaving the window by more than OFF_SCREEN_MARGIN, actions the player cannot run and
+    crashes are errors. Smaller overshoots, drift, clamped angles, limbs left raised and
+    a timeline that misses the song's length by more than DURATION_TOLERANCE are
+    warnings, which only fail the gate when 'strict'.
+
+    Returns (errors, warnings), two lists of messages.
+    """
+    errors, warnings = [], []
+    if report["crash"]:
+        errors.append(f"the player raises {report['crash']['error']} at {report['crash']['time']:.2f}s")
+    # A repeated moveset repeats its problems, each one is listed once with its count
+    problems = {}
+    for p in report["action_problems"]:
+        key = (p["movement"], p["block"], p["part"], p["action"], p["problem"])
+        problems[key] = problems.get(key, 0) + 1
+    for (movement, block, part, action, problem), count in problems.items():
+        errors.append(f"'{movement}' block {block} {part}: {problem} ('{action}')"
+                      + (f", {count} times" if count > 1 else ""))
+    for far, messages in ((True, errors), (False, warnings)):
+        stretches = [s for s in report["off_screen"] if (s["max_pixels"] > OFF_SCREEN_MARGIN) == far]
+        if stretches:
+            sides = sorted({side for s in stretches for side in s["sides"]})
+            seconds = sum(s["end"] - s["start"] + report["sample_seconds"] for s in stretches)
+            messages.append(f"off screen ({', '.join(sides)}) {len(stretches)} times for {seconds:.2f}s in total, "
+                            f"by up to {max(s['max_pixels'] for s in stretches):.0f}px, "
+                            f"first from {stretches[0]['start']:.2f}s to {stretches[0]['end']:.2f}s")
+
+    dx, dy = report["drift"]
+    if math.hypot(dx, dy) > MAX_DRIFT:
+        worst = ", ".join(f"'{d['movement']}' {d['dx']:+.0f}px" for d in report["movement_drift"][:3])
+        warnings.append(f"ends {dx:+.0f}px, {dy:+.0f}px away from the start (largest: {worst})")
+    if report["clamped"]:
+        parts = sorted({c["part"] for c in report["clamped"]})
+        warnings.append(f"{len(report['clamped'])} angles clamped to the rotation range ({', '.join(parts)})")
+    if report["final_angles"]:
+        warnings.append("limbs not back at neutral: " +
+                        ", ".join(f"{name} {angle:+.0f}" for name, angle in report["final_angles"].items()))
+    if report["audio_seconds"] is not None:
+        difference = report["timeline_seconds"] - report["audio_seconds"]
+        if abs(difference) > DURATION_TOLERANCE:
+            warnings.append(f"timeline is {report['timeline_seconds']:.2f}s for {report['audio_seconds']:.2f}s "
+                            f"of audio ({difference:+.2f}s)")
+    if strict:
+        errors, warnings = errors + warnings, []
+    return errors, warnings
+
+
+def format_report(report, errors, warnings):
+    left, top, right, bottom = report["extents"]
+    lines = [
+        f"Dry run: {report['simulated_seconds']:.2f}s in {report['elapsed_seconds'] * 1000:.0f}ms "
+        f"({report['speedup']:.0f}x realtime, {report['frames']} steps)",
+        f"  extents: x {left:.0f}..{right:.0f}, y {top:.0f}..{bottom:.0f} "
+        f"in a {report['window'][0]}x{report['window'][1]} window",
+        f"  drift: {report['drift'][0]:+.1f}px, {report['drift'][1]:+.1f}px",
+        f"  timeline: {report['timeline_seconds']:.2f}s"
+        + (f", audio {report['audio_seconds']:.2f}s" if report["audio_seconds"] is not None else ""),
+    ]
+    lines += [f"  ERROR {message}" for message in errors]
+    lines += [f"  warning {message}" for message in warnings]
+    lines.append("  passed" if not errors else f"  FAILED with {len(errors)} errors")
+    return "\n".join(lines)
+
+
+def check_movements_file(movements_path, audio_path=None, report_path=REPORT_PATH, strict=False):
+    """
+    Simulate a movements.json, print the report and write it to 'report_path'. A file
+    that cannot be read fails with a single error, one that is not shaped like a
+    choreography with the problems check_structure() finds.
+
+    Returns (report, errors).
+    """
+    try:
+        with open(movements_path, "r", encoding="utf-8") as f:
+            movements = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Dry run of '{movements_path}' FAILED: {e}")
+        return None, [f"cannot read the choreography: {e}"]
+    problems = check_structure(movements)
+    if problems:
+        print(f"Dry run of '{movements_path}' FAILED: " + "; ".join(problems))
+        return None, problems
+
+    seconds = None
+    if audio_path:
+        try:
+            seconds = audio_duration(audio_path)
+        except Exception as e:
+            print(f"Could not read the length of '{audio_path}': {e}")
+    report = simulate(movements, audio_seconds=seconds)
+    errors, warnings = gate(report, strict)
+    report.update({"movements_path": movements_path, "audio_path": audio_path, "errors": errors,
+                   "warnings": warnings})
+    print(format_report(report, errors, warnings))
+    if report_path:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report, errors
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import sys
+
+        parser = argparse.ArgumentParser(description="Check a choreography by simulating it without rendering.")
+        parser.add_argument("movements", nargs="?", default=os.path.join(current_dir, "output", "movements.json"))
+        parser.add_argument("--audio", help="Song the timeline should cover.")
+        parser.add_argument("--report", default=REPORT_PATH, help="Where the JSON report goes.")
+        parser.add_argument("--strict", action="store_true", help="Fail on warnings too.")
+        args = parser.parse_args()
+
+        _, errors = check_movements_file(args.movements, args.audio, args.report, args.strict)
+        if errors:
+            sys.exit(1)
+
+    main()
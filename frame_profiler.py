@@ -0,0 +1,226 @@
+# frame_profiler.py
+
+import csv
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from config import FPS
+
+# Histogram bucket edges in milliseconds, the last bucket holds everything slower
+HISTOGRAM_EDGES_MS = (0.0, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.7, 33.3, float("inf"))
+MAX_STAGES = 16
+
+
+class FrameProfiler:
+    def __init__(self, budget=1.0 / FPS, window=600, idle_stages=("tick",), overlay_every=30, export_path=None):
+        """
+        Per-frame stage timers for the render loop.
+
+        A frame is timed with start_frame(), one mark(stage) after every stage (the time
+        since the previous mark is charged to that stage) and end_frame(). A mark is one
+        perf_counter call and a list append, so profiling costs a few microseconds per
+        frame. Only the last 'window' frames are kept in memory; with an export_path every
+        frame is also streamed to a temporary file that export() turns into the report.
+
+        Parameters:
+        - budget: Seconds of work per frame before it counts as an overrun (1/FPS).
+        - window: Number of recent frames the rolling statistics and histograms use.
+        - idle_stages: Stages spent waiting (e.g. clock.tick), excluded from the work time
+          compared with the budget.
+        - overlay_every: Frames between refreshes of the on-screen overlay text.
+        - export_path: The .csv or .json file export() writes every frame to.
+        """
+        self.budget = budget
+        self.window = window
+        self.idle_stages = set(idle_stages)
+        self.overlay_every = overlay_every
+        self.export_path = export_path
+        self.stages = []  # Stage names in first-seen order
+        self.frames = 0
+        self.overruns = 0
+        # Rolling window as a ring of per-stage seconds (last column: work time), so the
+        # statistics are a few vectorized numpy calls however often the overlay asks
+        self._ring = np.zeros((window, MAX_STAGES + 1))
+        self._marks = []
+        self._last = 0.0
+        self._overlay_lines = []
+        self._font = None
+        self._spool = None  # One JSON line of {stage: milliseconds} per frame, with export_path
+
+    def start_frame(self):
+        self._marks = []
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self._marks.append((stage, now - self._last))
+        self._last = now
+
+    def end_frame(self):
+        frame = {}
+        for stage, seconds in self._marks:
+            if stage not in frame and stage not in self.stages:
+                if len(self.stages) == MAX_STAGES:
+                    raise ValueError(f"FrameProfiler supports at most {MAX_STAGES} stages.")
+                self.stages.append(stage)
+            frame[stage] = frame.get(stage, 0.0) + seconds
+        row = self._ring[self.frames % self.window]
+        row[:] = 0.0
+        work = 0.0
+        for stage, seconds in frame.items():
+            row[self.stages.index(stage)] = seconds
+            if stage not in self.idle_stages:
+                work += seconds
+        row[MAX_STAGES] = work
+        self.frames += 1
+        if work > self.budget:
+            self.overruns += 1
+        if self.export_path:
+            if self._spool is None:
+                self._spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+            self._spool.write(json.dumps({stage: round(s * 1000, 4) for stage, s in frame.items()}) + "\n")
+
+    def _window(self):
+        # Milliseconds of the frames in the window, one column per stage
+        return self._ring[:min(self.frames, self.window)] * 1000
+
+    def _columns(self):
+        return list(enumerate(self.stages)) + [(MAX_STAGES, "work")]
+
+    def summary(self):
+        """
+        Rolling statistics over the last 'window' frames: mean, p50, p95, p99 and max in
+        milliseconds for every stage and the total work, plus the overrun count of the run.
+        """
+        stats = {}
+        window = self._window()
+        if len(window):
+            mean = window.mean(axis=0)
+            p50, p95, p99 = np.percentile(window, (50, 95, 99), axis=0)
+            peak = window.max(axis=0)
+            for i, stage in self._columns():
+                stats[stage] = {
+                    "mean_ms": float(mean[i]),
+                    "p50_ms": float(p50[i]),
+                    "p95_ms": float(p95[i]),
+                    "p99_ms": float(p99[i]),
+                    "max_ms": float(peak[i]),
+                }
+        return {
+            "frames": self.frames,
+            "budget_ms": self.budget * 1000,
+            "overruns": self.overruns,
+            "stages": stats,
+        }
+
+    def histograms(self):
+        """
+        Rolling histogram of every stage over HISTOGRAM_EDGES_MS, as lists of counts.
+        """
+        window = self._window()
+        return {stage: np.histogram(window[:, i], HISTOGRAM_EDGES_MS)[0].tolist() for i, stage in self._columns()}
+
+    def _frame_rows(self):
+        # (frame index, {stage: milliseconds}): every frame when they were streamed to the
+        # spool, otherwise the frames still in the window
+        if self._spool is not None:
+            self._spool.flush()
+            self._spool.seek(0)
+            for i, line in enumerate(self._spool):
+                yield i, json.loads(line)
+            return
+        for i in range(max(self.frames - self.window, 0), self.frames):
+            row = self._ring[i % self.window]
+            yield i, {stage: round(float(row[column]) * 1000, 4) for column, stage in enumerate(self.stages)}
+
+    def export(self, path=None):
+        """
+        Write every frame's stage times, as CSV (one row per frame, milliseconds) if the
+        path ends in .csv, otherwise as JSON together with the summary and histograms.
+        The frames are copied from the spool row by row, so a long run is exported
+        without holding it in memory. Without an export_path only the frames in the
+        window are written.
+
+        path: The report file, defaults to export_path.
+        """
+        path = path or self.export_path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame"] + self.stages)
+                for i, frame in self._frame_rows():
+                    writer.writerow([i] + [f"{frame.get(stage, 0.0):.4f}" for stage in self.stages])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                report = json.dumps({
+                    "summary": self.summary(),
+                    "histogram_edges_ms": [e if e != float("inf") else None for e in HISTOGRAM_EDGES_MS],
+                    "histograms": self.histograms(),
+                    "frames": [],
+                })
+                # The frames list is written last, one frame at a time
+                f.write(report[:-2])
+                for n, (_, frame) in enumerate(self._frame_rows()):
+                    f.write((", " if n else "") + json.dumps(frame))
+                f.write("]}")
+
+    def report(self):
+        """
+        Printable table of the rolling statistics.
+        """
+        summary = self.summary()
+        lines = [f"{summary['frames']} frames, {summary['overruns']} over the "
+                 f"{summary['budget_ms']:.1f}ms budget"]
+        for stage, s in summary["stages"].items():
+            lines.append(f"  {stage:<10} mean {s['mean_ms']:7.3f}ms  p50 {s['p50_ms']:7.3f}ms  "
+                         f"p99 {s['p99_ms']:7.3f}ms  max {s['max_ms']:7.3f}ms")
+        return "\n".join(lines)
+
+    def draw_overlay(self, surface, pos=(10, 10)):
+        """
+        Draw the rolling stage means and the overrun count onto 'surface'. The text is only
+        re-rendered every 'overlay_every' frames.
+        """
+        import pygame
+
+        if self._font is None:
+            self._font = pygame.font.Font(None, 22)
+        if not self._overlay_lines or self.frames % self.overlay_every == 0:
+            summary = self.summary()
+            texts = [f"{stage}: {s['mean_ms']:.2f}ms (p99 {s['p99_ms']:.2f})" for stage, s in summary["stages"].items()]
+            texts.append(f"overruns: {summary['overruns']}/{summary['frames']}")
+            self._overlay_lines = [self._font.render(text, True, (200, 0, 0)) for text in texts]
+        x, y = pos
+        for line in self._overlay_lines:
+            surface.blit(line, (x, y))
+            y += line.get_height()
+
+
+class ProfilerGroup:
+    def __init__(self, *profilers):
+        """
+        Forward the frame and stage marks to several profilers, e.g. a FrameProfiler and a
+        memory_tracker.MemoryTracker. None entries are skipped, an empty group is falsy so
+        'if profiler:' guards still skip the marks.
+        """
+        self.profilers = [p for p in profilers if p is not None]
+
+    def __bool__(self):
+        return bool(self.profilers)
+
+    def start_frame(self):
+        for profiler in self.profilers:
+            profiler.start_frame()
+
+    def mark(self, stage):
+        for profiler in self.profilers:
+            profiler.mark(stage)
+
+    def end_frame(self):
+        for profiler in self.profilers:
+            profiler.end_frame()
@@ -0,0 +1,193 @@
+# golden_frames.py
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from offline_render import load_choreography, render_frames, surface_to_array
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(current_dir, "goldens")
+
+# Fixed choreographies from output/ (movements.json is rewritten by every agent run)
+CHOREOGRAPHIES = ("animation_sequence.json", "movements_1.json", "movements_2.json", "movements_3.json")
+MAX_SECONDS = 8.0  # Rendered per choreography, keeps a full check at a few seconds
+SAMPLE_EVERY = 120  # Frames between stored full frames
+HASH_THUMBNAIL = (144, 96)
+
+# Default tolerances: identical rendering passes, anything visible fails
+MAX_HASH_DISTANCE = 0  # Bits of the 64-bit difference hash
+MIN_PSNR = 50.0  # dB, over the sampled full frames
+MAX_PIXEL_DIFF = 8  # Largest per-channel difference in a sampled frame
+
+
+def dhash(surface, hash_size=8):
+    """
+    64-bit difference hash of a frame: the sign of horizontal gradients of a
+    (hash_size + 1) x hash_size grayscale thumbnail, as a hex string.
+
+    The surface is first scaled to HASH_THUMBNAIL with pygame's nearest-neighbour scale,
+    which is far cheaper than averaging the full frame.
+    """
+    import cv2
+    import pygame
+
+    thumbnail = surface_to_array(pygame.transform.scale(surface, HASH_THUMBNAIL))
+    gray = cv2.cvtColor(thumbnail, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def psnr(reference, frame):
+    mse = np.mean((reference.astype(np.float64) - frame.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def render_signature(movements, max_seconds=MAX_SECONDS, sample_every=SAMPLE_EVERY, **options):
+    """
+    Render a choreography and return (hashes, samples): the dhash of every frame and the
+    full RGB frames at every 'sample_every'-th frame, by index.
+
+    Extra keyword arguments are passed to offline_render.render_frames, so any renderer
+    configuration can be checked against the same goldens.
+    """
+    hashes, samples = [], {}
+    for index, surface in render_frames(movements, max_seconds=max_seconds, **options):
+        hashes.append(dhash(surface))
+        if index % sample_every == 0:
+            samples[index] = surface_to_array(surface)
+    return hashes, samples
+
+
+def _golden_path(name, *parts):
+    return os.path.join(GOLDEN_DIR, os.path.splitext(name)[0], *parts)
+
+
+def update_goldens(names=CHOREOGRAPHIES, max_seconds=MAX_SECONDS, sample_every=SAMPLE_EVERY):
+    """
+    Render the reference frames and store them as goldens: hashes.json with every
+    frame's hash plus lossless PNGs of the sampled frames.
+    """
+    import cv2
+
+    for name in names:
+        movements = load_choreography(os.path.join(current_dir, "output", name))
+        hashes, samples = render_signature(movements, max_seconds, sample_every)
+        os.makedirs(_golden_path(name), exist_ok=True)
+        for old in os.listdir(_golden_path(name)):
+            os.remove(_golden_path(name, old))
+        for index, frame in samples.items():
+            cv2.imwrite(_golden_path(name, f"frame_{index:05d}.png"), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                        [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        with open(_golden_path(name, "hashes.json"), "w", encoding="utf-8") as f:
+            json.dump({"max_seconds": max_seconds, "sample_every": sample_every, "hashes": hashes}, f, indent=0)
+        print(f"{name}: {len(hashes)} frame hashes and {len(samples)} sampled frames stored.")
+
+
+def compare_goldens(names=CHOREOGRAPHIES, max_hash_distance=MAX_HASH_DISTANCE, min_psnr=MIN_PSNR,
+                    max_pixel_diff=MAX_PIXEL_DIFF, **options):
+    """
+    Render every choreography with the given renderer options and compare it with its
+    goldens.
+
+    Returns one report per choreography: frame counts, the worst hash distance, the
+    lowest PSNR and largest pixel difference over the sampled frames, and the list of
+    failing frames as (index, reason).
+    """
+    import cv2
+
+    reports = []
+    for name in names:
+        with open(_golden_path(name, "hashes.json"), "r", encoding="utf-8") as f:
+            golden = json.load(f)
+        movements = load_choreography(os.path.join(current_dir, "output", name))
+        hashes, samples = render_signature(movements, golden["max_seconds"], golden["sample_every"], **options)
+
+        failures = []
+        if len(hashes) != len(golden["hashes"]):
+            failures.append((None, f"{len(hashes)} frames rendered, {len(golden['hashes'])} expected"))
+        distances = [hash_distance(a, b) for a, b in zip(hashes, golden["hashes"])]
+        for index, distance in enumerate(distances):
+            if distance > max_hash_distance:
+                failures.append((index, f"hash distance {distance}"))
+
+        frame_stats = []
+        for index, frame in sorted(samples.items()):
+            path = _golden_path(name, f"frame_{index:05d}.png")
+            if not os.path.exists(path):
+                failures.append((index, "no golden frame"))
+                continue
+            reference = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+            if reference.shape != frame.shape:
+                failures.append((index, f"size {frame.shape[1]}x{frame.shape[0]}, golden "
+                                        f"{reference.shape[1]}x{reference.shape[0]}"))
+                continue
+            value = psnr(reference, frame)
+            diff = int(np.abs(reference.astype(np.int16) - frame.astype(np.int16)).max())
+            frame_stats.append((index, value, diff))
+            if value < min_psnr or diff > max_pixel_diff:
+                failures.append((index, f"PSNR {value:.1f}dB, max diff {diff}"))
+
+        reports.append({
+            "name": name,
+            "frames": len(hashes),
+            "max_hash_distance": max(distances, default=0),
+            "min_psnr": min((s[1] for s in frame_stats), default=float("inf")),
+            "max_pixel_diff": max((s[2] for s in frame_stats), default=0),
+            "samples": frame_stats,
+            "failures": failures,
+        })
+    return reports
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Check the renderer against the golden frames.")
+        parser.add_argument("names", nargs="*", default=list(CHOREOGRAPHIES), help="Choreographies in output/.")
+        parser.add_argument("--update", action="store_true", help="Store the current rendering as the goldens.")
+        parser.add_argument("--max-hash-distance", type=int, default=MAX_HASH_DISTANCE)
+        parser.add_argument("--min-psnr", type=float, default=MIN_PSNR)
+        parser.add_argument("--max-pixel-diff", type=int, default=MAX_PIXEL_DIFF)
+        parser.add_argument("--no-debug", action="store_true", help="Render without the debug pivots.")
+        parser.add_argument("--verbose", action="store_true", help="Print PSNR and max diff of every sampled frame.")
+        args = parser.parse_args()
+
+        os.chdir(current_dir)  # The sprite loads its images from relative paths
+        start = time.perf_counter()
+        if args.update:
+            update_goldens(args.names)
+            print(f"Done in {time.perf_counter() - start:.1f}s.")
+            return
+
+        reports = compare_goldens(args.names, args.max_hash_distance, args.min_psnr, args.max_pixel_diff,
+                                  debug=not args.no_debug)
+        failed = 0
+        for report in reports:
+            status = "FAIL" if report["failures"] else "ok"
+            print(f"{status:<4} {report['name']:<26} {report['frames']:>5} frames  "
+                  f"hash distance <= {report['max_hash_distance']}  PSNR >= {report['min_psnr']:.1f}dB  "
+                  f"max diff {report['max_pixel_diff']}")
+            if args.verbose:
+                for index, value, diff in report["samples"]:
+                    print(f"       frame {index:>5}: PSNR {value:.1f}dB, max diff {diff}")
+            for index, reason in report["failures"][:10]:
+                print(f"       frame {index}: {reason}")
+            if len(report["failures"]) > 10:
+                print(f"       ... {len(report['failures']) - 10} more")
+            failed += bool(report["failures"])
+        print(f"{len(reports) - failed}/{len(reports)} choreographies match the goldens "
+              f"({time.perf_counter() - start:.1f}s).")
+        if failed:
+            sys.exit(1)
+
+    main()
@@ -1,7 +1,9 @@
 import math
+from collections import OrderedDict
+
 import pygame
 
-def blit_rotate(surf, image, pos, originPos, angle):
+def blit_rotate(surf, image, pos, originPos, angle, step=None):
     """
     Draws 'image' onto 'surf', rotated around a pivot point.
     
@@ -13,11 +15,20 @@ def blit_rotate(surf, image, pos, originPos, angle):
                  (relative to the image's top-left corner). For example:
                  If pivot is the center of a 64x64 image, originPos would be (32,32).
     - angle: The rotation angle in degrees. Positive angles rotate counter-clockwise.
+    - step: Optional. Round the angle to a multiple of 'step' degrees and take the rotated
+            image from a cache (see rotated_image_cached), so a held pose costs a blit instead
+            of a rotation.
     
     This function calculates how to position the rotated image so that the 'originPos'
     inside the image stays fixed at 'pos' on the target surface.
     """
 
+    # Rotate the original image, or look up its rotation by the rounded angle
+    if step:
+        rotated_image, angle = rotated_image_cached(image, angle, step)
+    else:
+        rotated_image = pygame.transform.rotate(image, angle)
+
     # Get a rectangle of the original image at (pos - originPos)
     # This places the image so that 'originPos' would be at 'pos' if the image were not rotated
     image_rect = image.get_rect(topleft=(pos[0] - originPos[0], pos[1] - originPos[1]))
@@ -34,11 +45,51 @@ def blit_rotate(surf, image, pos, originPos, angle):
     # The new center of the rotated image is pivot position minus the rotated offset
     rotated_image_center = (pos[0] - rotated_offset.x, pos[1] - rotated_offset.y)
 
-    # Rotate the original image
-    rotated_image = pygame.transform.rotate(image, angle)
-
     # Get the rectangle of the rotated image with the new center
     rotated_image_rect = rotated_image.get_rect(center=rotated_image_center)
 
     # Blit the rotated image onto the surface
-    surf.blit(rotated_image, rotated_image_rect)
\ No newline at end of file
+    surf.blit(rotated_image, rotated_image_rect)
+
+
+# Rotated images by (image, angle), least recently used first
+_rotation_cache = OrderedDict()
+ROTATION_CACHE_SIZE = 512
+
+# Scaled images by (image, scale)
+_scale_cache = {}
+
+
+def rotated_image_cached(image, angle, step):
+    """
+    'image' rotated by 'angle' rounded to a multiple of 'step' degrees, from a cache of
+    the last ROTATION_CACHE_SIZE rotations. Returns (rotated image, rounded angle).
+
+    The cache holds the image itself next to its rotations, so an id() is never
+    reused for a different image while its entries are cached.
+    """
+    angle = round(angle / step) * step
+    key = (id(image), angle)
+    entry = _rotation_cache.get(key)
+    if entry is None:
+        entry = (image, pygame.transform.rotate(image, angle))
+        _rotation_cache[key] = entry
+        if len(_rotation_cache) > ROTATION_CACHE_SIZE:
+            _rotation_cache.popitem(last=False)
+    else:
+        _rotation_cache.move_to_end(key)
+    return entry[1], angle
+
+
+def scaled_image(image, scale):
+    """
+    'image' scaled by 'scale', computed once per image and scale.
+    """
+    key = (id(image), scale)
+    entry = _scale_cache.get(key)
+    if entry is None:
+        width, height = image.get_size()
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        entry = (image, pygame.transform.smoothscale(image, size))
+        _scale_cache[key] = entry
+    return entry[1]
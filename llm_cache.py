@@ -0,0 +1,227 @@
+# llm_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(current_dir, "cache", "llm_responses.db")
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_ENTRIES = 5000
+
+# BUNNY_LLM_MODE selects the chat model used by the agent:
+# - "cached": OpenAI behind the persistent response cache (default)
+# - "live":   OpenAI without the cache
+# - "replay": the local stand-in that only replays recorded responses, fully offline
+LLM_MODE_ENV = "BUNNY_LLM_MODE"
+LLM_CACHE_ENV = "BUNNY_LLM_CACHE"
+
+
+def _normalize_message(message):
+    # Only what the model actually sees; message ids and response metadata vary per run
+    data = message_to_dict(message)["data"]
+    content = data.get("content")
+    if isinstance(content, str):
+        content = "\n".join(line.rstrip() for line in content.strip().splitlines())
+    normalized = {"type": message.type, "content": content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        normalized["tool_calls"] = [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")} for call in tool_calls
+        ]
+    if getattr(message, "tool_call_id", None):
+        normalized["tool_call_id"] = message.tool_call_id
+    return normalized
+
+
+def make_key(model, temperature, messages, tools=None):
+    """
+    Cache key for a chat request: model, temperature, normalized messages and tool schema.
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [_normalize_message(m) for m in messages],
+        "tools": [convert_to_openai_tool(t) for t in tools or []],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        path: SQLite file holding the responses.
+        ttl: Seconds after which an entry is considered stale (None to never expire).
+        max_entries: Least recently used entries beyond this count are evicted.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def _connect(self):
+        # A connection per operation keeps the cache usable from ToolNode worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key, ignore_ttl=False):
+        """
+        Return the cached AIMessage for 'key', or None on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT message, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (not ignore_ttl and self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return messages_from_dict([json.loads(row[0])])[0]
+
+    def put(self, key, message, model=None):
+        """
+        Store an AIMessage under 'key' and evict expired and least recently used entries.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(message_to_dict(message)), now, now),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class CachedChatModel:
+    def __init__(self, chat, cache=None, tools=None):
+        """
+        Wrap a LangChain chat model so identical requests are answered from the cache.
+
+        chat: The underlying chat model, e.g. ChatOpenAI.
+        cache: An LLMResponseCache (a default one is created if omitted).
+        tools: Tools bound to the requests, use bind_tools instead of passing these.
+        """
+        self.chat = chat
+        self.cache = cache or LLMResponseCache()
+        self.tools = list(tools or [])
+        self.model_name = getattr(chat, "model_name", None) or getattr(chat, "model", None)
+        self.temperature = getattr(chat, "temperature", None)
+        self._bound = chat.bind_tools(self.tools) if self.tools else chat
+
+    def bind_tools(self, tools):
+        return CachedChatModel(self.chat, self.cache, tools)
+
+    def _key(self, messages):
+        return make_key(self.model_name, self.temperature, messages, self.tools)
+
+    def invoke(self, messages):
+        key = self._key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        message = self._bound.invoke(messages)
+        self.cache.put(key, message, self.model_name)
+        return message
+
+    async def ainvoke(self, messages):
+        key = self._key(messages)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+        message = await self._bound.ainvoke(messages)
+        await asyncio.to_thread(self.cache.put, key, message, self.model_name)
+        return message
+
+
+class ReplayChatModel:
+    def __init__(self, model_name, temperature, cache=None, tools=None, latency=0.0, fallback=None):
+        """
+        Local stand-in for the chat model that replays responses recorded in the cache.
+
+        It never touches the network, so an agent run that was recorded once with the
+        "cached" mode can be repeated offline and deterministically.
+
+        latency: Seconds to wait before answering, to mimic a remote model.
+        fallback: Optional callable(messages) -> str used for requests that were never
+                  recorded. Without it such a request raises a KeyError.
+        """
+        self.model_name = model_name
+        self.temperature = temperature
+        self.cache = cache or LLMResponseCache(ttl=None, max_entries=None)
+        self.tools = list(tools or [])
+        self.latency = latency
+        self.fallback = fallback
+
+    def bind_tools(self, tools):
+        return ReplayChatModel(self.model_name, self.temperature, self.cache, tools, self.latency, self.fallback)
+
+    def _respond(self, messages):
+        key = make_key(self.model_name, self.temperature, messages, self.tools)
+        message = self.cache.get(key, ignore_ttl=True)
+        if message is not None:
+            return message
+        if self.fallback is not None:
+            return AIMessage(content=self.fallback(messages))
+        raise KeyError(f"No recorded response for {self.model_name} request {key[:12]}.")
+
+    def invoke(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+def get_chat_model(model, temperature):
+    """
+    Return the chat model for the current BUNNY_LLM_MODE (see top of this module).
+    """
+    mode = os.environ.get(LLM_MODE_ENV, "cached")
+    cache_path = os.environ.get(LLM_CACHE_ENV, DEFAULT_CACHE_PATH)
+
+    if mode == "replay":
+        return ReplayChatModel(model, temperature, LLMResponseCache(cache_path, ttl=None, max_entries=None))
+
+    from langchain_openai import ChatOpenAI
+
+    chat = ChatOpenAI(model=model, temperature=temperature)
+    if mode == "live":
+        return chat
+    if mode != "cached":
+        raise ValueError(f"Unknown {LLM_MODE_ENV} '{mode}', expected 'cached', 'live' or 'replay'.")
+    return CachedChatModel(chat, LLMResponseCache(cache_path))
@@ -1,37 +1,48 @@
 import pygame
-import cv2
-import numpy as np
 from sprite import BunnySprite
 from config import *
 import json
 import os
 import time
-import ffmpeg
 
 def load_movement_sequence(file_path):
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def main():
+def main(profile=False, overlay=False, profile_out=None, memory=False,
+         movements_path='output/movements.json', music_file='assets/Dancing_D.wav', adaptive=True):
+    """
+    profile: Time every stage of every frame (see frame_profiler.py).
+    overlay: Show the rolling stage timings on screen (not in the recording), implies profile.
+    profile_out: File to export the frame timings to on exit, .csv or .json.
+    memory: Track the peak RSS of every stage and take tracemalloc snapshots (see memory_tracker.py).
+    movements_path: The movements.json to play.
+    music_file: The song played and muxed into the recording.
+    adaptive: Lower the render quality while frames overrun the budget (see quality_controller.py).
+              Only the preview adapts, a recording is always drawn at full quality.
+
+    cv2, numpy and ffmpeg are imported when the first recording starts or stops, so a
+    preview that never records opens its window without loading them. The song's
+    Vorbis track is prepared while the first recording runs and reused afterwards.
+    """
     pygame.init()
     screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     clock = pygame.time.Clock()
     
     pygame.mixer.init()
-    music_file = 'assets/Dancing_D.wav'
     pygame.mixer.music.load(music_file)
 
     bunny = BunnySprite(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 100)
     animation_manager = bunny.animation_manager
-    movement_sequence = load_movement_sequence('output/movements.json')
+    movement_sequence = load_movement_sequence(movements_path)
 
     output_dir = "output"
     os.makedirs(output_dir, exist_ok=True)
     temp_video_path = os.path.join(output_dir, "temp.mp4")
     final_video_path = os.path.join(output_dir, "output.webm")
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+
     out = None
+    audio_prepared = False
     recording = False
     recording_start_time = 0
 
@@ -39,51 +50,150 @@ def main():
         nonlocal recording, out
         if recording:
             pygame.mixer.music.stop()
+            print("Stopping all animations.")
             animation_manager.stop()
             out.release()
             
             recording_duration = time.time() - recording_start_time
-            
-            input_video = ffmpeg.input(temp_video_path)
-            input_audio = ffmpeg.input(music_file, t=recording_duration)
-            ffmpeg.output(input_video, input_audio, final_video_path,
-                         vcodec='libvpx', acodec='libvorbis').overwrite_output().run()
+
+            # The song was encoded to Vorbis once (see audio_cache.py), only the video is encoded here
+            from audio_cache import mux_cached_audio
+
+            mux_cached_audio(temp_video_path, music_file, final_video_path, recording_duration, vcodec='libvpx')
             os.remove(temp_video_path)
             recording = False
 
+    timer = tracker = profiler = None
+    if profile or overlay or profile_out or memory:
+        from frame_profiler import FrameProfiler, ProfilerGroup
+
+        timer = FrameProfiler(export_path=profile_out) if profile or overlay or profile_out else None
+        if memory:
+            from memory_tracker import MemoryTracker, animation_footprint, asset_footprint
+
+            tracker = MemoryTracker()
+            tracker.track("assets", lambda: asset_footprint(bunny))
+            tracker.track("animation_queues", lambda: animation_footprint(bunny))
+        profiler = ProfilerGroup(timer, tracker)
+
+    quality = None
+    if adaptive:
+        from quality_controller import QualityController
+
+        quality = QualityController()
+    low_res = None  # Render target of the reduced scale levels
+    frame_index = 0
+
     running = True
     while running:
+        if profiler:
+            profiler.start_frame()
         dt = clock.tick(FPS) / 1000.0
+        work_start = time.perf_counter()
+        if profiler:
+            profiler.mark("tick")
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 if not recording:
+                    import cv2
+                    import numpy as np
+
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
                     out = cv2.VideoWriter(temp_video_path, fourcc, FPS, (WINDOW_WIDTH, WINDOW_HEIGHT))
                     pygame.mixer.music.play()
                     animation_manager.load_sequences(movement_sequence)
                     recording = True
                     recording_start_time = time.time()
+                    if not audio_prepared:
+                        from audio_cache import prepare_audio_in_background
+
+                        prepare_audio_in_background(music_file, final_video_path)
+                        audio_prepared = True
                 else:
                     stop_recording()
 
-        screen.fill(BACKGROUND_COLOR)
+        if profiler:
+            profiler.mark("events")
+
+        # The animation always advances by the real dt, whatever the quality level
         bunny.update(dt)
-        bunny.draw(screen, debug=True)
-        pygame.display.flip()
+        if profiler:
+            profiler.mark("update")
+        # A recording pins full quality: every frame is drawn with the preview's settings
+        adapting = quality is not None and not recording
+        settings = quality.settings() if adapting else None
+        drawn = not adapting or quality.should_draw(frame_index)
+        if settings is None:
+            screen.fill(BACKGROUND_COLOR)
+            bunny.draw(screen, debug=True)
+        elif drawn and settings["scale"] == 1.0:
+            screen.fill(BACKGROUND_COLOR)
+            bunny.draw(screen, settings["debug"], settings["rotation_step"])
+        elif drawn:
+            size = (int(WINDOW_WIDTH * settings["scale"]), int(WINDOW_HEIGHT * settings["scale"]))
+            if low_res is None or low_res.get_size() != size:
+                low_res = pygame.Surface(size)
+            low_res.fill(BACKGROUND_COLOR)
+            bunny.draw(low_res, settings["debug"], settings["rotation_step"], settings["scale"])
+            pygame.transform.scale(low_res, (WINDOW_WIDTH, WINDOW_HEIGHT), screen)
+        if profiler:
+            profiler.mark("draw")
 
+        # Capture before the overlay and the flip so neither ends up in the recording
         if recording:
             string_image = pygame.image.tostring(screen, 'RGB')
             temp_surf = np.frombuffer(string_image, dtype=np.uint8)
             temp_surf = temp_surf.reshape((WINDOW_HEIGHT, WINDOW_WIDTH, 3))
             temp_surf = cv2.cvtColor(temp_surf, cv2.COLOR_RGB2BGR)
+            if profiler:
+                profiler.mark("capture")
             out.write(temp_surf)
-            
-            if not pygame.mixer.music.get_busy():
-                stop_recording()
+            if profiler:
+                profiler.mark("encode")
+            if tracker:
+                tracker.note("encoder", string_image, temp_surf)
+
+        if drawn:
+            if overlay:
+                timer.draw_overlay(screen)
+                profiler.mark("overlay")
+            pygame.display.flip()
+            if profiler:
+                profiler.mark("flip")
+
+        if recording and not pygame.mixer.music.get_busy():
+            stop_recording()
+        if adapting and quality.update(time.perf_counter() - work_start):
+            pygame.display.set_caption(f"Dancing bunny - quality: {quality.name}")
+        frame_index += 1
+        if profiler:
+            profiler.end_frame()
 
     pygame.quit()
 
+    if quality:
+        print(quality.report())
+    if timer:
+        print(timer.report())
+        if profile_out:
+            timer.export()
+            print(f"Frame timings written to '{profile_out}'.")
+    if tracker:
+        tracker.snapshot()
+        print(tracker.report())
+        tracker.stop()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play the choreography, press space to record.")
+    parser.add_argument("--profile", action="store_true", help="Time every stage of the render loop.")
+    parser.add_argument("--overlay", action="store_true", help="Show the stage timings on screen.")
+    parser.add_argument("--profile-out", help="Export the frame timings to this .csv or .json file.")
+    parser.add_argument("--memory", action="store_true", help="Track memory per stage and over time.")
+    parser.add_argument("--fixed-quality", action="store_true", help="Never lower the quality under load.")
+    args = parser.parse_args()
+    main(args.profile, args.overlay, args.profile_out, args.memory, adaptive=not args.fixed_quality)
\ No newline at end of file
@@ -0,0 +1,367 @@
+# memory_tracker.py
+
+import gc
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from config import FPS
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+SNAPSHOT_EVERY = 600  # Frames between tracemalloc snapshots (10 s at 60 FPS)
+WARMUP_FRAMES = 600  # Frames before the baseline snapshot, caches and queues fill up first
+SOAK_FRAMES = 6000  # A 100 s render at 60 FPS
+MAX_TRACED_GROWTH_KB = 256.0  # Python allocations allowed to grow between baseline and end
+MAX_RSS_GROWTH_KB = 8192.0  # Resident set allowed to grow, includes SDL and the encoder's native buffers
+
+
+def rss_kb():
+    """
+    Current resident set size of the process in KB.
+
+    Read from /proc/self/statm on Linux. Elsewhere only the peak RSS is available
+    (resource.getrusage), which still catches growth but never goes down.
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 if sys.platform == "darwin" else float(peak)
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Approximate memory of an object and everything it holds: containers and instance
+    attributes are followed, functions (animation callbacks) are counted but not the
+    objects their closures reference, which are usually the sprite itself.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not callable(obj):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def surface_bytes(surface):
+    # Pixel memory of a pygame surface, rows are padded to the pitch
+    return surface.get_pitch() * surface.get_height()
+
+
+def asset_footprint(bunny):
+    """
+    Bytes of the sprite's part images, each surface counted once. The images are
+    subsurfaces of the shared atlas, which is then counted once as a whole.
+    """
+    surfaces = {}
+    for image in bunny.images.values():
+        while image.get_parent() is not None:
+            image = image.get_parent()
+        surfaces[id(image)] = image
+    return sum(surface_bytes(image) for image in surfaces.values())
+
+
+def animation_footprint(bunny):
+    """
+    Bytes held by the animation queues: running part and body tweens, scheduled
+    actions and callbacks, and the manager's pending and current sequences.
+    """
+    manager = bunny.animation_manager
+    seen = set()
+    return sum(deep_sizeof(queue, seen) for queue in (
+        bunny.body_part_animations,
+        bunny.body_movements,
+        bunny.action_queue,
+        manager.queue,
+        manager.sequence,
+        manager.current_animation,
+    ))
+
+
+def buffer_bytes(buffer):
+    return buffer.nbytes if hasattr(buffer, "nbytes") else len(buffer)
+
+
+class MemoryTracker:
+    def __init__(self, snapshot_every=SNAPSHOT_EVERY, warmup=WARMUP_FRAMES, top=10):
+        """
+        Memory instrumentation for the render loop, marked like frame_profiler.FrameProfiler
+        (start_frame(), mark(stage) after every stage, end_frame()).
+
+        - Every mark reads the RSS, so every stage gets the peak RSS seen at its end and
+          the largest growth during a single run of it.
+        - After 'warmup' frames a tracemalloc snapshot is taken as the baseline, then one
+          every 'snapshot_every' frames. Every snapshot records the traced Python memory,
+          the RSS and the footprint of every tracked subsystem, and the latest one is
+          compared with the baseline by source line to find what grew.
+
+        tracemalloc slows every Python allocation down, use it for soak runs and
+        investigations, not for recordings.
+
+        Parameters:
+        - snapshot_every: Frames between snapshots.
+        - warmup: Frames before the baseline snapshot.
+        - top: Number of source lines reported by top_growth().
+        """
+        self.snapshot_every = snapshot_every
+        self.warmup = warmup
+        self.top = top
+        self.frames = 0
+        self.stages = {}  # stage -> {"peak_rss_kb", "max_growth_kb", "growth_kb"}
+        self.snapshots = []  # One {frame, seconds, traced_kb, rss_kb, subsystems} per snapshot
+        self.subsystems = {}  # name -> function returning bytes
+        self._buffers = {}
+        self._baseline = None
+        self._latest = None
+        self._rss = 0.0
+        self._start = time.perf_counter()
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def track(self, name, measure):
+        """
+        Report a subsystem's footprint at every snapshot: 'measure' returns its bytes.
+        """
+        self.subsystems[name] = measure
+
+    def note(self, name, *buffers):
+        """
+        Record the buffers a subsystem currently holds (bytes, arrays), only their size is
+        kept. The encoder's own native buffers are not visible from Python, the RSS
+        columns include them.
+        """
+        self._buffers[name] = sum(buffer_bytes(buffer) for buffer in buffers)
+
+    def start_frame(self):
+        self._rss = rss_kb()
+
+    def mark(self, stage):
+        rss = rss_kb()
+        growth = rss - self._rss
+        stats = self.stages.setdefault(stage, {"peak_rss_kb": 0.0, "max_growth_kb": 0.0, "growth_kb": 0.0})
+        stats["peak_rss_kb"] = max(stats["peak_rss_kb"], rss)
+        stats["max_growth_kb"] = max(stats["max_growth_kb"], growth)
+        stats["growth_kb"] += growth
+        self._rss = rss
+
+    def end_frame(self):
+        self.frames += 1
+        if self.frames == self.warmup or (
+                self.frames > self.warmup and (self.frames - self.warmup) % self.snapshot_every == 0):
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Take a tracemalloc snapshot now (the first one is the baseline) and return its record.
+        """
+        gc.collect()  # Only count memory that is actually still referenced
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),  # The tracker's own records
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if self._baseline is None:
+            self._baseline = snapshot
+        self._latest = snapshot
+        footprint = {name: measure() for name, measure in self.subsystems.items()}
+        footprint.update(self._buffers)
+        record = {
+            "frame": self.frames,
+            "seconds": time.perf_counter() - self._start,
+            "traced_kb": sum(stat.size for stat in snapshot.statistics("filename")) / 1024,
+            "rss_kb": rss_kb(),
+            "subsystems": {name: size / 1024 for name, size in footprint.items()},
+        }
+        self.snapshots.append(record)
+        return record
+
+    def growth(self):
+        """
+        Growth between the baseline and the latest snapshot: frames, traced and RSS KB in
+        total and per 1000 frames. None before two snapshots exist.
+        """
+        if len(self.snapshots) < 2:
+            return None
+        first, last = self.snapshots[0], self.snapshots[-1]
+        frames = last["frame"] - first["frame"]
+        traced = last["traced_kb"] - first["traced_kb"]
+        rss = last["rss_kb"] - first["rss_kb"]
+        return {
+            "frames": frames,
+            "traced_kb": traced,
+            "rss_kb": rss,
+            "traced_kb_per_1000_frames": traced * 1000 / frames if frames else 0.0,
+            "rss_kb_per_1000_frames": rss * 1000 / frames if frames else 0.0,
+        }
+
+    def top_growth(self, limit=None):
+        """
+        Source lines whose live allocations grew the most since the baseline, as
+        (location, size_diff_kb, count_diff).
+        """
+        if self._baseline is None or self._latest is self._baseline:
+            return []
+        rows = []
+        for stat in self._latest.compare_to(self._baseline, "lineno")[:limit or self.top]:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            location = f"{os.path.relpath(frame.filename, current_dir)}:{frame.lineno}"
+            rows.append((location, stat.size_diff / 1024, stat.count_diff))
+        return rows
+
+    def summary(self):
+        return {
+            "frames": self.frames,
+            "stages": self.stages,
+            "snapshots": self.snapshots,
+            "growth": self.growth(),
+            "top_growth": self.top_growth(),
+        }
+
+    def report(self):
+        """
+        Printable tables: peak RSS per stage, the snapshots with every subsystem's
+        footprint, the growth and the lines it comes from.
+        """
+        lines = [f"{self.frames} frames, {len(self.snapshots)} memory snapshots"]
+        for stage, s in self.stages.items():
+            lines.append(f"  {stage:<10} peak RSS {s['peak_rss_kb'] / 1024:8.1f}MB  "
+                         f"max growth {s['max_growth_kb']:8.1f}KB  total {s['growth_kb']:+9.1f}KB")
+        for record in self.snapshots:
+            subsystems = "  ".join(f"{name} {kb:.1f}KB" for name, kb in record["subsystems"].items())
+            lines.append(f"  frame {record['frame']:>6}: traced {record['traced_kb']:9.1f}KB  "
+                         f"RSS {record['rss_kb'] / 1024:7.1f}MB  {subsystems}")
+        growth = self.growth()
+        if growth:
+            lines.append(f"  growth over {growth['frames']} frames: traced {growth['traced_kb']:+.1f}KB, "
+                         f"RSS {growth['rss_kb']:+.1f}KB ({growth['traced_kb_per_1000_frames']:+.2f}KB traced "
+                         f"per 1000 frames)")
+        for location, size_kb, count in self.top_growth():
+            lines.append(f"    {location:<40} {size_kb:+9.1f}KB  {count:+d} blocks")
+        return "\n".join(lines)
+
+    def stop(self):
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# -------------------------
+# Soak test
+# -------------------------
+
+def soak(movements, frames=SOAK_FRAMES, fps=FPS, snapshot_every=SNAPSHOT_EVERY, warmup=WARMUP_FRAMES,
+         max_traced_growth_kb=MAX_TRACED_GROWTH_KB, max_rss_growth_kb=MAX_RSS_GROWTH_KB, encode=True, debug=True):
+    """
+    Render 'frames' frames of a choreography (repeated as often as needed) headless,
+    capturing and encoding every frame like a recording, and check that memory stops
+    growing once warmed up.
+
+    Returns (tracker, failures): the MemoryTracker with every snapshot, and a list of
+    reasons the soak failed (empty if it passed).
+    """
+    import tempfile
+
+    import cv2
+    import pygame
+
+    from config import WINDOW_HEIGHT, WINDOW_WIDTH
+    from offline_render import choreography_duration, init_headless, render_frames, surface_to_array
+    from sprite import BunnySprite
+
+    init_headless()
+    bunny = BunnySprite(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 100)
+    seconds = frames / fps
+    repeats = max(1, math.ceil(seconds / max(choreography_duration(movements), 1e-6)))
+
+    tracker = MemoryTracker(snapshot_every, warmup)
+    tracker.track("assets", lambda: asset_footprint(bunny))
+    tracker.track("animation_queues", lambda: animation_footprint(bunny))
+    writer = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if encode:
+            writer = cv2.VideoWriter(os.path.join(tmp, "soak.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                                     (WINDOW_WIDTH, WINDOW_HEIGHT))
+        try:
+            for index, surface in render_frames(list(movements) * repeats, fps, max_seconds=seconds, debug=debug,
+                                                tail_seconds=0.0, profiler=tracker, bunny=bunny):
+                if writer is None:
+                    continue
+                rgb = surface_to_array(surface)
+                frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+                tracker.mark("capture")
+                writer.write(frame)
+                tracker.mark("encode")
+                tracker.note("encoder", rgb, frame)
+        finally:
+            if writer is not None:
+                writer.release()
+            tracker.stop()
+
+    failures = []
+    growth = tracker.growth()
+    if growth is None:
+        failures.append(f"Only {tracker.frames} frames rendered, at least {warmup + snapshot_every} "
+                        f"are needed for two snapshots.")
+    else:
+        if growth["traced_kb"] > max_traced_growth_kb:
+            failures.append(f"Python allocations grew {growth['traced_kb']:.1f}KB over {growth['frames']} "
+                            f"frames (limit {max_traced_growth_kb:.0f}KB).")
+        if growth["rss_kb"] > max_rss_growth_kb:
+            failures.append(f"RSS grew {growth['rss_kb']:.1f}KB over {growth['frames']} frames "
+                            f"(limit {max_rss_growth_kb:.0f}KB).")
+    pygame.display.quit()
+    return tracker, failures
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import json
+
+        parser = argparse.ArgumentParser(description="Soak-test the renderer for memory growth.")
+        parser.add_argument("movements", nargs="?", default=os.path.join(current_dir, "output", "movements.json"))
+        parser.add_argument("--frames", type=int, default=SOAK_FRAMES, help="Frames to render.")
+        parser.add_argument("--warmup", type=int, default=WARMUP_FRAMES, help="Frames before the baseline snapshot.")
+        parser.add_argument("--snapshot-every", type=int, default=SNAPSHOT_EVERY)
+        parser.add_argument("--max-traced-growth-kb", type=float, default=MAX_TRACED_GROWTH_KB)
+        parser.add_argument("--max-rss-growth-kb", type=float, default=MAX_RSS_GROWTH_KB)
+        parser.add_argument("--no-encode", action="store_true", help="Render only, do not capture and encode.")
+        parser.add_argument("--no-debug", action="store_true", help="Do not draw the pivots and body rectangle.")
+        parser.add_argument("--output", help="Write the snapshots and stage peaks to this JSON file.")
+        args = parser.parse_args()
+
+        os.chdir(current_dir)  # The sprite loads its images from relative paths
+        with open(args.movements, "r", encoding="utf-8") as f:
+            movements = json.load(f)
+        start = time.perf_counter()
+        tracker, failures = soak(movements, args.frames, snapshot_every=args.snapshot_every, warmup=args.warmup,
+                                 max_traced_growth_kb=args.max_traced_growth_kb,
+                                 max_rss_growth_kb=args.max_rss_growth_kb, encode=not args.no_encode,
+                                 debug=not args.no_debug)
+        print(tracker.report())
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({**tracker.summary(), "failures": failures}, f, indent=2)
+        print(f"Soak {'FAILED' if failures else 'passed'} in {time.perf_counter() - start:.1f}s.")
+        for failure in failures:
+            print(f"  {failure}")
+        if failures:
+            sys.exit(1)
+
+    main()
@@ -0,0 +1,250 @@
+# moveset_library.py
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LIBRARY_PATH = os.path.join(current_dir, "output", "moveset_library.jsonl")
+
+# Actions the BunnySprite understands, see the generate_movesets prompt
+KNOWN_ACTIONS = {
+    "move_vertical", "move_horizontal", "rotate_head",
+    "raise_left_arm", "lower_left_arm", "raise_right_arm", "lower_right_arm",
+    "raise_left_leg", "lower_left_leg", "raise_right_leg", "lower_right_leg",
+    "rest",
+}
+
+# Weights of the log-energy and log-tempo axes of the feature space
+ENERGY_WEIGHT = 1.0
+TEMPO_WEIGHT = 2.0
+MAX_DISTANCE = 0.3  # Farther neighbours count as a miss
+MIN_MATCHES = 2  # Fewer close movesets than this give a phrase too little variety
+
+
+def validate_moveset(moveset):
+    """
+    Raise ValueError unless the moveset is well formed, every block has a positive
+    duration and only known actions are used.
+    """
+    if not isinstance(moveset, dict):
+        raise ValueError(f"A moveset must be an object, not {type(moveset).__name__}.")
+    sequences = moveset.get("sequences")
+    if not isinstance(sequences, list) or not sequences:
+        raise ValueError(f"Moveset '{moveset.get('name')}' has no 'sequences' list.")
+    for block in sequences:
+        if not isinstance(block, dict):
+            raise ValueError(f"Moveset '{moveset.get('name')}' has a block that is not an object.")
+        duration = block.get("duration")
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration <= 0:
+            raise ValueError(f"Moveset '{moveset.get('name')}' has a block without a positive duration.")
+        actions = block.get("actions")
+        if actions in (None, "rest"):
+            continue
+        if not isinstance(actions, dict):
+            raise ValueError(f"Moveset '{moveset.get('name')}' has 'actions' that are not an object.")
+        for part, params in actions.items():
+            if not isinstance(params, dict) or not isinstance(params.get("params", {}), dict):
+                raise ValueError(f"Moveset '{moveset.get('name')}' has a malformed action for '{part}'.")
+            if params.get("action") not in KNOWN_ACTIONS:
+                raise ValueError(f"Moveset '{moveset.get('name')}' uses unknown action '{params.get('action')}'.")
+
+
+def moveset_style(moveset):
+    """
+    Coarse style tag from the actions a moveset uses: jump, walk, arms, legs or head.
+    """
+    counts = {"jump": 0, "walk": 0, "arms": 0, "legs": 0, "head": 0}
+    for block in moveset.get("sequences", []):
+        actions = block.get("actions")
+        if not isinstance(actions, dict):
+            continue
+        for params in actions.values():
+            action = params.get("action", "")
+            if action == "move_vertical":
+                counts["jump"] += 1
+            elif action == "move_horizontal":
+                counts["walk"] += 1
+            elif action.endswith("_arm"):
+                counts["arms"] += 1
+            elif action.endswith("_leg"):
+                counts["legs"] += 1
+            elif action == "rotate_head":
+                counts["head"] += 1
+    # Body movement defines the style even when limbs move more often
+    for style in ("jump", "walk"):
+        if counts[style]:
+            return style
+    return max(counts, key=counts.get) if any(counts.values()) else "rest"
+
+
+def _duration(moveset):
+    return sum(block["duration"] for block in moveset["sequences"])
+
+
+def time_scale(moveset, factor):
+    """
+    Return a copy of a moveset with every block duration multiplied by 'factor'.
+    """
+    return {
+        **moveset,
+        "sequences": [
+            {**block, "duration": round(block["duration"] * factor, 4)} for block in moveset["sequences"]
+        ],
+    }
+
+
+class MovesetLibrary:
+    def __init__(self, path=DEFAULT_LIBRARY_PATH):
+        """
+        Persistent library of validated movesets with their (energy, tempo, duration,
+        style) features and an in-memory nearest-neighbour index over them.
+
+        path: JSON-lines file, one moveset entry per line.
+        """
+        self.path = path
+        self.entries = []
+        self._hashes = set()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.append(entry)
+                        self._hashes.add(entry["hash"])
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        # Feature matrix of (log energy, log tempo), scaled so Euclidean distance weighs both
+        if self.entries:
+            energy = np.array([max(e["energy"], 1e-6) for e in self.entries])
+            tempo = np.array([max(e["tempo"], 1e-6) for e in self.entries])
+            self._features = np.column_stack([ENERGY_WEIGHT * np.log(energy), TEMPO_WEIGHT * np.log(tempo)])
+        else:
+            self._features = np.zeros((0, 2))
+        self._styles = np.array([e["style"] for e in self.entries], dtype=object)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, moveset, energy, tempo, style=None):
+        """
+        Validate a moveset and store it with its features. Duplicates are ignored.
+
+        Returns True if the moveset was added.
+        """
+        validate_moveset(moveset)
+        digest = hashlib.sha256(json.dumps(moveset, sort_keys=True).encode("utf-8")).hexdigest()
+        if digest in self._hashes:
+            return False
+
+        entry = {
+            "hash": digest,
+            "energy": float(energy),
+            "tempo": float(tempo),
+            "duration": _duration(moveset),
+            "style": style or moveset_style(moveset),
+            "moveset": moveset,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.entries.append(entry)
+        self._hashes.add(digest)
+        self._rebuild_index()
+        return True
+
+    def query(self, energy, tempo, k=3, style=None, exclude=()):
+        """
+        Return up to k (entry, distance) pairs nearest to the given energy and tempo.
+
+        style: Only consider movesets of this style.
+        exclude: Hashes of entries to skip, e.g. movesets already used in this song.
+        """
+        if not self.entries:
+            return []
+        target = np.array([ENERGY_WEIGHT * np.log(max(energy, 1e-6)), TEMPO_WEIGHT * np.log(max(tempo, 1e-6))])
+        distances = np.sqrt(((self._features - target) ** 2).sum(axis=1))
+        mask = np.ones(len(self.entries), dtype=bool)
+        if style is not None:
+            mask &= self._styles == style
+        if exclude:
+            mask &= np.array([e["hash"] not in exclude for e in self.entries])
+        candidates = np.flatnonzero(mask)
+        order = candidates[np.argsort(distances[candidates], kind="stable")[:k]]
+        return [(self.entries[i], float(distances[i])) for i in order]
+
+    def retrieve(self, energy, tempo, k=3, max_distance=MAX_DISTANCE, style=None, exclude=(), min_matches=1):
+        """
+        Look up movesets for a phrase and time-scale them to its tempo.
+
+        Returns a list of (hash, moveset) pairs, empty on a miss (fewer than min_matches
+        neighbours within max_distance). Hit rate and lookup latency are recorded for
+        stats(), so a caller that needs several movesets passes its minimum here.
+        """
+        start = time.perf_counter()
+        matches = [
+            (entry, distance) for entry, distance in self.query(energy, tempo, k, style, exclude)
+            if distance <= max_distance
+        ]
+        if len(matches) < min_matches:
+            matches = []
+        # A moveset written for tempo T keeps its beat alignment at tempo T' when its
+        # durations are scaled by T / T'
+        result = [(entry["hash"], time_scale(entry["moveset"], entry["tempo"] / tempo)) for entry, _ in matches]
+        self.lookup_seconds.append(time.perf_counter() - start)
+        if result:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return result
+
+    def stats(self):
+        """
+        Library size, hit rate and lookup latency of this session.
+        """
+        lookups = self.hits + self.misses
+        latencies = np.array(self.lookup_seconds) * 1000
+        return {
+            "entries": len(self.entries),
+            "lookups": lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_lookup_ms": float(latencies.mean()) if lookups else 0.0,
+            "max_lookup_ms": float(latencies.max()) if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Inspect the moveset library.")
+        parser.add_argument("--library", default=DEFAULT_LIBRARY_PATH)
+        parser.add_argument("--energy", type=float, help="Query the movesets nearest to this energy.")
+        parser.add_argument("--tempo", type=float, default=85.0)
+        parser.add_argument("-k", type=int, default=5)
+        args = parser.parse_args()
+
+        library = MovesetLibrary(args.library)
+        styles = {}
+        for entry in library.entries:
+            styles[entry["style"]] = styles.get(entry["style"], 0) + 1
+        print(f"{len(library)} movesets in '{args.library}': {styles}")
+
+        if args.energy is not None:
+            start = time.perf_counter()
+            matches = library.query(args.energy, args.tempo, args.k)
+            elapsed = (time.perf_counter() - start) * 1000
+            for entry, distance in matches:
+                print(f"{distance:.3f}  energy {entry['energy']:.4f}  tempo {entry['tempo']:.1f}  "
+                      f"{entry['duration']:.2f}s  {entry['style']:<5} {entry['moveset'].get('name', 'Unnamed')}")
+            print(f"Query took {elapsed:.2f}ms.")
+
+    main()
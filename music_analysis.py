@@ -0,0 +1,539 @@
+# music_analysis.py
+
+import time
+
+import librosa
+import numpy as np
+
+import analysis_cache
+
+# Bump whenever the analysis below changes in a way that alters its results,
+# so stale cache entries are ignored.
+ANALYSIS_VERSION = 4
+
+PHRASE_LENGTH = 16  # Number of beats per phrase
+BEATS_PER_BAR = 4
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+
+# Analysis fidelity tiers: sample rate (None keeps the native rate), resampler and
+# STFT geometry. 'fast' is meant for interactive iteration, 'high' for final renders.
+ANALYSIS_TIERS = {
+    "fast": {"sr": 11025, "res_type": "soxr_qq", "frame_length": 512, "hop_length": 256},
+    "standard": {"sr": 22050, "res_type": "soxr_hq", "frame_length": 2048, "hop_length": 512},
+    "high": {"sr": None, "res_type": "soxr_vhq", "frame_length": 2048, "hop_length": 256},
+}
+DEFAULT_TIER = "standard"
+
+
+# -------------------------
+# Feature Pipeline
+# -------------------------
+
+class Spectrogram:
+    """
+    A single STFT of the signal that every feature is derived from.
+
+    The power and log-mel views are computed on first use and then shared, so adding a
+    feature does not add another pass over the audio.
+    """
+
+    def __init__(self, y, sr, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+        self.sr = sr
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.magnitude = np.abs(librosa.stft(y, n_fft=frame_length, hop_length=hop_length))
+        self._power = None
+        self._mel_db = None
+
+    @property
+    def n_frames(self):
+        return self.magnitude.shape[1]
+
+    @property
+    def power(self):
+        if self._power is None:
+            self._power = self.magnitude ** 2
+        return self._power
+
+    @property
+    def mel_db(self):
+        if self._mel_db is None:
+            mel = librosa.feature.melspectrogram(S=self.power, sr=self.sr)
+            self._mel_db = librosa.power_to_db(mel)
+        return self._mel_db
+
+
+# Frame-wise features computed from the shared spectrogram, each returning an array
+# with the frame axis last. Add an entry here to make a feature available to the agent.
+FEATURE_EXTRACTORS = {
+    "onset_env": lambda spec: librosa.onset.onset_strength(S=spec.mel_db, sr=spec.sr),
+    "rms": lambda spec: librosa.feature.rms(S=spec.magnitude, frame_length=spec.frame_length)[0],
+    "spectral_centroid": lambda spec: librosa.feature.spectral_centroid(S=spec.magnitude, sr=spec.sr)[0],
+    "chroma": lambda spec: librosa.feature.chroma_stft(S=spec.power, sr=spec.sr),
+}
+
+DEFAULT_FEATURES = ("onset_env", "rms", "spectral_centroid", "chroma")
+
+
+def extract_features(y, sr, features=DEFAULT_FEATURES, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    Compute the STFT once and derive beats and the requested features from it.
+
+    Every frame-wise feature is aligned on the same frame grid ('frame_times'), and for
+    each feature a beat-synchronous mean ('beat_<name>') is added, one column per beat.
+
+    Parameters:
+    - y, sr: Audio signal and its sample rate.
+    - features: Names of entries in FEATURE_EXTRACTORS to compute.
+    - frame_length, hop_length: STFT frame and hop size in samples.
+    """
+    spec = Spectrogram(y, sr, frame_length, hop_length)
+
+    # Beat tracking always needs the onset envelope
+    names = list(dict.fromkeys(("onset_env",) + tuple(features)))
+    result = {}
+    for name in names:
+        if name not in FEATURE_EXTRACTORS:
+            raise ValueError(f"Unknown feature '{name}'.")
+        values = FEATURE_EXTRACTORS[name](spec)
+        result[name] = np.asarray(values[..., :spec.n_frames], dtype=np.float32)
+
+    tempo, beats = librosa.beat.beat_track(
+        onset_envelope=result["onset_env"], sr=sr, hop_length=hop_length
+    )
+    result["tempo"] = np.asarray(tempo, dtype=np.float64).reshape(())
+    result["beat_frames"] = np.asarray(beats, dtype=np.int64)
+    result["beat_times"] = librosa.frames_to_time(beats, sr=sr, hop_length=hop_length).astype(np.float64)
+    result["frame_times"] = librosa.frames_to_time(
+        np.arange(spec.n_frames), sr=sr, hop_length=hop_length
+    ).astype(np.float64)
+
+    # Beat-synchronous means: column i covers the frames between beat i and beat i+1
+    if len(beats):
+        for name in names:
+            synced = librosa.util.sync(result[name], beats, aggregate=np.mean, pad=False)
+            result[f"beat_{name}"] = np.asarray(synced, dtype=np.float32)
+    return result
+
+
+def segment_stats(values, boundaries):
+    """
+    Mean, max and variance of 'values' over each frame segment [boundaries[i], boundaries[i+1]).
+
+    Uses prefix sums and ufunc.reduceat, so the cost does not depend on the number of
+    segments being reduced in Python.
+
+    Returns (mean, max, var) arrays with len(boundaries) - 1 entries.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    boundaries = np.clip(np.asarray(boundaries, dtype=np.int64), 0, len(values))
+    if len(boundaries) < 2:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty.copy(), empty.copy()
+
+    starts, ends = boundaries[:-1], boundaries[1:]
+    counts = np.maximum(ends - starts, 1)
+
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    csum_sq = np.concatenate([[0.0], np.cumsum(values ** 2)])
+    mean = (csum[ends] - csum[starts]) / counts
+    var = np.maximum((csum_sq[ends] - csum_sq[starts]) / counts - mean ** 2, 0.0)
+
+    # reduceat over interleaved (start, end) pairs, keeping only the start reductions;
+    # the sentinel keeps end == len(values) a valid index
+    padded = np.append(values, -np.inf)
+    pairs = np.column_stack([starts, ends]).ravel()
+    peak = np.maximum.reduceat(padded, pairs)[::2]
+    return mean, peak, var
+
+
+def beat_sync_stats(rms, beat_frames, frame_times, phrase_length=PHRASE_LENGTH, beats_per_bar=BEATS_PER_BAR):
+    """
+    Aggregate the RMS curve per beat, per bar and per phrase on frame indices.
+
+    Beat i spans the frames from beat i to beat i+1. Bars and phrases are built from
+    every 'beats_per_bar'-th and 'phrase_length'-th beat, and only complete ones are
+    kept, i.e. the beat that closes them must have been detected.
+
+    Returns a dict of arrays: {beat,bar,phrase}_energy_{mean,max,var}, phrase_start,
+    phrase_end, phrase_beats and phrase_energy (the phrase mean).
+    """
+    beat_frames = np.asarray(beat_frames, dtype=np.int64)
+    result = {}
+    for level, step in (("beat", 1), ("bar", beats_per_bar), ("phrase", phrase_length)):
+        mean, peak, var = segment_stats(rms, beat_frames[::step])
+        result[f"{level}_energy_mean"] = mean
+        result[f"{level}_energy_max"] = peak
+        result[f"{level}_energy_var"] = var
+
+    phrase_bounds = beat_frames[::phrase_length]
+    num_phrases = max(len(phrase_bounds) - 1, 0)
+    frame_times = np.asarray(frame_times, dtype=np.float64)
+    result["phrase_start"] = frame_times[phrase_bounds[:num_phrases]]
+    result["phrase_end"] = frame_times[phrase_bounds[1:num_phrases + 1]]
+    result["phrase_beats"] = np.full(num_phrases, phrase_length, dtype=np.int64)
+    result["phrase_energy"] = result["phrase_energy_mean"]
+    return result
+
+
+def load_audio(filepath, tier=DEFAULT_TIER):
+    """
+    Load an audio file as mono at the sample rate of the given analysis tier.
+    """
+    if tier not in ANALYSIS_TIERS:
+        raise ValueError(f"Unknown analysis tier '{tier}', expected one of {sorted(ANALYSIS_TIERS)}.")
+    settings = ANALYSIS_TIERS[tier]
+    return librosa.load(filepath, sr=settings["sr"], mono=True, res_type=settings["res_type"])
+
+
+def analyze_track(filepath, phrase_length=PHRASE_LENGTH, beats_per_bar=BEATS_PER_BAR,
+                  features=DEFAULT_FEATURES, tier=DEFAULT_TIER):
+    """
+    Run beat tracking and feature extraction on an audio file.
+
+    Parameters:
+    - filepath: Path to the audio file.
+    - tier: Analysis fidelity, one of ANALYSIS_TIERS.
+    - phrase_length: Number of beats per phrase.
+    - beats_per_bar: Number of beats per bar.
+    - features: Frame-wise features to extract, see FEATURE_EXTRACTORS.
+
+    Returns a dict of NumPy arrays:
+    - tier, sr, hop_length: The tier used and its analysis grid (0-d arrays).
+    - tempo: Global tempo in BPM (0-d array).
+    - beat_frames, beat_times: Beat positions as frame indices and in seconds.
+    - frame_times: Time of every analysis frame.
+    - rms and the other requested features on that frame grid, plus their
+      beat-synchronous means as 'beat_<name>'.
+    - beat_energy_*, bar_energy_*, phrase_energy_*: Energy statistics, see beat_sync_stats.
+    - phrase_start, phrase_end: Phrase boundaries in seconds.
+    - phrase_beats: Number of beats in each phrase.
+    - phrase_energy: Average energy of each phrase.
+    """
+    y, sr = load_audio(filepath, tier)
+    settings = ANALYSIS_TIERS[tier]
+
+    result = extract_features(
+        y, sr, features=features,
+        frame_length=settings["frame_length"], hop_length=settings["hop_length"],
+    )
+    result["tier"] = np.asarray(tier)
+    result["sr"] = np.asarray(sr, dtype=np.int64)
+    result["hop_length"] = np.asarray(settings["hop_length"], dtype=np.int64)
+    result.update(beat_sync_stats(
+        result["rms"], result["beat_frames"], result["frame_times"],
+        phrase_length=phrase_length, beats_per_bar=beats_per_bar,
+    ))
+    return result
+
+
+def analyze_track_cached(filepath, phrase_length=PHRASE_LENGTH, beats_per_bar=BEATS_PER_BAR,
+                         features=DEFAULT_FEATURES, tier=DEFAULT_TIER, use_cache=True):
+    """
+    Same as analyze_track, but results are stored in the on-disk analysis cache
+    keyed by the file's content hash and the analysis parameters.
+    """
+    params = {
+        "phrase_length": phrase_length,
+        "beats_per_bar": beats_per_bar,
+        "features": list(features),
+        "tier": tier,
+    }
+    if not use_cache:
+        return analyze_track(filepath, **params)
+
+    key = analysis_cache.cache_key(filepath, params, ANALYSIS_VERSION)
+    result = analysis_cache.load(key)
+    if result is None:
+        result = analyze_track(filepath, **params)
+        analysis_cache.store(key, result)
+    return result
+
+
+def _nearest_offsets(times, candidates):
+    # Distance from every entry of 'times' to the nearest entry of the sorted 'candidates'
+    idx = np.searchsorted(candidates, times)
+    left = candidates[np.clip(idx - 1, 0, len(candidates) - 1)]
+    right = candidates[np.clip(idx, 0, len(candidates) - 1)]
+    return np.minimum(np.abs(times - left), np.abs(times - right))
+
+
+def compare_beats(reference, estimate, tolerance=0.07):
+    """
+    Compare two sets of beat times (in seconds).
+
+    Returns a dict with the F-measure of beats matched within 'tolerance' seconds and
+    the mean/max absolute offset from each reference beat to its nearest estimate.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    estimate = np.asarray(estimate, dtype=np.float64)
+    if len(reference) == 0 or len(estimate) == 0:
+        return {"f_measure": 0.0, "mean_offset": float("nan"), "max_offset": float("nan")}
+
+    ref_offset = _nearest_offsets(reference, estimate)
+    est_offset = _nearest_offsets(estimate, reference)
+
+    recall = float(np.mean(ref_offset <= tolerance))
+    precision = float(np.mean(est_offset <= tolerance))
+    f_measure = 0.0 if recall + precision == 0 else 2 * precision * recall / (precision + recall)
+    return {
+        "f_measure": f_measure,
+        "mean_offset": float(np.mean(ref_offset)),
+        "max_offset": float(np.max(ref_offset)),
+    }
+
+
+def benchmark_tiers(filepath, tiers=tuple(ANALYSIS_TIERS), reference="high", repeats=1):
+    """
+    Time every analysis tier on a file and compare its beats against the reference tier.
+
+    The first run of each tier is treated as warm-up when repeats > 1.
+
+    Returns {tier: {"seconds", "tempo", "beats", "f_measure", "mean_offset", "max_offset"}}.
+    """
+    results = {}
+    for tier in dict.fromkeys(tuple(tiers) + (reference,)):
+        timings = []
+        for _ in range(max(repeats, 1)):
+            start = time.perf_counter()
+            analysis = analyze_track(filepath, tier=tier)
+            timings.append(time.perf_counter() - start)
+        results[tier] = {
+            "seconds": min(timings[1:] or timings),
+            "tempo": float(analysis["tempo"]),
+            "beats": len(analysis["beat_times"]),
+            "beat_times": analysis["beat_times"],
+        }
+
+    reference_beats = results[reference]["beat_times"]
+    for tier, entry in results.items():
+        entry.update(compare_beats(reference_beats, entry.pop("beat_times")))
+    return results
+
+
+def phrase_table(analysis):
+    """
+    Return the phrases of an analysis result as a list of dicts, in the same shape as
+    the phrases yielded by stream_phrases.
+    """
+    tempo = float(analysis["tempo"])
+    return [
+        {
+            "index": i,
+            "start_time": float(start_time),
+            "end_time": float(end_time),
+            "beats": int(beats),
+            "tempo": tempo,
+            "energy": float(energy),
+        }
+        for i, (start_time, end_time, beats, energy) in enumerate(zip(
+            analysis["phrase_start"],
+            analysis["phrase_end"],
+            analysis["phrase_beats"],
+            analysis["phrase_energy"],
+        ))
+    ]
+
+
+def describe_phrase(index, start_time, end_time, beats, tempo, energy):
+    """
+    Format a single phrase as the text line handed to the agent.
+    """
+    return (
+        f"Phrase {index+1}: "
+        f"Starts at {start_time:.2f}s, "
+        f"lasts for {end_time - start_time:.2f}s, "
+        f"beats: {int(beats)}, "
+        f"tempo: {tempo:.2f} BPM, "
+        f"average energy: {energy:.4f}."
+    )
+
+
+def describe_phrases(analysis):
+    """
+    Format the phrase table of an analysis result as the text lines handed to the agent.
+    """
+    tempo = float(analysis["tempo"])
+    return [
+        describe_phrase(i, start_time, end_time, beats, tempo, energy)
+        for i, (start_time, end_time, beats, energy) in enumerate(zip(
+            analysis["phrase_start"],
+            analysis["phrase_end"],
+            analysis["phrase_beats"],
+            analysis["phrase_energy"],
+        ))
+    ]
+
+
+# -------------------------
+# Streaming Analysis
+# -------------------------
+
+def stream_phrases(filepath, phrase_length=PHRASE_LENGTH, block_length=256,
+                   frame_length=2048, hop_length=512, window_seconds=8.0):
+    """
+    Analyze an audio file block by block and yield phrases as soon as they are final.
+
+    Only 'window_seconds' of onset envelope and energy are kept in memory, so long
+    recordings (e.g. hour-long DJ mixes) are analyzed with bounded memory. The tempo is
+    re-estimated on every block from that window, and beats are placed by predicting the
+    next beat one period ahead and snapping it to the strongest onset nearby.
+
+    Parameters:
+    - filepath: Path to the audio file.
+    - phrase_length: Number of beats per phrase.
+    - block_length: Number of frames read per block.
+    - frame_length, hop_length: STFT frame and hop size in samples.
+    - window_seconds: Length of the onset history used for tempo estimation.
+
+    Yields dicts with index, start_time, end_time, beats, tempo and energy. No phrase
+    ends after the end of the track.
+    """
+    sr = librosa.get_samplerate(filepath)
+    # Read from the file header; the last block is padded with silence and frame times
+    # are frame centres, so beats flushed at the end can land past the last sample
+    total_duration = float(librosa.get_duration(path=filepath))
+    stream = librosa.stream(
+        filepath,
+        block_length=block_length,
+        frame_length=frame_length,
+        hop_length=hop_length,
+        mono=True,
+        fill_value=0,
+    )
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=frame_length)
+    window_frames = max(int(window_seconds * sr / hop_length), 1)
+
+    # Rolling buffers, buffer[0] corresponds to global frame 'offset'
+    onset_buf = np.zeros(0, dtype=np.float32)
+    cumsum_buf = np.zeros(0, dtype=np.float64)  # Running sum of RMS up to each frame
+    offset = 0
+    frame_count = 0
+    rms_total = 0.0
+    prev_mel = None
+
+    tempo = None
+    period = None
+    next_beat = None
+    phrase_beats = []  # (frame, rms cumsum) of the beats in the current phrase
+    phrase_index = 0
+
+    def frame_time(frame):
+        return float(librosa.frames_to_time(frame, sr=sr, hop_length=hop_length, n_fft=frame_length))
+
+    def finalize_beat(frame):
+        nonlocal phrase_index, phrase_beats
+        phrase_beats.append((frame, cumsum_buf[frame - offset]))
+        if len(phrase_beats) <= phrase_length:
+            return None
+        (start_frame, start_sum), (end_frame, end_sum) = phrase_beats[0], phrase_beats[-1]
+        phrase = {
+            "index": phrase_index,
+            "start_time": frame_time(start_frame),
+            "end_time": min(frame_time(end_frame), total_duration),
+            "beats": phrase_length,
+            "tempo": float(tempo),
+            "energy": float((end_sum - start_sum) / max(end_frame - start_frame, 1)),
+        }
+        phrase_index += 1
+        phrase_beats = [phrase_beats[-1]]
+        return phrase
+
+    def pick_beats(available):
+        # Place every beat whose search window lies entirely inside the received frames
+        nonlocal next_beat
+        tolerance = max(int(round(period / 4)), 1)
+        while next_beat + tolerance < available and int(round(next_beat)) < frame_count:
+            lo = max(int(round(next_beat)) - tolerance, offset)
+            hi = min(int(round(next_beat)) + tolerance + 1, frame_count)
+            segment = onset_buf[lo - offset:hi - offset]
+            if segment.size and segment.max() > 0:
+                beat = lo + int(np.argmax(segment))
+            else:
+                beat = int(round(next_beat))
+            next_beat = beat + period
+            phrase = finalize_beat(beat)
+            if phrase is not None:
+                yield phrase
+
+    for y_block in stream:
+        S = np.abs(librosa.stft(y_block, n_fft=frame_length, hop_length=hop_length, center=False))
+        if S.shape[1] == 0:
+            continue
+
+        # Spectral flux on a fixed dB scale, carried across block boundaries
+        mel = librosa.power_to_db(mel_basis @ S**2, ref=1.0, top_db=None)
+        if prev_mel is None:
+            prev_mel = mel[:, :1]
+        flux = np.maximum(0.0, np.diff(np.hstack([prev_mel, mel]), axis=1)).mean(axis=0)
+        prev_mel = mel[:, -1:]
+
+        rms = librosa.feature.rms(S=S, frame_length=frame_length)[0]
+        cumsum = rms_total + np.cumsum(rms, dtype=np.float64)
+        rms_total = cumsum[-1]
+
+        onset_buf = np.concatenate([onset_buf, flux.astype(np.float32)])
+        cumsum_buf = np.concatenate([cumsum_buf, cumsum])
+        frame_count += S.shape[1]
+
+        if len(onset_buf) >= window_frames:
+            estimate = librosa.feature.tempo(
+                onset_envelope=onset_buf[-window_frames:], sr=sr, hop_length=hop_length
+            )[0]
+            if estimate > 0:
+                tempo = estimate
+                period = 60.0 * sr / (hop_length * tempo)
+            if period is not None and next_beat is None:
+                first = onset_buf[:int(period) + 1]
+                next_beat = offset + int(np.argmax(first))
+
+        if period is not None:
+            yield from pick_beats(frame_count)
+
+        # Drop history that no beat search or tempo estimate will look at again
+        keep_from = frame_count - window_frames
+        if next_beat is not None:
+            keep_from = min(keep_from, int(next_beat) - int(period))
+        keep_from = max(keep_from, offset)
+        onset_buf = onset_buf[keep_from - offset:]
+        cumsum_buf = cumsum_buf[keep_from - offset:]
+        offset = keep_from
+
+    # Tracks shorter than the tempo window still get a tempo estimate
+    if period is None and len(onset_buf):
+        estimate = librosa.feature.tempo(onset_envelope=onset_buf, sr=sr, hop_length=hop_length)[0]
+        if estimate > 0:
+            tempo = estimate
+            period = 60.0 * sr / (hop_length * tempo)
+            next_beat = offset + int(np.argmax(onset_buf[:int(period) + 1]))
+    if period is not None:
+        # Flush beats near the end of the track with a truncated search window
+        yield from pick_beats(frame_count + max(int(round(period / 4)), 1))
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Analyze a music file or benchmark the analysis tiers.")
+        parser.add_argument("filepath")
+        parser.add_argument("--tier", default=DEFAULT_TIER, choices=sorted(ANALYSIS_TIERS))
+        parser.add_argument("--phrase-length", type=int, default=PHRASE_LENGTH)
+        parser.add_argument("--benchmark-tiers", action="store_true",
+                            help="Time every tier and compare its beats against the 'high' tier.")
+        parser.add_argument("--repeats", type=int, default=2)
+        args = parser.parse_args()
+
+        if args.benchmark_tiers:
+            results = benchmark_tiers(args.filepath, repeats=args.repeats)
+            print(f"{'tier':<10}{'seconds':>10}{'tempo':>10}{'beats':>8}{'F':>8}{'mean off':>10}{'max off':>10}")
+            for tier, r in results.items():
+                print(f"{tier:<10}{r['seconds']:>10.3f}{r['tempo']:>10.2f}{r['beats']:>8}"
+                      f"{r['f_measure']:>8.3f}{r['mean_offset']:>10.4f}{r['max_offset']:>10.4f}")
+            return
+
+        analysis = analyze_track_cached(args.filepath, phrase_length=args.phrase_length, tier=args.tier)
+        print("\n".join(describe_phrases(analysis)))
+
+    main()
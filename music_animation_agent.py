@@ -18,7 +18,8 @@ from langchain.output_parsers import PydanticOutputParser
 # -------------------------
 # Pydantic Models
 # -------------------------
-langchain.debug=True
+# Verbose chain logging costs time on every call, BUNNY_LANGCHAIN_DEBUG=1 turns it on
+langchain.debug = os.environ.get("BUNNY_LANGCHAIN_DEBUG") == "1"
 
 class MusicPhrase(BaseModel):
     start_time: float
@@ -5,20 +5,26 @@ import operator
 import os
 from typing import Annotated, List, Literal, TypedDict, Optional, Dict, Any
 from pydantic import BaseModel, Field, ValidationError
-import librosa
-import numpy as np
 import langchain
-from langchain_core.messages import SystemMessage, HumanMessage, AnyMessage
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, AnyMessage
+from langchain_core.tools import InjectedToolCallId, tool
 from langgraph.graph import END, StateGraph, MessagesState
 from langgraph.prebuilt import ToolNode
 from langchain.output_parsers import PydanticOutputParser
+from music_analysis import analyze_track_cached, describe_phrases, phrase_table
+from coverage_planner import parse_movesets, write_timeline
+from agent_history import KEEP_EXCHANGES, build_prompt, estimate_tokens
+from llm_cache import get_chat_model
+from moveset_library import MIN_MATCHES, MovesetLibrary
+from procedural_choreography import MOVEMENT_FILEPATH, generate_movements_file, write_movements
+from agent_checkpoint import CheckpointStore, run_key
+from tracing import cache_hits, get_tracer, record_llm_usage, traced_tool
 
 # -------------------------
 # Pydantic Models
 # -------------------------
-langchain.debug=True
+# Verbose chain logging costs time on every call, BUNNY_LANGCHAIN_DEBUG=1 turns it on
+langchain.debug = os.environ.get("BUNNY_LANGCHAIN_DEBUG") == "1"
 
 class MusicPhrase(BaseModel):
     start_time: float
@@ -52,59 +58,29 @@ class MovementSeries(BaseModel):
 # -------------------------
 
 @tool
-def analyze_music(filepath: str) -> str:
+@traced_tool
+def analyze_music(filepath: str, phrase_length: int = 16, tier: str = "standard") -> str:
     """
     Analyze the given music file and extract simplified features.
+    phrase_length is the number of beats grouped into one phrase.
+    tier selects the analysis fidelity: "fast", "standard" or "high".
     Returns a JSON string with timestamped descriptions.
     """
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    filepath = os.path.join(current_dir, "assets", "Dancing_D.wav")
+    if not filepath:
+        filepath = os.path.join(current_dir, "assets", "Dancing_D.wav")
     try:
-        y, sr = librosa.load(filepath, sr=None)
+        analysis = analyze_track_cached(filepath, phrase_length=phrase_length, tier=tier)
     except Exception as e:
         return json.dumps({"error": f"Failed to load music file: {e}"})
-    
-    # Tempo and Beat Tracking
-    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-    
-    if len(beats) == 0:
+
+    if len(analysis["beat_times"]) == 0:
         return json.dumps({"error": "No beats detected in the music file."})
-    
-    beat_times = librosa.frames_to_time(beats, sr=sr)
-    
-    # Energy Calculation
-    energy = librosa.feature.rms(y=y)[0]
-    
-    # Segment the music into phrases based on beat intervals
-    phrases = []
-    phrase_length = 16  # Number of beats per phrase
-    num_phrases = len(beats) // phrase_length
-    
-    for i in range(num_phrases):
-        start_beat = i * phrase_length
-        end_beat = start_beat + phrase_length
-        if end_beat >= len(beats):
-            break
-        
-        # Explicitly convert NumPy arrays to floats
-        start_time = float(beat_times[start_beat])
-        end_time = float(beat_times[end_beat])
-        phrase_tempo = float(tempo)
-        phrase_energy = float(np.mean(energy[start_beat:end_beat]))
-        phrase_beats = end_beat - start_beat  # Total beats in the phrase
-        
-        description = (
-            f"Phrase {i+1}: "
-            f"Starts at {start_time:.2f}s, "
-            f"lasts for {end_time - start_time:.2f}s, "
-            f"beats: {phrase_beats}, "
-            f"tempo: {phrase_tempo:.2f} BPM, "
-            f"average energy: {phrase_energy:.4f}."
-        )
-        
-        phrases.append(description)
-    
+
+    _run_context["analysis"] = analysis
+    _run_context["analysis_params"] = {"filepath": filepath, "phrase_length": phrase_length, "tier": tier}
+    phrases = describe_phrases(analysis)
 
     output_dir = os.path.join(current_dir, "output")
     output_file_path = os.path.join(output_dir, "music_analysis_debug.txt")
@@ -115,13 +91,100 @@ def analyze_music(filepath: str) -> str:
     # Return a formatted string with all phrases
     return "\n".join(phrases)
 
-@tool
-def generate_movesets(energy: float, tempo: float) -> str:
+_moveset_model = None
+
+# State shared by the tools during one agent run: the latest analysis and every moveset
+# generate_movesets produced, which plan_movements turns into the timeline
+_run_context = {}
+
+def reset_run_context():
+    _run_context.update({
+        "analysis": None,
+        "analysis_params": None,  # Arguments of the last analyze_music call, to reload it on resume
+        "movesets": [],
+        "payloads": {},  # Large tool payloads dropped from the prompt, by reference
+        "library_used": set(),  # Library movesets already reused in this run
+        "phrases_covered": 0,
+        "total_duration": 0.0,
+    })
+
+reset_run_context()
+
+def snapshot_context() -> dict:
     """
-    Create creative movesets for the bunny sprite using energy and tempo.
-    The LLM will generate different sets of actions.
+    JSON-serializable copy of the run context for a checkpoint. The analysis itself is
+    not stored, it is reloaded from the analysis cache on restore.
+    """
+    snapshot = {k: v for k, v in _run_context.items() if k != "analysis"}
+    snapshot["library_used"] = sorted(_run_context["library_used"])
+    return snapshot
+
+def restore_context(snapshot: dict):
+    """
+    Restore the run context from a checkpoint made by snapshot_context.
+    """
+    reset_run_context()
+    _run_context.update(snapshot)
+    _run_context["library_used"] = set(snapshot.get("library_used", []))
+    if _run_context["analysis_params"]:
+        _run_context["analysis"] = analyze_track_cached(**_run_context["analysis_params"])
+
+# Checkpoint store and run key of the current run, used to journal completed tool calls
+_checkpoint = {"store": None, "key": None}
+
+def _recorded_call(tool_call_id: str):
+    # (result, effects) of a tool call that already completed before a resume, or None
+    if _checkpoint["store"] is None or not tool_call_id:
+        return None
+    return _checkpoint["store"].recorded_call(_checkpoint["key"], tool_call_id)
+
+def _record_call(tool_call_id: str, name: str, result: str, effects: Optional[dict] = None):
+    if _checkpoint["store"] is not None and tool_call_id:
+        _checkpoint["store"].record_call(_checkpoint["key"], tool_call_id, name, result, effects or {})
+
+def describe_progress() -> str:
     """
-    prompt = f"""
+    Compact summary of the run so far, sent to the LLM in place of the full history.
+    """
+    lines = []
+    analysis = _run_context["analysis"]
+    if analysis is None:
+        lines.append("- The music has not been analyzed yet.")
+    else:
+        phrases = phrase_table(analysis)
+        energies = ", ".join(f"{p['energy']:.4f}" for p in phrases)
+        lines.append(f"- Music analyzed: {len(phrases)} phrases at {float(analysis['tempo']):.2f} BPM, "
+                     f"phrase energies: {energies}.")
+    movesets = _run_context["movesets"]
+    if movesets:
+        energies = ", ".join(f"{e:.4f}" for e in sorted({m["energy"] for m in movesets}))
+        lines.append(f"- {len(movesets)} movesets generated for energies: {energies}.")
+    if _run_context["phrases_covered"]:
+        lines.append(f"- movements.json written: {_run_context['phrases_covered']} phrases covered, "
+                     f"total duration {_run_context['total_duration']:.2f}s.")
+    return "\n".join(lines)
+
+_moveset_library = None
+
+def _library():
+    # The moveset library is loaded once per process and shared by every run
+    global _moveset_library
+    if _moveset_library is None:
+        _moveset_library = MovesetLibrary()
+    return _moveset_library
+
+def _moveset_chat():
+    # One shared client for every generate_movesets call instead of a new one per call
+    global _moveset_model
+    if _moveset_model is None:
+        _moveset_model = get_chat_model("gpt-4", 0.7)
+    return _moveset_model
+
+def build_moveset_prompt(energy: float, tempo: float) -> str:
+    """
+    Build the moveset generation prompt for the given energy and tempo.
+    """
+    return f"""
     Based on the energy ({energy}) and tempo ({tempo}), generate creative movements for the bunny sprite. These movements should correspond to body parts and actions, considering the tempo for the rhythm and energy for the intensity of movements. 
 
     The available actions are:
@@ -253,121 +316,120 @@ def generate_movesets(energy: float, tempo: float) -> str:
     
     """
 
-    chat = ChatOpenAI(model="gpt-4", temperature=0.7)
-    response = chat.invoke([HumanMessage(content=prompt)])
-    
-    # Directly return the response
-    return response.content
-
 @tool
-def add_movement_to_json(movement_str: str, repeat: int = 1):
-    """
-    Append a validated movement sequence to a predefined JSON file, repeating it as specified.
-    
-    Parameters:
-    - movement_str: A string representation of the movement in JSON format.
-    - repeat: Number of times to repeat the movement in the sequence.
-
-    Returns:
-    A message indicating success or an error message.
+@traced_tool
+def generate_movesets(energy: float, tempo: float, fresh: bool = False,
+                      tool_call_id: Annotated[str, InjectedToolCallId] = "") -> str:
     """
-
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(current_dir, "output")
-    os.makedirs(output_dir, exist_ok=True)  # Create the folder if it doesn't exist
-    MOVEMENT_FILEPATH = os.path.join(output_dir, "movements.json")
-
-    try:
-        # Append the raw movement string to the file as is
-        with open(MOVEMENT_FILEPATH, "a", encoding="utf-8") as file:
-            for i in range(repeat):
-                # Append the movement with a trailing comma for proper formatting
-                file.write(movement_str.rstrip() + ",\n")
-
-        return f"Successfully appended movement repeated {repeat} times to '{MOVEMENT_FILEPATH}'."
-    except Exception as e:
-        return f"Error appending movement to JSON: {e}"
-
-@tool
-def add_list_of_movements_to_json(movements_list_str: str, repeat: int = 1):
-    """
-    Append a list of movements to a predefined JSON file, repeating the list as a sequence.
-    
-    Parameters:
-    - movements_list_str: A string representation of a list of movements in JSON format.
-    - repeat: Number of times to repeat the entire list of movements.
-
-    Returns:
-    A message indicating success or an error message.
+    Create creative movesets for the bunny sprite using energy and tempo.
+    Movesets from earlier songs with a similar energy and tempo are reused from the
+    moveset library; otherwise the LLM generates different sets of actions.
+    Set fresh to true to always generate new movesets for more variety.
     """
-    import os
-
-    # Define file path
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(current_dir, "output")
-    os.makedirs(output_dir, exist_ok=True)  # Ensure the output directory exists
-    MOVEMENT_FILEPATH = os.path.join(output_dir, "movements.json")
+    # A call that completed before a resume adds its recorded movesets again without
+    # asking the LLM; the restored context never contains them twice
+    recorded = _recorded_call(tool_call_id)
+    if recorded is not None:
+        result, effects = recorded
+        _run_context["movesets"].extend(effects.get("movesets", []))
+        _run_context["library_used"].update(effects.get("library_used", []))
+        return result
+
+    library = _library()
+    if not fresh:
+        # Skip movesets this run already reused so repeated calls still add variety
+        hits = library.retrieve(energy, tempo, k=3, exclude=_run_context["library_used"], min_matches=MIN_MATCHES)
+        if hits:
+            added = [{"moveset": moveset, "energy": energy} for _, moveset in hits]
+            _run_context["library_used"].update(digest for digest, _ in hits)
+            _run_context["movesets"].extend(added)
+            names = ", ".join(f"'{m.get('name', 'Unnamed')}'" for _, m in hits)
+            result = f"Reused {len(hits)} movesets from the library for energy {energy} and tempo {tempo}: {names}."
+            _record_call(tool_call_id, "generate_movesets", result,
+                         {"movesets": added, "library_used": [digest for digest, _ in hits]})
+            return result
+
+    prompt = build_moveset_prompt(energy, tempo)
+    chat = _moveset_chat()
+    with get_tracer().span("llm", "generate_movesets") as span:
+        messages = [HumanMessage(content=prompt)]
+        hits_before = cache_hits(chat)
+        response = chat.invoke(messages)
+        record_llm_usage(span, messages, response, hits_before, cache_hits(chat))
 
     try:
-        # Open the file to append movements
-        with open(MOVEMENT_FILEPATH, "a", encoding="utf-8") as file:
-            for _ in range(repeat):
-                file.write(movements_list_str.rstrip() + ",\n")
-
-        return f"Successfully appended movement list repeated {repeat} times to '{MOVEMENT_FILEPATH}'."
-    except Exception as e:
-        return f"Error appending movements list to JSON: {e}"
-
-
+        movesets = parse_movesets(response.content)
+    except ValueError as e:
+        return f"Error: the generated movesets could not be used ({e}). Try again."
+
+    # Keep the movesets for plan_movements and only report a summary back to the agent
+    added = [{"moveset": moveset, "energy": energy} for moveset in movesets]
+    _run_context["movesets"].extend(added)
+    for moveset in movesets:
+        try:
+            library.add(moveset, energy, tempo)
+        except ValueError as e:
+            print(f"Not adding moveset to the library: {e}")
+    names = ", ".join(
+        f"'{m.get('name', 'Unnamed')}' ({sum(b['duration'] for b in m['sequences']):.2f}s)" for m in movesets
+    )
+    result = f"Generated {len(movesets)} movesets for energy {energy} and tempo {tempo}: {names}."
+    _record_call(tool_call_id, "generate_movesets", result, {"movesets": added})
+    return result
 
 @tool
-def initialize_json_file():
+@traced_tool
+def plan_movements(variety: int = 2, tool_call_id: Annotated[str, InjectedToolCallId] = "") -> str:
     """
-    Initializes the movements.json file by adding an opening square bracket '['.
-    This ensures the file is ready to accept JSON array elements.
+    Fill every phrase of the analyzed music with the movesets generated so far and write
+    the movements JSON file in one step. Movesets generated for a similar energy are
+    preferred, and repeat counts and block durations are fitted to each phrase.
+    variety is the number of different movesets used per phrase.
     """
-    # Define the filepath
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(current_dir, "output")
-    os.makedirs(output_dir, exist_ok=True)  # Create the folder if it doesn't exist
-    MOVEMENT_FILEPATH = os.path.join(output_dir, "movements.json")
-
+    # A call that completed before a resume writes the recorded file again, so the
+    # replayed run ends with the same movements.json as the interrupted one
+    recorded = _recorded_call(tool_call_id)
+    if recorded is not None:
+        result, effects = recorded
+        write_movements(effects["movements"], MOVEMENT_FILEPATH)
+        _run_context["phrases_covered"] = effects["phrases_covered"]
+        _run_context["total_duration"] = effects["total_duration"]
+        return result
+
+    if _run_context["analysis"] is None:
+        return "Error: analyze the music with 'analyze_music' first."
+    if not _run_context["movesets"]:
+        return "Error: generate movesets with 'generate_movesets' first."
+
+    phrases = phrase_table(_run_context["analysis"])
+    # The same track length generate_choreography fills up to
+    frame_times = _run_context["analysis"]["frame_times"]
+    duration = float(frame_times[-1]) if len(frame_times) else None
     try:
-        # Initialize the file with a single '['
-        with open(MOVEMENT_FILEPATH, "w", encoding="utf-8") as file:
-            file.write("[\n")
-        return f"Successfully initialized the movements JSON file: '{MOVEMENT_FILEPATH}'."
+        summary = write_timeline(phrases, _run_context["movesets"], variety=variety, duration=duration)
     except Exception as e:
-        return f"Error initializing the JSON file: {e}"
-
+        return f"Error planning movements: {e}"
+    _run_context["phrases_covered"] = len(phrases)
+    _run_context["total_duration"] = max(duration or 0.0, phrases[-1]["end_time"] if phrases else 0.0)
+    result = "Successfully wrote the movements JSON file.\n" + "\n".join(summary)
+    with open(MOVEMENT_FILEPATH, "r", encoding="utf-8") as f:
+        movements = json.load(f)
+    _record_call(tool_call_id, "plan_movements", result,
+                 {"movements": movements, "phrases_covered": _run_context["phrases_covered"],
+                  "total_duration": _run_context["total_duration"]})
+    return result
 
 @tool
-def finalize_movements_json():
+@traced_tool
+def recall_tool_result(ref: str) -> str:
     """
-    Finalize the movements JSON file by removing trailing commas and properly closing the JSON array.
+    Return the full content of an earlier tool result or tool argument that was replaced
+    by a reference in the conversation.
     """
-    # Define the filepath
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(current_dir, "output")
-    MOVEMENT_FILEPATH = os.path.join(output_dir, "movements.json")
-
-    try:
-        # Read the file
-        with open(MOVEMENT_FILEPATH, "r", encoding="utf-8") as file:
-            lines = file.readlines()
-
-        # Remove the trailing comma from the last movement and close the array
-        if lines and lines[-1].strip().endswith(","):
-            lines[-1] = lines[-1].rstrip(",\n") + "\n"
-        lines.append("]\n")  # Close the JSON array
-
-        # Write back the corrected content
-        with open(MOVEMENT_FILEPATH, "w", encoding="utf-8") as file:
-            file.writelines(lines)
-
-        return f"Successfully finalized the movements JSON file: '{MOVEMENT_FILEPATH}'."
-    except Exception as e:
-        return f"Error finalizing the JSON file: {e}"
+    payload = _run_context["payloads"].get(ref)
+    if payload is None:
+        return f"Error: no stored payload with reference '{ref}'."
+    return payload
 
 
 # -------------------------
@@ -379,30 +441,42 @@ class AgentState(TypedDict):
     total_duration: float  # Tracks the cumulative duration of movements generated
 
 class MusicAnimationAgent:
-    def __init__(self):
+    def __init__(self, chat=None, keep_exchanges=KEEP_EXCHANGES, recursion_limit=100, checkpoints=True):
+        """
+        chat: Optional chat model to drive the agent, defaults to get_chat_model
+              (see llm_cache.py for the cached and offline replay modes).
+        keep_exchanges: Number of recent tool exchanges sent verbatim with every call.
+        recursion_limit: Maximum number of graph steps in one run.
+        checkpoints: Checkpoint the run after every node so it can be resumed. True for
+                     the default store, a CheckpointStore, or False to disable.
+        """
+        self.keep_exchanges = keep_exchanges
+        self.recursion_limit = recursion_limit
+        if checkpoints is True:
+            checkpoints = CheckpointStore()
+        self.checkpoints = checkpoints or None
+        self.prompt_tokens = []  # Estimated prompt size of every LLM call
         self.llm_model = "gpt-4o-mini"
-        self.chat = ChatOpenAI(model=self.llm_model, temperature=0.7)
+        self.chat = chat or get_chat_model(self.llm_model, 0.7)
         self.system = self.AGENT_PROMPT
-        tools = [analyze_music, generate_movesets, add_movement_to_json,  finalize_movements_json, initialize_json_file]
-        tool_node = ToolNode(tools=tools)
+        tools = [analyze_music, generate_movesets, plan_movements, recall_tool_result]
+        self.tool_node = ToolNode(tools=tools)
         self.model = self.chat.bind_tools(tools)
         
         # Define the state graph
         graph = StateGraph(AgentState)
         graph.add_node("llm", self.call_openai)
-        graph.add_node("tools", tool_node)
+        graph.add_node("tools", self.call_tools)
         graph.add_conditional_edges(
             "llm",
             self.should_continue
         )
         graph.add_edge("tools", "llm")
-        graph.set_entry_point("llm")
+        # A resumed run whose last checkpoint ends with tool calls continues with the tools
+        graph.set_conditional_entry_point(self.route_entry, ["llm", "tools"])
         self.graph = graph.compile()
 
     AGENT_PROMPT = """
-    0: Initialization
-    Use the 'add_movement_to_json' tool to setup the output file
-
     1. **Analyze the Music:**
     Use the 'analyze_music' tool to analyze the music file and extract key characteristics such as:
     - **Beats:** The beats throughout the music file.
@@ -418,71 +492,61 @@ class MusicAnimationAgent:
     
     The movesets can include various actions like arm swings, leg lifts, jumps, kicks, and body movements.
 
-    - Use the `add_movement_to_json` tool to directly append single moveset or sequence of movesets to the output JSON file.
-    - only sequences will use [ and ] , do not use/add bracket otherwise
-    - For longer periods, use the `repeat` parameter of the `add_movement_to_json` tool to efficiently fill the required duration.
-        Example:
-        ```text
-        add_movement_to_json(movement_str=<MOVEMENT_JSON_STRING>, repeat=5)
-        ```
-    
-        example input str:
-        ```
-        {{
-            "name": "moveset 1: walk from right to left and back to center with the vibe",
-            "sequences": [
-            ...
-            ]
-        }},
-        {{
-            "name": "moveset 2: consecutive jumps with energy",
-            "sequences": [
-            ...
-            ]
-        }}
-        ```
+    - Call 'generate_movesets' once for each distinctly different energy level among the phrases (not once per phrase), so phrases with similar energy share movesets.
+    - The generated movesets are collected automatically, you do not need to copy them anywhere.
+    - Movesets from earlier songs are reused from the library when they fit. Only pass fresh=true when the song needs more variety than the reused movesets give.
+
+    3. **Plan the Timeline:**
+    When movesets exist for the energy levels of the song, call the 'plan_movements' tool ONCE.
+    It chooses the movesets and repeat counts for every phrase, fits them to the phrase length and writes the `movements.json` file.
+    - Do not try to count durations or repeats yourself.
+    - If its summary shows phrases filled with unsuitable movesets, generate movesets for those energies and call 'plan_movements' again.
 
     4. **Focus on JSON Generation**:
     - **Do not generate summaries, explanations, or additional output text.**
-    - The `add_movement_to_json` tool handle creating and managing the `movements.json` file. Ensure all movesets are added using these tools.
-    - There is no need to output or display the final JSON file — the process is complete when the required movements have been appended.
-
-    5. **Example Move JSON**:
-    {{
-        "name": "move 1",
-        "sequences": [
-        ...
-        ]
-    }}
-
-    6. **Phrases Filling**:
-    Divide the music into periods (e.g., phrases) based on the analysis.
-    - For each phrase, ensure the `movements.json` file has enough movesets to completely fill the time.
-    - A single 2-second jump movement could be repeated 5 times to fill a 10-second period, or a combination of jumps, arm swings, and body movements could be used.
-    - Use the `add_list_of_movements_to_json` tool when combining multiple movesets together.
-    - ENSURE that the number of movements is sufficient to completely fill each period (for a 10s period, probably have 10+ movements).
-    - DIFFERENT movesets SHOULD be used for each phrase to maintain variety and synchronization with the music's energy.
-
-
-    
+    - There is no need to output or display the final JSON file — the process is complete when 'plan_movements' has written it.
 
     You have access to the following tools:
     - **analyze_music:** Analyzes the music file and returns a breakdown of beats, tempo, energy, and phrases.
     - **generate_movesets:** Generates a variety of movement actions based on the music's tempo, energy, and vibe.
-    - **add_movement_to_json:** Add a single movement or movements into the output JSON file with option of repetition.
-    - **finalize_movements_json:** Finalize the JSON file at the end.
+    - **plan_movements:** Fills every phrase with the generated movesets and writes the output JSON file.
+    - **recall_tool_result:** Returns an earlier tool result that was shortened to a reference.
 
     Your goal is to combine the music analysis and generate creative, synchronized animation movements for the bunny sprite. 
-
-    You must add enough moveset into the json file that can be played to cover entire music audio length, for a one-minute audio, it probably has 50+ movements
     """
 
     def call_openai(self, state: AgentState):
-        messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
-        return {'messages': [message]}
+        # Only the task, a progress summary and the last few tool exchanges are sent,
+        # so the prompt stays the same size however long the run gets
+        messages = build_prompt(
+            self.system, state['messages'], describe_progress(), _run_context["payloads"],
+            keep_exchanges=self.keep_exchanges,
+        )
+        self.prompt_tokens.append(estimate_tokens(messages))
+        with get_tracer().span("node", "llm") as node, get_tracer().span("llm", self.llm_model) as span:
+            hits_before = cache_hits(self.model)
+            message = self.model.invoke(messages)
+            record_llm_usage(span, messages, message, hits_before, cache_hits(self.model))
+            node["history_messages"] = len(state['messages'])
+        self.save_checkpoint("llm", state['messages'] + [message])
+        return {'messages': [message], 'total_duration': _run_context["total_duration"]}
+
+    def call_tools(self, state: AgentState):
+        with get_tracer().span("node", "tools") as node:
+            node["tool_calls"] = len(state['messages'][-1].tool_calls)
+            result = self.tool_node.invoke(state)
+        self.save_checkpoint("tools", state['messages'] + result['messages'])
+        return result
+
+    def save_checkpoint(self, node: str, messages: List[AnyMessage]):
+        if self.checkpoints is not None and _checkpoint["key"] is not None:
+            self.checkpoints.save(_checkpoint["key"], node, messages, snapshot_context())
+
+    def route_entry(self, state: AgentState) -> Literal["llm", "tools"]:
+        last_message = state['messages'][-1]
+        if isinstance(last_message, AIMessage) and last_message.tool_calls:
+            return "tools"
+        return "llm"
 
     def should_continue(self, state: MessagesState) -> Literal["tools", END]:
         messages = state['messages']
@@ -491,18 +555,125 @@ class MusicAnimationAgent:
             return "tools"
         return END
 
-    def generate_animation_sequence(self, music_filepath: str) -> Optional[MovementSequence]:
+    def _dry_run(self, music_filepath: str, **attributes) -> list:
+        # Errors of the dry run of movements.json, recorded on a 'dry_run' span
+        from dry_run import check_movements_file
+
+        with get_tracer().span("tool", "dry_run", **attributes) as span:
+            try:
+                _, errors = check_movements_file(MOVEMENT_FILEPATH, music_filepath)
+            except Exception as e:
+                # A checker that cannot finish is no reason to keep the choreography
+                errors = [f"the dry run raised {type(e).__name__}: {e}"]
+                print(f"Dry run FAILED: {errors[0]}")
+            span["errors"] = len(errors)
+            if errors:
+                span["error"] = "; ".join(errors[:3])
+        return errors
+
+    def check_movements(self, music_filepath: str) -> str:
+        """
+        Simulate the movements.json the run wrote without rendering it (see dry_run.py).
+        A failing file and its report are kept as movements.rejected.json and
+        dry_run.rejected.json, and replaced by a procedural choreography of the same
+        music, which is checked in turn.
+
+        Returns "passed", "replaced" when the procedural choreography passes, or
+        "failed" when it fails too and movements.json still does not pass.
+        """
+        from dry_run import REPORT_PATH
+
+        tracer = get_tracer()
+        errors = self._dry_run(music_filepath)
+        if not errors:
+            return "passed"
+
+        rejected_path = os.path.join(os.path.dirname(MOVEMENT_FILEPATH), "movements.rejected.json")
+        if os.path.exists(MOVEMENT_FILEPATH):
+            os.replace(MOVEMENT_FILEPATH, rejected_path)
+        if os.path.exists(REPORT_PATH):
+            os.replace(REPORT_PATH, os.path.join(os.path.dirname(REPORT_PATH), "dry_run.rejected.json"))
+        print(f"The choreography fails the dry run, kept as '{rejected_path}'. Writing a procedural one instead.")
+        with tracer.span("tool", "generate_movements_file"):
+            generate_movements_file(music_filepath)
+        errors = self._dry_run(music_filepath, fallback=True)
+        if errors:
+            print(f"The procedural choreography fails the dry run as well ({len(errors)} errors): "
+                  + "; ".join(errors[:3]))
+            return "failed"
+        return "replaced"
+
+    def generate_animation_sequence(self, music_filepath: str, resume: bool = False,
+                                    gate: bool = True) -> Optional[MovementSequence]:
         """
         Orchestrate the tools to generate an animation sequence based on the music file.
+
+        With resume=True a run of the same music and model that stopped early (error,
+        crash, Ctrl-C) continues from its last checkpoint; tool calls that already
+        completed return their recorded results instead of running again. Otherwise
+        the run starts from scratch and replaces the old checkpoints.
+
+        With gate=True the written choreography has to pass a dry run (see
+        check_movements) or it is replaced by a procedural one.
         """
+        reset_run_context()
+
         # Initialize the agent's state with the music filepath as a human message
-        initial_message = HumanMessage(content=f"Create an animation sequence based on the music file")
+        initial_message = HumanMessage(content=f"Create an animation sequence based on the music file '{music_filepath}'")
         state = {"messages": [initial_message], "total_duration": 0.0}
 
+        _checkpoint.update({"store": self.checkpoints, "key": None})
+        if self.checkpoints is not None:
+            try:
+                _checkpoint["key"] = run_key(music_filepath, self.llm_model)
+            except OSError as e:
+                print(f"Not checkpointing this run: {e}")
+        saved = None
+        if _checkpoint["key"] is not None:
+            saved = self.checkpoints.latest(_checkpoint["key"]) if resume else None
+            if saved is None:
+                self.checkpoints.clear(_checkpoint["key"])
+        if saved is not None:
+            node, messages, context = saved
+            restore_context(context)
+            state = {"messages": messages, "total_duration": _run_context["total_duration"]}
+            print(f"Resuming from the checkpoint after '{node}' ({len(messages)} messages).")
+
+        # Run the state graph, falling back to the rule-based generator when the LLM path fails
+        tracer = get_tracer()
+        tracer.start_run()
+        with tracer.span("run", "generate_animation_sequence", music=music_filepath) as run:
+            try:
+                if saved is not None and self.route_entry(state) == "llm" and saved[0] == "llm":
+                    # The run had already finished, nothing left to do
+                    result = state
+                else:
+                    result = self.graph.invoke(state, {"recursion_limit": self.recursion_limit})
+            except Exception as e:
+                print(f"Agent run failed ({e}), writing a procedural choreography instead.")
+                if _checkpoint["key"] is not None:
+                    print("Run it again with resume to continue from the last checkpoint.")
+                run["error"] = f"{type(e).__name__}: {e}"
+                with tracer.span("tool", "generate_movements_file"):
+                    movements = generate_movements_file(music_filepath)
+                return f"Procedural choreography with {len(movements)} movements."
+            if gate:
+                try:
+                    run["dry_run"] = self.check_movements(music_filepath)
+                    if run["dry_run"] == "failed":
+                        run["error"] = "movements.json fails the dry run, even the procedural fallback"
+                except Exception as e:
+                    print(f"Dry run gate failed ({e}), writing a procedural choreography instead.")
+                    run["dry_run"] = "replaced"
+                    run["error"] = f"{type(e).__name__}: {e}"
+                    with tracer.span("tool", "generate_movements_file"):
+                        movements = generate_movements_file(music_filepath)
+                    return f"Procedural choreography with {len(movements)} movements."
         
-        # Run the state graph
-        result = self.graph.invoke(state)
-        
+        stats = _library().stats()
+        print(f"Moveset library: {stats['hits']}/{stats['lookups']} lookups hit ({stats['hit_rate']:.0%}), "
+              f"mean lookup {stats['mean_lookup_ms']:.2f}ms, {stats['entries']} movesets stored.")
+
         if not result or 'messages' not in result:
             print("Failed to generate animation sequence.")
             return None
@@ -528,14 +699,20 @@ class MusicAnimationAgent:
     
 if __name__ == "__main__":
     def main():
+        import argparse
+
         # Get the absolute path
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        music_filepath = os.path.join(current_dir, "assets", "Dancing_D.wav")
+        parser = argparse.ArgumentParser(description="Generate movements.json for a music file with the agent.")
+        parser.add_argument("music", nargs="?", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+        parser.add_argument("--resume", action="store_true", help="Continue the last unfinished run of this music.")
+        parser.add_argument("--no-gate", action="store_true", help="Keep the choreography even if it fails the dry run.")
+        args = parser.parse_args()
         
         # Instantiate the AI Agent
         agent = MusicAnimationAgent()
         
         # Generate the animation sequence
-        agent.generate_animation_sequence(music_filepath)
+        agent.generate_animation_sequence(args.music, resume=args.resume, gate=not args.no_gate)
     
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,178 @@
+# offline_render.py
+
+import json
+import os
+
+# Offline rendering never needs a window or an audio device
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+from config import BACKGROUND_COLOR, FPS, WINDOW_HEIGHT, WINDOW_WIDTH
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def init_headless():
+    """
+    Initialize pygame for off-screen rendering. The sprite converts its images, which
+    needs a display mode, so a 1x1 one is set when there is none.
+    """
+    if not pygame.get_init():
+        pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+
+
+def load_choreography(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def choreography_duration(movements):
+    return sum(block.get("duration", 1.0) for m in movements for block in m.get("sequences", []))
+
+
+def frame_count(movements, fps=FPS, max_seconds=None, tail_seconds=0.5):
+    """
+    Number of frames render_frames() yields for these settings.
+    """
+    duration = choreography_duration(movements) + tail_seconds
+    if max_seconds is not None:
+        duration = min(duration, max_seconds)
+    return int(round(duration * fps))
+
+
+def render_frames(movements, fps=FPS, size=(WINDOW_WIDTH, WINDOW_HEIGHT), max_seconds=None,
+                  debug=True, tail_seconds=0.5, profiler=None, bunny=None):
+    """
+    Render a choreography off-screen at a fixed timestep of 1/fps.
+
+    Every frame runs the same steps as the main.py loop (update by dt, fill, draw), so
+    the frames match a recording made without dropped frames.
+
+    Parameters:
+    - movements: The movements.json list.
+    - fps: Frames per second, the timestep is exactly 1/fps.
+    - size: (width, height) of the frames, the bunny stands where main.py places it.
+    - max_seconds: Stop after this many seconds, defaults to the whole choreography.
+    - debug: Draw the pivots and body rectangle like main.py does.
+    - tail_seconds: Extra time rendered after the last block so the final tweens finish.
+    - profiler: Optional frame_profiler.FrameProfiler, marks update and draw.
+    - bunny: BunnySprite to animate, a new one standing where main.py places it by default.
+
+    Yields (frame_index, surface). The surface is reused between frames, copy or convert
+    it before the next frame is requested.
+    """
+    from sprite import BunnySprite
+
+    init_headless()
+    width, height = size
+    if bunny is None:
+        bunny = BunnySprite(width // 2, height // 2 + 100)
+    surface = pygame.Surface(size)
+    frames = frame_count(movements, fps, max_seconds, tail_seconds)
+    dt = 1.0 / fps
+
+    bunny.animation_manager.load_sequences(list(movements))
+    for index in range(frames):
+        if profiler:
+            profiler.start_frame()
+        surface.fill(BACKGROUND_COLOR)
+        bunny.update(dt)
+        if profiler:
+            profiler.mark("update")
+        bunny.draw(surface, debug=debug)
+        if profiler:
+            profiler.mark("draw")
+        yield index, surface
+        if profiler:
+            profiler.end_frame()
+
+
+def surface_to_array(surface):
+    """
+    Copy a surface into a read-only (height, width, 3) RGB uint8 array.
+    """
+    width, height = surface.get_size()
+    return np.frombuffer(pygame.image.tostring(surface, "RGB"), dtype=np.uint8).reshape((height, width, 3))
+
+
+def render_video(movements, output_path, fps=FPS, size=(WINDOW_WIDTH, WINDOW_HEIGHT), max_seconds=None,
+                 debug=True, profiler=None, progress=None, bunny=None):
+    """
+    Render a choreography straight to an mp4v video file, as fast as the machine allows.
+
+    'progress' is called after every frame with (frames_written, total_frames); when it
+    returns False rendering stops there. 'bunny' is passed on to render_frames.
+
+    Returns the number of frames written.
+    """
+    import cv2
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    total = frame_count(movements, fps, max_seconds)
+    count = 0
+    try:
+        for index, surface in render_frames(movements, fps, size, max_seconds, debug, profiler=profiler,
+                                            bunny=bunny):
+            frame = cv2.cvtColor(surface_to_array(surface), cv2.COLOR_RGB2BGR)
+            if profiler:
+                profiler.mark("capture")
+            writer.write(frame)
+            if profiler:
+                profiler.mark("encode")
+            count += 1
+            if progress is not None and progress(count, total) is False:
+                break
+    finally:
+        writer.release()
+    return count
+
+
+def mux_audio(video_path, audio_path, output_path, duration):
+    """
+    Combine a rendered video with the first 'duration' seconds of a song, the way main.py
+    does it: VP8 and Vorbis for .webm, otherwise the video stream is copied with AAC
+    audio. The song is encoded once per container and stream-copied from then on (see
+    audio_cache.py).
+    """
+    from audio_cache import mux_cached_audio
+
+    vcodec = "libvpx" if output_path.endswith(".webm") else "copy"
+    mux_cached_audio(video_path, audio_path, output_path, duration, vcodec)
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import time
+
+        parser = argparse.ArgumentParser(description="Render a choreography to a video without a window.")
+        parser.add_argument("movements", nargs="?", default=os.path.join(current_dir, "output", "movements.json"))
+        parser.add_argument("--output", default=os.path.join(current_dir, "output", "offline.mp4"))
+        parser.add_argument("--fps", type=int, default=FPS)
+        parser.add_argument("--max-seconds", type=float)
+        parser.add_argument("--no-debug", action="store_true", help="Do not draw the pivots and body rectangle.")
+        parser.add_argument("--profile-out", help="Export the frame timings to this .csv or .json file.")
+        args = parser.parse_args()
+
+        os.chdir(current_dir)  # The sprite loads its images from relative paths
+        profiler = None
+        if args.profile_out:
+            from frame_profiler import FrameProfiler
+
+            profiler = FrameProfiler(budget=1.0 / args.fps, idle_stages=(), export_path=args.profile_out)
+        start = time.perf_counter()
+        frames = render_video(load_choreography(args.movements), args.output, args.fps,
+                              max_seconds=args.max_seconds, debug=not args.no_debug, profiler=profiler)
+        elapsed = time.perf_counter() - start
+        print(f"Rendered {frames} frames in {elapsed:.2f}s ({frames / elapsed:.1f} fps) to '{args.output}'.")
+        if profiler:
+            print(profiler.report())
+            profiler.export()
+
+    main()
@@ -0,0 +1,200 @@
+# parallel_generation.py
+
+import asyncio
+import json
+import os
+import random
+import time
+
+from langchain_core.messages import HumanMessage
+
+from coverage_planner import expand_plan, parse_movesets, plan_phrase
+from moveset_library import MIN_MATCHES
+from music_animation_agent_new import build_moveset_prompt
+from procedural_choreography import MOVEMENT_FILEPATH, fill_phrase, write_movements
+from tracing import get_tracer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+async def _phrase_stream(phrases):
+    # Pull phrases from a (possibly slow, blocking) iterator without blocking the event
+    # loop, e.g. music_analysis.stream_phrases
+    iterator = iter(phrases)
+    sentinel = object()
+    while True:
+        phrase = await asyncio.to_thread(next, iterator, sentinel)
+        if phrase is sentinel:
+            return
+        yield phrase
+
+
+async def generate_phrase_movesets(chat, phrases, concurrency=4, retries=2, timeout=60.0, backoff=1.0, library=None):
+    """
+    Request movesets for every phrase concurrently.
+
+    A request is started as soon as its phrase is available, at most 'concurrency' run at
+    the same time, and each is retried 'retries' times on timeouts, errors and
+    unparseable responses, with exponential backoff.
+
+    Parameters:
+    - chat: A chat model with ainvoke, see llm_cache.get_chat_model.
+    - phrases: Iterable of phrase dicts (music_analysis.phrase_table or stream_phrases).
+    - concurrency: Maximum number of requests in flight.
+    - retries: Extra attempts per phrase.
+    - timeout: Seconds before a single attempt is abandoned.
+    - backoff: Base delay in seconds between attempts.
+    - library: Optional moveset_library.MovesetLibrary. Phrases with at least MIN_MATCHES close
+      neighbours in the library reuse them without a request, and newly generated
+      movesets are added to it.
+
+    Returns a list of (phrase, movesets, stats) in phrase order; movesets is None when
+    every attempt failed, and stats holds ok, attempts, seconds, the last error and
+    whether the movesets came from the library.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def attempt_phrase(phrase):
+        prompt = build_moveset_prompt(phrase["energy"], phrase["tempo"])
+        stats = {"ok": False, "attempts": 0, "seconds": 0.0, "error": None, "library": False}
+        if library is not None:
+            hits = library.retrieve(phrase["energy"], phrase["tempo"], k=3, min_matches=MIN_MATCHES)
+            if hits:
+                stats.update(ok=True, library=True)
+                return phrase, [moveset for _, moveset in hits], stats
+        async with semaphore:
+            start = time.perf_counter()
+            for attempt in range(retries + 1):
+                stats["attempts"] += 1
+                try:
+                    response = await asyncio.wait_for(chat.ainvoke([HumanMessage(content=prompt)]), timeout)
+                    movesets = parse_movesets(response.content)
+                    if library is not None:
+                        for moveset in movesets:
+                            try:
+                                library.add(moveset, phrase["energy"], phrase["tempo"])
+                            except ValueError:
+                                pass
+                    stats["ok"] = True
+                    stats["seconds"] = time.perf_counter() - start
+                    return phrase, movesets, stats
+                except asyncio.TimeoutError:
+                    stats["error"] = f"timed out after {timeout}s"
+                except Exception as e:
+                    stats["error"] = f"{type(e).__name__}: {e}"
+                if attempt < retries:
+                    await asyncio.sleep(backoff * 2 ** attempt)
+            stats["seconds"] = time.perf_counter() - start
+            return phrase, None, stats
+
+    async def request(phrase):
+        # Span time includes waiting for the semaphore, request_seconds does not
+        with get_tracer().span("llm", "phrase_movesets", phrase=phrase["index"]) as span:
+            result = await attempt_phrase(phrase)
+            stats = result[2]
+            span.update(request_seconds=stats["seconds"], retries=max(stats["attempts"] - 1, 0),
+                        library_hit=stats["library"])
+            if not stats["ok"]:
+                span["error"] = stats["error"]
+            return result
+
+    tasks = []
+    async for phrase in _phrase_stream(phrases):
+        tasks.append(asyncio.create_task(request(phrase)))
+    results = await asyncio.gather(*tasks)
+    return sorted(results, key=lambda r: r[0]["index"])
+
+
+def generate_choreography_parallel(chat, phrases, output_filepath=MOVEMENT_FILEPATH, seed=0, duration=None, **options):
+    """
+    Generate movesets for all phrases concurrently and write them, in phrase order, to
+    movements.json. Each phrase is filled by the coverage planner, and phrases whose
+    requests all failed are filled by the procedural generator so the timeline has no gaps.
+    Given the track's 'duration', a rest covers the tail after the last phrase.
+
+    Extra keyword arguments are passed to generate_phrase_movesets.
+
+    Returns the list of per-phrase stats.
+    """
+    rng = random.Random(seed)
+    results = asyncio.run(generate_phrase_movesets(chat, phrases, **options))
+
+    plans = []
+    for phrase, movesets, stats in results:
+        if movesets is None:
+            print(f"Phrase {phrase['index'] + 1} failed ({stats['error']}), using procedural moves.")
+            beat_duration = (phrase["end_time"] - phrase["start_time"]) / phrase["beats"]
+            moves = fill_phrase(phrase["beats"], beat_duration, 0.5, rng, f"phrase {phrase['index'] + 1}")
+            plans.append([{"moveset": move, "scale": 1.0, "repeat": 1} for move in moves])
+        else:
+            plans.append(plan_phrase(phrase, movesets))
+
+    write_movements(expand_plan([phrase for phrase, _, _ in results], plans, duration), output_filepath)
+    return [stats for _, _, stats in results]
+
+
+def _offline_moveset_response(messages):
+    # Stand-in answer for moveset prompts: a couple of procedural moves at mid energy
+    from procedural_choreography import gentle_wave, jump
+
+    movesets = []
+    for move in (jump, gentle_wave):
+        movesets.append({
+            "name": move.__name__,
+            "sequences": [
+                {"description": description, "actions": actions, "duration": 0.35 * beats}
+                for description, actions, beats in move(0.5)
+            ],
+        })
+    return ",\n".join(json.dumps(m) for m in movesets)
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        import librosa
+
+        from llm_cache import ReplayChatModel, get_chat_model
+        from moveset_library import MovesetLibrary
+        from music_analysis import analyze_track_cached, phrase_table, stream_phrases
+
+        parser = argparse.ArgumentParser(description="Generate movesets for every phrase concurrently.")
+        parser.add_argument("music", nargs="?", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+        parser.add_argument("--output", default=MOVEMENT_FILEPATH)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--retries", type=int, default=2)
+        parser.add_argument("--timeout", type=float, default=60.0)
+        parser.add_argument("--stream", action="store_true", help="Start requests while the track is being analyzed.")
+        parser.add_argument("--offline", action="store_true", help="Use the local stand-in model instead of OpenAI.")
+        parser.add_argument("--latency", type=float, default=1.0, help="Injected latency of the stand-in model.")
+        parser.add_argument("--no-library", action="store_true", help="Always request new movesets.")
+        args = parser.parse_args()
+
+        if args.offline:
+            chat = ReplayChatModel("gpt-4", 0.7, latency=args.latency, fallback=_offline_moveset_response)
+        else:
+            chat = get_chat_model("gpt-4", 0.7)
+        library = None if args.no_library else MovesetLibrary()
+        phrases = stream_phrases(args.music) if args.stream else phrase_table(analyze_track_cached(args.music))
+
+        start = time.perf_counter()
+        tracer = get_tracer()
+        tracer.start_run()
+        with tracer.span("run", "generate_choreography_parallel", music=args.music):
+            stats = generate_choreography_parallel(
+                chat, phrases, args.output, duration=librosa.get_duration(path=args.music),
+                concurrency=args.concurrency, retries=args.retries, timeout=args.timeout, library=library,
+            )
+        elapsed = time.perf_counter() - start
+        serial = sum(s["seconds"] for s in stats)
+        failed = sum(1 for s in stats if not s["ok"])
+        print(f"Generated {len(stats)} phrases in {elapsed:.2f}s "
+              f"(sum of phrase latencies {serial:.2f}s, slowest {max((s['seconds'] for s in stats), default=0):.2f}s, "
+              f"{failed} failed), written to '{args.output}'.")
+        if library is not None:
+            lib = library.stats()
+            print(f"Moveset library: {lib['hits']}/{lib['lookups']} phrases reused ({lib['hit_rate']:.0%}), "
+                  f"mean lookup {lib['mean_lookup_ms']:.2f}ms, {lib['entries']} movesets stored.")
+
+    main()
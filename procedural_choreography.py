@@ -0,0 +1,334 @@
+# procedural_choreography.py
+
+import json
+import os
+import random
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MOVEMENT_FILEPATH = os.path.join(current_dir, "output", "movements.json")
+
+
+# -------------------------
+# Move Library
+# -------------------------
+# Each move takes an intensity in [0, 1] and returns a list of
+# (description, actions, duration in beats). Every move ends with the limbs back at 0
+# and zero net horizontal and vertical displacement, so moves can be tiled freely
+# without the bunny drifting off screen.
+
+def _act(action, **params):
+    return {"action": action, "params": params}
+
+
+def jump(k):
+    height = round(40 + 60 * k)
+    arm = round(20 + 25 * k)
+    return [
+        ("jump up", {
+            "body": _act("move_vertical", jump_height=height),
+            "left_arm": _act("raise_left_arm", angle=-arm),
+            "right_arm": _act("raise_right_arm", angle=arm),
+        }, 0.5),
+        ("jump down", {
+            "body": _act("move_vertical", jump_height=-height),
+            "left_arm": _act("lower_left_arm", angle=0),
+            "right_arm": _act("lower_right_arm", angle=0),
+        }, 0.5),
+    ]
+
+
+def hop_with_head_tilt(k):
+    height = round(30 + 40 * k)
+    tilt = round(5 + 5 * k)
+    return [
+        ("hop up and tilt head", {
+            "body": _act("move_vertical", jump_height=height),
+            "head": _act("rotate_head", angle=tilt),
+        }, 0.5),
+        ("land and tilt head back", {
+            "body": _act("move_vertical", jump_height=-height),
+            "head": _act("rotate_head", angle=-tilt),
+        }, 0.5),
+        ("hop up and tilt head", {
+            "body": _act("move_vertical", jump_height=height),
+            "head": _act("rotate_head", angle=tilt),
+        }, 0.5),
+        ("land and center head", {
+            "body": _act("move_vertical", jump_height=-height),
+            "head": _act("rotate_head", angle=0),
+        }, 0.5),
+    ]
+
+
+def walk(k):
+    step = round(30 + 40 * k)
+    leg = round(15 + 15 * k)
+    blocks = []
+    for direction, name in ((-1, "left"), (1, "right")):
+        blocks.append((f"step {name} with left leg", {
+            "left_leg": _act("raise_left_leg", angle=leg),
+            "right_leg": _act("lower_right_leg", angle=0),
+            "body": _act("move_horizontal", delta_x=direction * step),
+        }, 0.5))
+        blocks.append((f"step {name} with right leg", {
+            "left_leg": _act("lower_left_leg", angle=0),
+            "right_leg": _act("raise_right_leg", angle=-leg),
+            "body": _act("move_horizontal", delta_x=direction * step),
+        }, 0.5))
+    blocks[-1][1]["right_leg"] = _act("lower_right_leg", angle=0)
+    return blocks
+
+
+def side_step(k):
+    step = round(40 + 60 * k)
+    arm = round(20 + 25 * k)
+    return [
+        ("side step left with arms out", {
+            "body": _act("move_horizontal", delta_x=-step),
+            "left_arm": _act("raise_left_arm", angle=-arm),
+            "right_arm": _act("raise_right_arm", angle=arm),
+        }, 0.5),
+        ("step back to center", {
+            "body": _act("move_horizontal", delta_x=step),
+            "left_arm": _act("lower_left_arm", angle=0),
+            "right_arm": _act("lower_right_arm", angle=0),
+        }, 0.5),
+        ("side step right with arms out", {
+            "body": _act("move_horizontal", delta_x=step),
+            "left_arm": _act("raise_left_arm", angle=-arm),
+            "right_arm": _act("raise_right_arm", angle=arm),
+        }, 0.5),
+        ("step back to center", {
+            "body": _act("move_horizontal", delta_x=-step),
+            "left_arm": _act("lower_left_arm", angle=0),
+            "right_arm": _act("lower_right_arm", angle=0),
+        }, 0.5),
+    ]
+
+
+def gentle_wave(k):
+    arm = round(20 + 25 * k)
+    tilt = round(5 + 5 * k)
+    return [
+        ("raise left arm and tilt head", {
+            "left_arm": _act("raise_left_arm", angle=-arm),
+            "head": _act("rotate_head", angle=-tilt),
+        }, 0.5),
+        ("lower left arm", {
+            "left_arm": _act("lower_left_arm", angle=0),
+            "head": _act("rotate_head", angle=0),
+        }, 0.5),
+        ("raise right arm and tilt head", {
+            "right_arm": _act("raise_right_arm", angle=arm),
+            "head": _act("rotate_head", angle=tilt),
+        }, 0.5),
+        ("lower right arm", {
+            "right_arm": _act("lower_right_arm", angle=0),
+            "head": _act("rotate_head", angle=0),
+        }, 0.5),
+    ]
+
+
+def knee_lift(k):
+    leg = round(15 + 15 * k)
+    nod = round(5 + 5 * k)
+    return [
+        ("lift left knee and nod", {
+            "left_leg": _act("raise_left_leg", angle=leg),
+            "head": _act("rotate_head", angle=nod),
+        }, 0.5),
+        ("lower left knee", {
+            "left_leg": _act("lower_left_leg", angle=0),
+            "head": _act("rotate_head", angle=0),
+        }, 0.5),
+        ("lift right knee and nod", {
+            "right_leg": _act("raise_right_leg", angle=-leg),
+            "head": _act("rotate_head", angle=-nod),
+        }, 0.5),
+        ("lower right knee", {
+            "right_leg": _act("lower_right_leg", angle=0),
+            "head": _act("rotate_head", angle=0),
+        }, 0.5),
+    ]
+
+
+def head_bob(k):
+    nod = round(4 + 6 * k)
+    return [
+        ("bob head right", {"head": _act("rotate_head", angle=nod)}, 0.5),
+        ("bob head left", {"head": _act("rotate_head", angle=-nod)}, 0.5),
+        ("bob head right", {"head": _act("rotate_head", angle=nod)}, 0.5),
+        ("center head", {"head": _act("rotate_head", angle=0)}, 0.5),
+    ]
+
+
+# Moves available at each energy level, lowest to highest
+MOVE_POOLS = (
+    (head_bob, gentle_wave, knee_lift),
+    (gentle_wave, knee_lift, walk, side_step),
+    (jump, hop_with_head_tilt, side_step, walk),
+)
+
+
+# -------------------------
+# Generator
+# -------------------------
+
+def _normalized_energy(energy):
+    energy = np.asarray(energy, dtype=np.float64)
+    if len(energy) == 0:
+        return energy
+    low, high = energy.min(), energy.max()
+    if high - low < 1e-12:
+        return np.full(len(energy), 0.5)
+    return (energy - low) / (high - low)
+
+
+def fill_phrase(beats, beat_duration, intensity, rng, phrase_name):
+    """
+    Tile moves over 'beats' beats, padding the remainder with a rest block.
+
+    Parameters:
+    - beats: Number of beats to fill (may end on a half beat).
+    - beat_duration: Seconds per beat.
+    - intensity: Energy of the phrase in [0, 1], picks the move pool and move size.
+    - rng: random.Random used to pick moves.
+    - phrase_name: Prefix for the generated move names.
+    """
+    pool = MOVE_POOLS[min(int(intensity * len(MOVE_POOLS)), len(MOVE_POOLS) - 1)]
+    # Calm phrases play every move at half speed
+    tempo_scale = 2.0 if intensity < 1 / len(MOVE_POOLS) else 1.0
+
+    movements = []
+    remaining = float(beats)
+    while remaining > 1e-6:
+        move = rng.choice(pool)
+        blocks = move(intensity)
+        length = sum(b[2] for b in blocks) * tempo_scale
+        if length > remaining + 1e-6:
+            shorter = [m for m in pool if sum(b[2] for b in m(intensity)) * tempo_scale <= remaining + 1e-6]
+            if not shorter:
+                movements.append({
+                    "name": f"{phrase_name}: rest",
+                    "sequences": [{
+                        "description": "rest until the next beat",
+                        "actions": "rest",
+                        "duration": round(remaining * beat_duration, 4),
+                    }],
+                })
+                break
+            move = rng.choice(shorter)
+            blocks = move(intensity)
+            length = sum(b[2] for b in blocks) * tempo_scale
+
+        movements.append({
+            "name": f"{phrase_name}: {move.__name__.replace('_', ' ')}",
+            "sequences": [
+                {
+                    "description": description,
+                    "actions": actions,
+                    "duration": round(beats_ * tempo_scale * beat_duration, 4),
+                }
+                for description, actions, beats_ in blocks
+            ],
+        })
+        remaining -= length
+    return movements
+
+
+def generate_choreography(analysis, duration=None, seed=0):
+    """
+    Build a movements.json-style list of moves from an analysis result.
+
+    Each phrase is filled with moves chosen by its energy relative to the rest of the
+    track, and block durations are snapped to the phrase's beat period. A rest covers
+    the intro before the first beat, and the tail after the last complete phrase is
+    filled at the last phrase's energy. A track without phrases gets a single rest
+    block over its whole duration.
+
+    Parameters:
+    - analysis: A dict from music_analysis.analyze_track (or its cache).
+    - duration: Length of the track in seconds, defaults to the last analysis frame.
+    - seed: Seed for the move choice, the same seed gives the same choreography.
+    """
+    rng = random.Random(seed)
+    starts = np.asarray(analysis["phrase_start"], dtype=np.float64)
+    ends = np.asarray(analysis["phrase_end"], dtype=np.float64)
+    beats = np.asarray(analysis["phrase_beats"], dtype=np.int64)
+    if duration is None:
+        duration = float(analysis["frame_times"][-1]) if len(analysis["frame_times"]) else 0.0
+
+    if not len(starts):
+        # No beats were found (silence, a very short clip), so there is no tempo to
+        # dance to: the bunny rests for the whole track
+        if duration <= 0:
+            return []
+        return [{
+            "name": "rest",
+            "sequences": [{"description": "no beat to dance to", "actions": "rest",
+                           "duration": round(float(duration), 4)}],
+        }]
+
+    intensity = _normalized_energy(analysis["phrase_energy"])
+    movements = []
+    if starts[0] > 0:
+        movements.append({
+            "name": "intro: rest",
+            "sequences": [{"description": "wait for the first beat", "actions": "rest",
+                           "duration": round(float(starts[0]), 4)}],
+        })
+
+    for i, (start, end, count) in enumerate(zip(starts, ends, beats)):
+        beat_duration = (end - start) / count
+        movements.extend(fill_phrase(count, beat_duration, intensity[i], rng, f"phrase {i+1}"))
+
+    tail_beats = np.floor((duration - float(ends[-1])) / beat_duration * 2) / 2
+    if tail_beats > 0:
+        movements.extend(fill_phrase(tail_beats, beat_duration, intensity[-1], rng, "outro"))
+    return movements
+
+
+def write_movements(movements, filepath=MOVEMENT_FILEPATH):
+    """
+    Write moves in the one-move-per-line layout of the agent-generated movements.json.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(m) for m in movements))
+        f.write("\n]\n")
+
+
+def generate_movements_file(music_filepath, output_filepath=MOVEMENT_FILEPATH, seed=0, tier="standard"):
+    """
+    Analyze a music file (through the analysis cache) and write a procedural movements.json.
+    """
+    from music_analysis import analyze_track_cached
+
+    analysis = analyze_track_cached(music_filepath, tier=tier)
+    movements = generate_choreography(analysis, seed=seed)
+    write_movements(movements, output_filepath)
+    return movements
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import time
+
+        parser = argparse.ArgumentParser(description="Generate movements.json without the LLM.")
+        parser.add_argument("music", nargs="?", default=os.path.join(current_dir, "assets", "Dancing_D.wav"))
+        parser.add_argument("--output", default=MOVEMENT_FILEPATH)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--tier", default="standard")
+        args = parser.parse_args()
+
+        start = time.perf_counter()
+        movements = generate_movements_file(args.music, args.output, args.seed, args.tier)
+        total = sum(block["duration"] for m in movements for block in m["sequences"])
+        print(f"Wrote {len(movements)} movements ({total:.1f}s) to '{args.output}' "
+              f"in {time.perf_counter() - start:.3f}s.")
+
+    main()
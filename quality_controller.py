@@ -0,0 +1,123 @@
+# quality_controller.py
+
+from config import FPS
+
+# Degradation levels, each one keeps the savings of the levels before it
+LEVELS = ("full", "no_debug", "coarse_rotation", "half_scale", "skip_draws")
+LEVEL_SETTINGS = {
+    "full": {"debug": True, "rotation_step": None, "scale": 1.0, "draw_every": 1},
+    "no_debug": {"debug": False, "rotation_step": None, "scale": 1.0, "draw_every": 1},
+    "coarse_rotation": {"debug": False, "rotation_step": 2.0, "scale": 1.0, "draw_every": 1},
+    "half_scale": {"debug": False, "rotation_step": 2.0, "scale": 0.5, "draw_every": 1},
+    "skip_draws": {"debug": False, "rotation_step": 2.0, "scale": 0.5, "draw_every": 2},
+}
+MAX_RECOVER_FRAMES = 60 * FPS
+
+
+class QualityController:
+    def __init__(self, budget=1.0 / FPS, degrade_after=15, recover_after=2 * FPS, headroom=0.6, smoothing=0.1,
+                 max_level=len(LEVELS) - 1):
+        """
+        Adaptive render quality for the interactive loop.
+
+        update() is given the work time of every frame (everything but the wait in
+        clock.tick). Its moving average decides the level:
+
+        - over 'budget' for 'degrade_after' frames in a row: one level down in quality;
+        - under 'headroom' x budget for 'recover_after' frames in a row: one level up.
+
+        Animation time always follows the real dt, so lower levels drop detail or frames
+        but never slow the choreography down against the music. Recovering into a level
+        that overruns again right away doubles the wait before the next recovery from it,
+        so the controller settles instead of oscillating.
+
+        Parameters:
+        - budget: Seconds of work per frame (1/FPS).
+        - degrade_after, recover_after: Frames in a row before changing the level.
+        - headroom: Fraction of the budget the average must stay under to recover.
+        - smoothing: Weight of the newest frame in the moving average.
+        - max_level: Index of the lowest quality level allowed.
+        """
+        self.budget = budget
+        self.degrade_after = degrade_after
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.max_level = max_level
+        self.level = 0
+        self.average = 0.0
+        self.frames = 0
+        self.frames_at_level = [0] * len(LEVELS)
+        self.transitions = []  # (frame, from level name, to level name)
+        self._recover_after = [recover_after] * len(LEVELS)
+        self._over = 0
+        self._under = 0
+        self._last_recovery = None  # (frame, level it recovered from)
+
+    @property
+    def name(self):
+        return LEVELS[self.level]
+
+    def settings(self):
+        """
+        Draw settings of the current level: debug, rotation_step, scale and draw_every.
+        """
+        return LEVEL_SETTINGS[self.name]
+
+    def should_draw(self, frame_index):
+        return frame_index % self.settings()["draw_every"] == 0
+
+    def update(self, work_seconds):
+        """
+        Account one frame's work time. Returns True when the level changed.
+        """
+        self.frames += 1
+        self.frames_at_level[self.level] += 1
+        if self.frames == 1:
+            self.average = work_seconds
+        else:
+            self.average += self.smoothing * (work_seconds - self.average)
+
+        if self.average > self.budget:
+            self._over, self._under = self._over + 1, 0
+        elif self.average < self.headroom * self.budget:
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.degrade_after and self.level < self.max_level:
+            if self._last_recovery and self._last_recovery[1] == self.level + 1 and \
+                    self.frames - self._last_recovery[0] < self._recover_after[self.level + 1]:
+                self._recover_after[self.level + 1] = min(self._recover_after[self.level + 1] * 2,
+                                                          MAX_RECOVER_FRAMES)
+            self._change(self.level + 1)
+            return True
+        if self._under >= self._recover_after[self.level] and self.level > 0:
+            self._last_recovery = (self.frames, self.level)
+            self._change(self.level - 1)
+            return True
+        return False
+
+    def _change(self, level):
+        self.transitions.append((self.frames, LEVELS[self.level], LEVELS[level]))
+        self.level = level
+        self._over = self._under = 0
+
+    def metrics(self):
+        """
+        The current level and the history: frames spent at every level and the changes.
+        """
+        return {
+            "level": self.level,
+            "level_name": self.name,
+            "average_work_ms": self.average * 1000,
+            "budget_ms": self.budget * 1000,
+            "frames": self.frames,
+            "frames_at_level": dict(zip(LEVELS, self.frames_at_level)),
+            "transitions": len(self.transitions),
+        }
+
+    def report(self):
+        m = self.metrics()
+        spent = ", ".join(f"{name} {count}" for name, count in m["frames_at_level"].items() if count)
+        return (f"Quality: {m['level_name']} (level {m['level']}), {m['transitions']} changes, "
+                f"frames per level: {spent}")
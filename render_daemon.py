@@ -0,0 +1,580 @@
+# render_daemon.py
+
+import collections
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HOST = "127.0.0.1"  # Local only, the daemon has no authentication
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+RENDER_DIR = os.path.join(current_dir, "output", "renders")
+PROGRESS_EVERY = 30  # Frames between progress reports from a worker
+LATENCY_WINDOW = 200  # Finished jobs the latency percentiles are computed over
+JOB_RETENTION = 1000  # Finished jobs kept for GET /jobs, older ones are forgotten
+RESPAWN_BACKOFF = 1.0  # Seconds before replacing a worker that died during start-up, doubled per failure
+MAX_RESPAWNS = 5  # Start-up failures in a row before a worker is given up
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+# -------------------------
+# Worker process
+# -------------------------
+
+def _worker_main(index, tasks, events, cancel):
+    """
+    Render jobs from 'tasks' until a None arrives or the daemon dies. pygame, the
+    display, the sprite atlas and the sprite are set up once, every job then resets the
+    sprite and opens an encoder.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.chdir(current_dir)
+
+    from config import WINDOW_HEIGHT, WINDOW_WIDTH
+    from offline_render import frame_count, init_headless, mux_audio, render_video
+    from sprite import BunnySprite
+
+    init_headless()
+    bunny = BunnySprite(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 100)
+    events.put(("ready", index, os.getpid()))
+
+    parent = os.getppid()
+    while True:
+        try:
+            job = tasks.get(timeout=1.0)
+        except queue.Empty:
+            if os.getppid() != parent:
+                break  # The daemon was killed without stopping its workers
+            continue
+        if job is None:
+            break
+        cancel.clear()
+        job_id = job["id"]
+        total = frame_count(job["movements"], job["fps"], job["max_seconds"])
+        events.put(("started", job_id, {"worker": index, "frames_total": total}))
+
+        def progress(done, total):
+            if done % PROGRESS_EVERY == 0:
+                events.put(("progress", job_id, done))
+            return not cancel.is_set()
+
+        video_path = job["output"] if not job["audio"] else f"{job['output']}.video.mp4"
+        start = time.perf_counter()
+        try:
+            bunny.reset()
+            frames = render_video(job["movements"], video_path, job["fps"], max_seconds=job["max_seconds"],
+                                  debug=job["debug"], progress=progress, bunny=bunny)
+            render_seconds = time.perf_counter() - start
+            if cancel.is_set():
+                _remove(video_path)
+                events.put(("cancelled", job_id, {"frames_done": frames}))
+                continue
+            if job["audio"]:
+                mux_audio(video_path, job["audio"], job["output"], frames / job["fps"])
+                _remove(video_path)
+            events.put(("done", job_id, {
+                "frames_done": frames,
+                "render_seconds": render_seconds,
+                "seconds": time.perf_counter() - start,
+            }))
+        except Exception as e:
+            _remove(video_path)
+            events.put(("failed", job_id, {"error": f"{type(e).__name__}: {e}"}))
+
+
+def _spec_int(spec, key, default, minimum=None):
+    # JSON numbers arrive as int or float, 24.0 is accepted as 24 but null, true and "24" are not
+    value = spec.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) \
+            or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"'{key}' must be an integer, not {json.dumps(value)}.")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"'{key}' must be at least {minimum}.")
+    return int(value)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# -------------------------
+# Service
+# -------------------------
+
+class RenderService:
+    def __init__(self, workers=DEFAULT_WORKERS, render_dir=RENDER_DIR):
+        """
+        Priority queue of render jobs in front of a pool of warm worker processes.
+
+        A job is a choreography (the movements list), an optional song muxed into the
+        video, and output settings. Higher priorities run first, equal priorities in
+        submission order. Queued jobs are cancelled by dropping them, running ones by a
+        per-worker flag the worker checks after every frame. Workers report progress
+        every PROGRESS_EVERY frames; a worker that dies fails its job and is replaced.
+        A job's movements are dropped once a worker has them, and only the last
+        JOB_RETENTION finished jobs are kept, so a long-running daemon does not grow.
+        """
+        self.workers = workers
+        self.render_dir = render_dir
+        self.started_at = time.time()
+        self._ctx = multiprocessing.get_context("spawn")  # No pygame or threads inherited from the daemon
+        self._events = self._ctx.Queue()
+        self._pool = []  # One {process, tasks, cancel, job, ready} per worker
+        self._jobs = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._finished = []  # Latency records of the last LATENCY_WINDOW finished jobs
+        self._retired = collections.deque()  # Ids of finished jobs, oldest first
+        self._counts = {state: 0 for state in TERMINAL_STATES}
+        self._frames_rendered = 0
+
+    def start(self):
+        for index in range(self.workers):
+            self._pool.append(self._spawn(index))
+        self._running = True
+        self._thread = threading.Thread(target=self._event_loop, name="render-dispatch", daemon=True)
+        self._thread.start()
+
+    def _spawn(self, index):
+        tasks = self._ctx.Queue()
+        cancel = self._ctx.Event()
+        process = self._ctx.Process(target=_worker_main, args=(index, tasks, self._events, cancel), daemon=True)
+        process.start()
+        return {"process": process, "tasks": tasks, "cancel": cancel, "job": None, "ready": False,
+                "failures": 0, "respawn_at": None}
+
+    def stop(self, timeout=5.0):
+        self._running = False
+        for worker in self._pool:
+            if worker["job"] is not None:
+                worker["cancel"].set()
+            worker["tasks"].put(None)
+        for worker in self._pool:
+            worker["process"].join(timeout)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # -------------------------
+    # Jobs
+    # -------------------------
+
+    def submit(self, spec):
+        """
+        Queue a job and return its record.
+
+        spec keys:
+        - movements: The movements.json list, or movements_path: a file holding it.
+        - audio: Optional song muxed into the output, trimmed to the video's length.
+        - output: Output path, defaults to <render_dir>/<job id>.mp4.
+        - fps, max_seconds, debug: Render settings (see offline_render.render_video).
+        - priority: Higher runs first, 0 by default.
+
+        Raises ValueError for an invalid spec.
+        """
+        from config import FPS
+
+        movements = spec.get("movements")
+        if movements is None and spec.get("movements_path"):
+            try:
+                with open(spec["movements_path"], "r", encoding="utf-8") as f:
+                    movements = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Could not read movements_path: {e}")
+        if not isinstance(movements, list) or not all(isinstance(m, dict) for m in movements):
+            raise ValueError("'movements' must be a list of movement objects.")
+        audio = spec.get("audio")
+        if audio and not os.path.exists(audio):
+            raise ValueError(f"Audio file '{audio}' does not exist.")
+        priority = _spec_int(spec, "priority", 0)
+        fps = _spec_int(spec, "fps", FPS, minimum=1)
+        max_seconds = spec.get("max_seconds")
+        if max_seconds is not None and (isinstance(max_seconds, bool) or not isinstance(max_seconds, (int, float))
+                                        or not max_seconds > 0):
+            raise ValueError(f"'max_seconds' must be a positive number or null, not {json.dumps(max_seconds)}.")
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "state": "queued",
+            "priority": priority,
+            "movements": movements,
+            "audio": audio,
+            "output": os.path.abspath(spec.get("output") or os.path.join(self.render_dir, f"{job_id}.mp4")),
+            "fps": fps,
+            "max_seconds": max_seconds,
+            "debug": bool(spec.get("debug", True)),
+            "worker": None,
+            "frames_done": 0,
+            "frames_total": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        if audio:
+            # Encoded while the job waits and renders, so its mux only copies the track
+            from audio_cache import prepare_audio_in_background
+
+            prepare_audio_in_background(audio, job["output"])
+        with self._lock:
+            self._jobs[job_id] = job
+            heapq.heappush(self._heap, (-job["priority"], next(self._order), job_id))
+            self._dispatch()
+        return self.job(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job. Returns its record, or None for an unknown id.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] == "queued":
+                self._finish(job, "cancelled")  # Skipped when it comes off the heap
+            elif job["state"] == "running":
+                job["state"] = "cancelling"
+                self._pool[job["worker"]]["cancel"].set()
+        return self.job(job_id)
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else self._public(job)
+
+    def jobs(self):
+        with self._lock:
+            return [self._public(job) for job in self._jobs.values()]
+
+    @staticmethod
+    def _public(job):
+        record = {k: v for k, v in job.items() if k != "movements"}
+        if job["frames_total"]:
+            record["progress"] = job["frames_done"] / job["frames_total"]
+        return record
+
+    def metrics(self):
+        """
+        Queue depth, busy workers, job counts, throughput since the daemon started and
+        latency percentiles (queue wait, render, submit to finish) of recent jobs.
+        """
+        with self._lock:
+            uptime = time.time() - self.started_at
+            finished = list(self._finished)
+            metrics = {
+                "uptime_seconds": uptime,
+                "workers": len(self._pool),
+                "workers_ready": sum(w["ready"] for w in self._pool),
+                "workers_busy": sum(w["job"] is not None for w in self._pool),
+                "queued": sum(job["state"] == "queued" for job in self._jobs.values()),
+                "jobs": dict(self._counts),
+                "frames_rendered": self._frames_rendered,
+                "jobs_per_minute": self._counts["done"] * 60 / uptime if uptime else 0.0,
+                "frames_per_second": self._frames_rendered / uptime if uptime else 0.0,
+            }
+        for name in ("queue_seconds", "render_seconds", "latency_seconds"):
+            values = sorted(r[name] for r in finished if r.get(name) is not None)
+            if values:
+                metrics[name] = {
+                    "p50": values[len(values) // 2],
+                    "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+                    "max": values[-1],
+                }
+        return metrics
+
+    # -------------------------
+    # Dispatch
+    # -------------------------
+
+    def _dispatch(self):
+        # Called with the lock held: hand the highest-priority queued jobs to idle workers
+        for index, worker in enumerate(self._pool):
+            if not worker["ready"] or worker["job"] is not None:
+                continue
+            while self._heap:
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] != "queued":
+                    continue
+                job["state"] = "running"
+                job["worker"] = index
+                job["started_at"] = time.time()
+                worker["job"] = job_id
+                worker["tasks"].put({k: job[k] for k in ("id", "movements", "audio", "output", "fps",
+                                                          "max_seconds", "debug")})
+                job["movements"] = None  # The worker has its own copy
+                break
+
+    def _finish(self, job, state, error=None):
+        job["state"] = state
+        job["error"] = error
+        job["finished_at"] = time.time()
+        job["movements"] = None
+        self._counts[state] += 1
+        self._retired.append(job["id"])
+        while len(self._retired) > JOB_RETENTION:
+            self._jobs.pop(self._retired.popleft(), None)
+        if state == "done":
+            self._frames_rendered += job["frames_done"]
+            self._finished.append({
+                "queue_seconds": job["started_at"] - job["submitted_at"],
+                "render_seconds": job.get("render_seconds"),
+                "latency_seconds": job["finished_at"] - job["submitted_at"],
+            })
+            del self._finished[:-LATENCY_WINDOW]
+
+    def _event_loop(self):
+        while self._running:
+            try:
+                kind, key, payload = self._events.get(timeout=0.2)
+            except queue.Empty:
+                kind = None
+            with self._lock:
+                if kind is not None:
+                    self._handle(kind, key, payload)
+                self._check_workers()
+                self._dispatch()
+
+    def _handle(self, kind, key, payload):
+        if kind == "ready":
+            self._pool[key]["ready"] = True
+            return
+        job = self._jobs.get(key)
+        if job is None:
+            return
+        if kind == "started":
+            job["frames_total"] = payload["frames_total"]
+        elif kind == "progress":
+            job["frames_done"] = payload
+        else:
+            job["frames_done"] = payload.get("frames_done", job["frames_done"])
+            job["render_seconds"] = payload.get("render_seconds")
+            self._finish(job, kind, payload.get("error"))
+            worker = self._pool[job["worker"]]
+            if worker["job"] == key:
+                worker["job"] = None
+
+    def _check_workers(self):
+        # A worker that died (crash, out of memory) fails its job and is replaced. One that
+        # dies before it is ready (a broken install, no display) is retried with a growing
+        # delay and given up after MAX_RESPAWNS tries instead of being restarted forever.
+        for index, worker in enumerate(self._pool):
+            if not self._running or worker["process"].is_alive() or worker["failures"] >= MAX_RESPAWNS:
+                continue
+            if worker["respawn_at"] is None:
+                job = self._jobs.get(worker["job"]) if worker["job"] else None
+                if job is not None and job["state"] not in TERMINAL_STATES:
+                    self._finish(job, "failed", f"Worker exited with code {worker['process'].exitcode}.")
+                worker["job"] = None
+                worker["failures"] = 0 if worker["ready"] else worker["failures"] + 1
+                worker["ready"] = False
+                if worker["failures"] >= MAX_RESPAWNS:
+                    print(f"Render worker {index} failed to start {MAX_RESPAWNS} times in a row, giving up on it.")
+                    continue
+                delay = RESPAWN_BACKOFF * 2 ** (worker["failures"] - 1) if worker["failures"] else 0.0
+                worker["respawn_at"] = time.monotonic() + delay
+                print(f"Render worker {index} exited, starting a new one"
+                      + (f" in {delay:g}s." if delay else "."))
+            if time.monotonic() >= worker["respawn_at"]:
+                failures = worker["failures"]
+                self._pool[index] = self._spawn(index)
+                self._pool[index]["failures"] = failures
+
+
+# -------------------------
+# HTTP API
+# -------------------------
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the daemon:
+
+    - POST /jobs              submit a job (RenderService.submit spec), returns the job
+    - GET /jobs               every job
+    - GET /jobs/<id>          one job, with its progress
+    - DELETE /jobs/<id>       cancel a job
+    - GET /metrics            RenderService.metrics()
+    """
+    service = None  # Set by serve()
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            return self._reply(200, self.service.metrics())
+        if self.path == "/jobs":
+            return self._reply(200, self.service.jobs())
+        job_id = self._job_id()
+        job = self.service.job(job_id) if job_id else None
+        if job is None:
+            return self._reply(404, {"error": f"No job at '{self.path}'."})
+        self._reply(200, job)
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._reply(404, {"error": f"Cannot POST to '{self.path}'."})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(spec, dict):
+                raise ValueError("The job must be a JSON object.")
+            self._reply(201, self.service.submit(spec))
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+
+    def do_DELETE(self):
+        job_id = self._job_id()
+        job = self.service.cancel(job_id) if job_id else None
+        if job is None:
+            return self._reply(404, {"error": f"No job at '{self.path}'."})
+        self._reply(200, job)
+
+    def log_message(self, format, *args):
+        pass  # Polling clients would flood the console
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS):
+    service = RenderService(workers)
+    service.start()
+    RenderRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    # SIGTERM stops the daemon like Ctrl+C; shutdown() waits for serve_forever, so it
+    # cannot be called from the handler on the main thread itself
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Render daemon on http://{host}:{port} with {workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+# -------------------------
+# Client
+# -------------------------
+
+def request(method, path, body=None, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"):
+    """
+    Call the daemon's API and return (status, decoded JSON).
+    """
+    import urllib.error
+    import urllib.request
+
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def wait_for(job_id, url, interval=0.5):
+    """
+    Poll a job until it finishes, printing its progress. Returns the final record.
+    """
+    while True:
+        _, job = request("GET", f"/jobs/{job_id}", url=url)
+        if job.get("state") in TERMINAL_STATES:
+            return job
+        if job.get("frames_total"):
+            print(f"\r{job_id} {job['state']}: {job['frames_done']}/{job['frames_total']} frames", end="", flush=True)
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+        import sys
+
+        parser = argparse.ArgumentParser(description="Local render daemon and its client.")
+        parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", help="Daemon URL for the client.")
+        commands = parser.add_subparsers(dest="command", required=True)
+
+        server = commands.add_parser("serve", help="Run the daemon.")
+        server.add_argument("--host", default=DEFAULT_HOST)
+        server.add_argument("--port", type=int, default=DEFAULT_PORT)
+        server.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+        submit = commands.add_parser("submit", help="Submit a choreography file.")
+        submit.add_argument("movements")
+        submit.add_argument("--audio")
+        submit.add_argument("--output")
+        submit.add_argument("--fps", type=int)
+        submit.add_argument("--max-seconds", type=float)
+        submit.add_argument("--no-debug", action="store_true")
+        submit.add_argument("--priority", type=int, default=0)
+        submit.add_argument("--wait", action="store_true", help="Poll the job until it finishes.")
+
+        for name in ("status", "cancel"):
+            command = commands.add_parser(name, help=f"{name.capitalize()} a job.")
+            command.add_argument("job_id")
+        commands.add_parser("list", help="List every job.")
+        commands.add_parser("metrics", help="Show throughput and latency.")
+        args = parser.parse_args()
+
+        if args.command == "serve":
+            return serve(args.host, args.port, args.workers)
+
+        try:
+            if args.command == "submit":
+                spec = {"movements_path": os.path.abspath(args.movements), "priority": args.priority,
+                        "debug": not args.no_debug}
+                for key in ("audio", "output"):
+                    if getattr(args, key):
+                        spec[key] = os.path.abspath(getattr(args, key))
+                if args.fps:
+                    spec["fps"] = args.fps
+                if args.max_seconds:
+                    spec["max_seconds"] = args.max_seconds
+                status, body = request("POST", "/jobs", spec, url=args.url)
+                if status == 201 and args.wait:
+                    body = wait_for(body["id"], args.url)
+                    print()
+            elif args.command == "status":
+                status, body = request("GET", f"/jobs/{args.job_id}", url=args.url)
+            elif args.command == "cancel":
+                status, body = request("DELETE", f"/jobs/{args.job_id}", url=args.url)
+            elif args.command == "list":
+                status, body = request("GET", "/jobs", url=args.url)
+            else:
+                status, body = request("GET", "/metrics", url=args.url)
+        except OSError as e:
+            print(f"Could not reach the render daemon at {args.url}: {e}")
+            sys.exit(1)
+        print(json.dumps(body, indent=2))
+        if status >= 400 or (isinstance(body, dict) and body.get("state") == "failed"):
+            sys.exit(1)
+
+    main()
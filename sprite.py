@@ -2,8 +2,9 @@ import pygame
 import math
 from animation import BodyMovementAnimation, BodyPartAnimation
 from animation_manager import AnimationManager
+from asset_cache import get_registry
 from config import BODY, PARTS
-from helpers import blit_rotate
+from helpers import blit_rotate, scaled_image
 
 class BodyPart:
     def __init__(self, image, pivot, name):
@@ -35,21 +36,30 @@ class BodyPart:
                 parent_world_pos[1] + parent_pivot[1]
             )
 
-    def draw(self, surface, debug=False):
+    def draw(self, surface, debug=False, rotation_step=None, scale=1.0):
         """
         Draw the part rotated around its pivot.
         
         Uses blitRotate from helpers.py to ensure the pivot remains stationary after rotation.
+
+        rotation_step: Round the angle to this many degrees and reuse cached rotations.
+        scale: Draw onto a surface this much smaller than the window, with a scaled image.
         """
         if self.world_pivot is None:
             return
-        
+
+        image, pivot, world_pivot = self.image, self.pivot, self.world_pivot
+        if scale != 1.0:
+            image = scaled_image(image, scale)
+            pivot = (pivot[0] * scale, pivot[1] * scale)
+            world_pivot = (world_pivot[0] * scale, world_pivot[1] * scale)
+
         # Draw the rotated image around self.world_pivot as pivot, with self.pivot as originPos in the image
-        blit_rotate(surface, self.image, self.world_pivot, self.pivot, self.angle)
+        blit_rotate(surface, image, world_pivot, pivot, self.angle, rotation_step)
 
         if debug:
             # Draw the pivot point on the surface
-            pygame.draw.circle(surface, (0, 0, 255), (int(self.world_pivot[0]), int(self.world_pivot[1])), 3)
+            pygame.draw.circle(surface, (0, 0, 255), (int(world_pivot[0]), int(world_pivot[1])), 3)
 
 
 class BunnySprite:
@@ -58,21 +68,15 @@ class BunnySprite:
         self.body_movements = []        # List of BodyMovementAnimation
         self.body_part_animations = []  # List of BodyPartAnimation
         self.action_queue = []          # List of tuples (execute_time, action, params)
-        # Load images
-        self.images = {
-            "body": pygame.image.load("assets/body.png").convert_alpha(),
-            "head": pygame.image.load("assets/head.png").convert_alpha(),
-            "left_arm": pygame.image.load("assets/left_arm.png").convert_alpha(),
-            "right_arm": pygame.image.load("assets/right_arm.png").convert_alpha(),
-            "left_leg": pygame.image.load("assets/left_leg.png").convert_alpha(),
-            "right_leg": pygame.image.load("assets/right_leg.png").convert_alpha(),
-        }
+        # Part images are shared by every sprite in the process (see asset_cache.py)
+        self.images = get_registry().part_images()
 
         # Initial body position
         self.position = pygame.math.Vector2(
             center_x - BODY["center"][0],
             center_y - BODY["center"][1]
         )
+        self.home_position = pygame.math.Vector2(self.position)
 
         # Create body part hierarchy
         self.body = BodyPart(self.images["body"], BODY["center"], "body")
@@ -90,20 +94,45 @@ class BunnySprite:
         self.animation_manager = AnimationManager(self)
         self.update_part_positions()
 
+    def reset(self):
+        """
+        Return to the state right after __init__: home position, neutral parts, no
+        animations or queued sequences. Lets one sprite render many choreographies.
+        """
+        self.time = 0.0
+        self.body_movements = []
+        self.body_part_animations = []
+        self.action_queue = []
+        self.position = pygame.math.Vector2(self.home_position)
+        self.body.angle = 0.0
+        for part in self.parts.values():
+            part.angle = 0.0
+        self.animation_manager.stop()
+        self.update_part_positions()
+
     def update_part_positions(self):
         body_pos = self.position
         parent_pivots = BODY["pivots"]
         for part in self.parts.values():
             part.update_pivot_position(body_pos, parent_pivots)
 
-    def draw(self, surface, debug=False):
+    def draw(self, surface, debug=False, rotation_step=None, scale=1.0):
+        """
+        debug: Draw the pivots and the body rectangle.
+        rotation_step: Round part angles to this many degrees and reuse cached rotations.
+        scale: 'surface' is the window scaled by this factor, everything is drawn scaled.
+        """
         self.update_part_positions()
-        surface.blit(self.body.image, self.position)
+        body_image, position = self.body.image, self.position
+        if scale != 1.0:
+            body_image = scaled_image(body_image, scale)
+            position = (position.x * scale, position.y * scale)
+        surface.blit(body_image, position)
         if debug:
-            rect = self.body.image.get_rect(topleft=self.position)
+            rect = body_image.get_rect(topleft=position)
             pygame.draw.rect(surface, (0, 255, 0), rect, 2)
         for part in self.parts.values():
-            part.draw(surface, debug)
+            part.draw(surface, debug, rotation_step, scale)
 
     def rotate_part_to(self, part_name, angle):
         if part_name in self.parts:
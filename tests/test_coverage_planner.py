@@ -0,0 +1,113 @@
+import itertools
+
+import pytest
+
+from coverage_planner import expand_plan, moveset_duration, plan_phrase, solve_counts
+
+
+def moveset(name, *durations):
+    return {"name": name, "sequences": [{"description": name, "actions": "rest", "duration": d} for d in durations]}
+
+
+def phrase(start, end, beats=8):
+    return {"index": 0, "start_time": start, "end_time": end, "beats": beats, "energy": 0.5, "tempo": 120.0}
+
+
+def planned_seconds(plan):
+    return sum(moveset_duration(e["moveset"]) * e["scale"] * e["repeat"] for e in plan)
+
+
+# -------------------------
+# solve_counts
+# -------------------------
+
+@pytest.mark.parametrize("lengths, target", [
+    ([4, 2], 8),
+    ([3, 5], 16),
+    ([3], 8),
+    ([2, 3, 7], 23),
+    ([1], 1),
+])
+def test_solve_counts_reaches_the_best_total(lengths, target):
+    counts, total = solve_counts(lengths, target)
+    assert total == sum(c * l for c, l in zip(counts, lengths))
+    # Brute force: no combination gets closer to the target without exceeding it
+    best = max(
+        sum(c * l for c, l in zip(combo, lengths))
+        for combo in itertools.product(*(range(target // l + 1) for l in lengths))
+        if sum(c * l for c, l in zip(combo, lengths)) <= target
+    )
+    assert total == best
+
+
+def test_solve_counts_prefers_balanced_counts():
+    counts, total = solve_counts([2, 2], 8)
+    assert total == 8
+    assert counts == [2, 2]
+
+
+def test_solve_counts_leaves_a_remainder_it_cannot_fill():
+    assert solve_counts([3], 8) == ([2], 6)
+
+
+def test_solve_counts_when_every_length_exceeds_the_target():
+    assert solve_counts([10, 12], 8) == ([0, 0], 0)
+
+
+def test_solve_counts_of_an_empty_target():
+    assert solve_counts([2, 3], 0) == ([0, 0], 0)
+
+
+# -------------------------
+# plan_phrase
+# -------------------------
+
+def test_plan_phrase_fills_the_phrase_exactly():
+    candidates = [moveset("a", 0.5, 0.5), moveset("b", 0.5, 0.5, 0.5, 0.5)]
+    plan = plan_phrase(phrase(0.0, 4.0), candidates)
+    assert planned_seconds(plan) == pytest.approx(4.0)
+    assert all(e["repeat"] > 0 for e in plan)
+
+
+def test_plan_phrase_compresses_the_shortest_when_every_moveset_is_too_long():
+    candidates = [moveset("long", 6.0, 6.0), moveset("longer", 10.0, 10.0)]
+    plan = plan_phrase(phrase(1.0, 5.0), candidates)
+    assert [e["moveset"]["name"] for e in plan] == ["long"]
+    assert plan[0]["repeat"] == 1
+    assert plan[0]["scale"] < 1.0
+    assert planned_seconds(plan) == pytest.approx(4.0)
+
+
+def test_plan_phrase_stretches_the_remainder_evenly():
+    # A 5 beat moveset in an 8 beat phrase is played once and stretched by 8 / 5
+    plan = plan_phrase(phrase(0.0, 4.0), [moveset("five", 2.5)])
+    assert plan[0]["repeat"] == 1
+    assert plan[0]["scale"] == pytest.approx(8 / 5)
+    assert planned_seconds(plan) == pytest.approx(4.0)
+
+
+def test_plan_phrase_snaps_very_short_movesets_to_a_beat():
+    plan = plan_phrase(phrase(0.0, 4.0), [moveset("blip", 0.01)])
+    assert plan[0]["repeat"] == 8
+    assert plan[0]["scale"] == pytest.approx(50.0)
+    assert planned_seconds(plan) == pytest.approx(4.0)
+
+
+# -------------------------
+# expand_plan
+# -------------------------
+
+def test_expand_plan_covers_the_intro_and_the_tail():
+    phrases = [phrase(0.5, 4.5)]
+    plans = [plan_phrase(phrases[0], [moveset("a", 0.5, 0.5)])]
+    movements = expand_plan(phrases, plans, duration=6.0)
+    assert movements[0]["name"] == "intro: rest"
+    assert movements[-1]["name"] == "outro: rest"
+    total = sum(block["duration"] for m in movements for block in m["sequences"])
+    assert total == pytest.approx(6.0, abs=1e-3)
+
+
+def test_expand_plan_without_a_duration_ends_with_the_last_phrase():
+    phrases = [phrase(0.0, 4.0)]
+    plans = [plan_phrase(phrases[0], [moveset("a", 0.5, 0.5)])]
+    assert expand_plan(phrases, plans)[-1]["name"] == "a"
@@ -0,0 +1,260 @@
+# tracing.py
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRACE_PATH = os.path.join(current_dir, "output", "trace.jsonl")
+
+# BUNNY_TRACE is the JSONL file agent runs append their events to, "off" disables tracing
+TRACE_ENV = "BUNNY_TRACE"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, path=DEFAULT_TRACE_PATH):
+        """
+        Write timed spans of an agent run as JSON lines.
+
+        Every span is one line written when it ends, with run, id, parent, kind ("run",
+        "node", "tool" or "llm"), name, start, seconds and any attributes added while it
+        was open (tokens, payload sizes, retries, cache hits, errors). Parents are tracked
+        with a context variable, so spans opened in ToolNode worker threads still nest
+        under the tools node.
+        """
+        self.path = path
+        self.run_id = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def start_run(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        return self.run_id
+
+    @contextmanager
+    def span(self, kind, name, **attrs):
+        """
+        Time the enclosed block. Yields a dict; keys set on it are written with the span.
+        """
+        span_id = uuid.uuid4().hex[:12]
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        start = time.time()
+        perf_start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - perf_start
+            _current_span.reset(token)
+            event = {"run": self.run_id, "id": span_id, "parent": parent, "kind": kind, "name": name,
+                     "start": start, "seconds": seconds, **attrs}
+            line = json.dumps(event, default=str)
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class NullTracer:
+    """
+    Tracer used when tracing is off: spans cost one context manager and nothing is written.
+    """
+    run_id = None
+
+    def start_run(self):
+        return None
+
+    @contextmanager
+    def span(self, kind, name, **attrs):
+        yield attrs
+
+
+_tracer = None
+
+
+def get_tracer():
+    """
+    Return the process-wide tracer configured by BUNNY_TRACE.
+    """
+    global _tracer
+    if _tracer is None:
+        path = os.environ.get(TRACE_ENV, DEFAULT_TRACE_PATH)
+        _tracer = NullTracer() if path.lower() in ("", "off", "0") else Tracer(path)
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def traced_tool(func):
+    """
+    Record every call of a tool function as a "tool" span with its argument and result
+    sizes and whether it returned an error. Apply below @tool.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_tracer().span("tool", func.__name__) as span:
+            span["args_chars"] = len(json.dumps([args, kwargs], default=str))
+            result = func(*args, **kwargs)
+            text = result if isinstance(result, str) else json.dumps(result, default=str)
+            span["result_chars"] = len(text or "")
+            if isinstance(text, str) and ('"error"' in text[:40] or text.startswith("Error")):
+                span["error"] = text[:200]
+            return result
+    return wrapper
+
+
+def cache_hits(chat):
+    """
+    Number of response cache hits of a chat model so far, or None if it has no cache.
+    """
+    return getattr(getattr(chat, "cache", None), "hits", None)
+
+
+def record_llm_usage(span, prompt_messages, message, hits_before=None, hits_after=None):
+    """
+    Add token counts, payload sizes and the cache hit of one chat call to a span.
+
+    Token counts come from the response's usage metadata and are estimated from the
+    text length (marked tokens_estimated) when the model does not report them.
+    """
+    from agent_history import estimate_tokens
+
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        span["prompt_tokens"] = usage.get("input_tokens", 0)
+        span["completion_tokens"] = usage.get("output_tokens", 0)
+    else:
+        span["prompt_tokens"] = estimate_tokens(prompt_messages)
+        span["completion_tokens"] = estimate_tokens([message])
+        span["tokens_estimated"] = True
+    span["prompt_chars"] = sum(len(str(m.content)) for m in prompt_messages)
+    span["completion_chars"] = len(str(message.content))
+    span["tool_calls"] = len(getattr(message, "tool_calls", None) or [])
+    if hits_before is not None and hits_after is not None:
+        span["cache_hit"] = hits_after > hits_before
+
+
+# -------------------------
+# Summary
+# -------------------------
+
+def load_trace(path, run=None):
+    """
+    Read the events of one run from a trace file, the last run by default.
+    """
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                events.append(json.loads(line))
+    if run is None and events:
+        run = max(events, key=lambda e: e["start"])["run"]
+    return [e for e in events if e["run"] == run]
+
+
+def critical_path(events):
+    """
+    Chain of spans that determined the run's wall time, as (depth, event) pairs.
+
+    Starting from the root, the path repeatedly steps into the child that finished last
+    and then to the sibling that finished last before that child started, so spans that
+    ran in parallel with a longer one are left out.
+    """
+    children = {}
+    for event in events:
+        children.setdefault(event["parent"], []).append(event)
+
+    def walk(span, depth):
+        path = [(depth, span)]
+        kids = sorted(children.get(span["id"], []), key=lambda e: e["start"] + e["seconds"])
+        chain = []
+        limit = span["start"] + span["seconds"]
+        for kid in reversed(kids):
+            if kid["start"] + kid["seconds"] <= limit + 1e-6:
+                chain.append(kid)
+                limit = kid["start"]
+        for kid in reversed(chain):
+            path.extend(walk(kid, depth + 1))
+        return path
+
+    roots = children.get(None, [])
+    path = []
+    for root in sorted(roots, key=lambda e: e["start"]):
+        path.extend(walk(root, 0))
+    return path
+
+
+def summarize(events):
+    """
+    Per-(kind, name) breakdown of a run: count, total and mean seconds, tokens, payload
+    characters, errors, retries and cache hits.
+
+    A call counts as a retry when the previous call of the same tool returned an error.
+    """
+    rows = {}
+    last_failed = {}
+    for event in sorted(events, key=lambda e: e["start"]):
+        key = (event["kind"], event["name"])
+        row = rows.setdefault(key, {
+            "count": 0, "seconds": 0.0, "max": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "payload_chars": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+        })
+        row["count"] += 1
+        row["seconds"] += event["seconds"]
+        row["max"] = max(row["max"], event["seconds"])
+        row["prompt_tokens"] += event.get("prompt_tokens", 0)
+        row["completion_tokens"] += event.get("completion_tokens", 0)
+        row["payload_chars"] += event.get("args_chars", 0) + event.get("result_chars", 0)
+        row["retries"] += event.get("retries", 0) + (1 if last_failed.get(key) else 0)
+        row["cache_hits"] += 1 if event.get("cache_hit") else 0
+        row["errors"] += 1 if event.get("error") else 0
+        last_failed[key] = bool(event.get("error"))
+    return rows
+
+
+if __name__ == "__main__":
+    def main():
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Summarize an agent run trace.")
+        parser.add_argument("trace", nargs="?", default=DEFAULT_TRACE_PATH)
+        parser.add_argument("--run", help="Run id to summarize, the latest run by default.")
+        args = parser.parse_args()
+
+        events = load_trace(args.trace, args.run)
+        if not events:
+            print(f"No events in '{args.trace}'.")
+            return
+        roots = [e for e in events if e["parent"] is None]
+        wall = sum(e["seconds"] for e in roots)
+        print(f"Run {events[0]['run']}: {len(events)} spans, {wall:.2f}s wall time\n")
+
+        print(f"{'kind':<5} {'name':<32} {'count':>5} {'total s':>8} {'mean s':>7} {'max s':>7} {'share':>6} "
+              f"{'tokens in/out':>14} {'payload':>8} {'err':>4} {'retry':>5} {'cache':>5}")
+        rows = summarize(events)
+        for (kind, name), row in sorted(rows.items(), key=lambda item: -item[1]["seconds"]):
+            share = row["seconds"] / wall if wall else 0.0
+            tokens = f"{row['prompt_tokens']}/{row['completion_tokens']}"
+            print(f"{kind:<5} {name:<32} {row['count']:>5} {row['seconds']:>8.2f} "
+                  f"{row['seconds'] / row['count']:>7.3f} {row['max']:>7.3f} {share:>6.1%} "
+                  f"{tokens:>14} {row['payload_chars']:>8} {row['errors']:>4} {row['retries']:>5} "
+                  f"{row['cache_hits']:>5}")
+
+        print("\nCritical path:")
+        for depth, event in critical_path(events):
+            share = event["seconds"] / wall if wall else 0.0
+            label = "  " * depth + f"{event['kind']} {event['name']}"
+            print(f"  {label:<40} {event['seconds']:>8.3f}s {share:>6.1%}")
+
+    main()